@@ -0,0 +1,146 @@
+'''
+benchmark of the mat2c3d conversion path
+extraction and the C3D point array are timed against the former versions on a
+multi-speed subject laid out like P01.mat (left/right foot x self-selected/slow/fast
+walking leaves, each a 1x1 cell holding the frames matrix), written with
+scipy.io.savemat: scipy.io.loadmat + per-path traversal against LazyMatFile +
+extract_marker_data, and the per-frame point loop against c3d_points, with the peak
+traced memory of each version.
+
+usage:
+    python benchmark_mat2c3d.py --frames 10000 100000 --markers 40 --repeat 3
+'''
+
+import os
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import scipy.io
+
+from mat2c3d import extract_marker_data, c3d_points
+from mat_lazy import LazyMatFile
+
+FEET = ('LeftFoot_GaitCycle_Data', 'RightFoot_GaitCycle_Data')
+SPEEDS = ('Self_Selected_Speed', 'Slow_Speed', 'Fast_Speed')
+
+
+def extract_marker_data_loop(nested_struct, paths):
+    '''
+    reference per-row implementation (previous version of extract_marker_data)
+    '''
+    marker_data = []
+    for path in paths:
+        data = nested_struct
+        for field in path:
+            data = data[field][0, 0]
+        if isinstance(data, np.ndarray) and data.dtype.names:
+            data = np.array([list(d) for d in data])
+        marker_data.append(data)
+
+    return np.vstack(marker_data)
+
+
+def c3d_points_loop(markers):
+    '''
+    reference per-frame implementation (previous point filling of mat_to_c3d)
+    '''
+    num_frames, num_markers, _ = markers.shape
+    points = np.ones((4, num_markers, num_frames))
+    for frame in range(num_frames):
+        points[:3, :, frame] = markers[frame].T
+
+    return points
+
+
+def cell(value):
+    # 1x1 MATLAB cell holding value
+    wrapped = np.empty((1, 1), dtype=object)
+    wrapped[0, 0] = value
+    return wrapped
+
+
+def write_subject_file(mat_file_path, num_rows, num_markers, seed=0):
+    '''
+    P01-like subject written with scipy.io.savemat, each speed leaf a 1x1 cell holding a
+    (num_rows, 3 * num_markers) frames matrix, and the paths to its leaves under 'P01'.
+    '''
+    rng = np.random.default_rng(seed)
+
+    feet = {}
+    paths = []
+    for foot in FEET:
+        speeds = {speed: cell(rng.standard_normal((num_rows, 3 * num_markers))) for speed in SPEEDS}
+        paths.extend((foot, 'Level_Ground', 'Walking', speed) for speed in SPEEDS)
+        feet[foot] = {'Level_Ground': {'Walking': speeds}}
+    scipy.io.savemat(mat_file_path, {'P01': feet})
+
+    return paths
+
+
+def extract_loadmat(mat_file_path, paths):
+    '''
+    former mat_to_c3d extraction: full loadmat, then the per-path traversal
+    '''
+    main_struct = scipy.io.loadmat(mat_file_path)['P01'][0, 0]
+    return extract_marker_data_loop(main_struct, paths)
+
+
+def extract_lazy(mat_file_path, paths):
+    '''
+    current mat_to_c3d extraction: only the leaves are decoded
+    '''
+    with LazyMatFile(mat_file_path) as mat_file:
+        return extract_marker_data(mat_file, [('P01',) + path for path in paths])
+
+
+def measure(func, repeat):
+    '''
+    best wall time over repeat runs, then peak traced memory (MB) of one more run
+    '''
+    best_time = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best_time = min(best_time, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best_time, peak / 1024 ** 2, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the MAT to C3D conversion path')
+    parser.add_argument('--frames', type=int, nargs='+', default=[10000, 100000], help='rows per speed leaf')
+    parser.add_argument('--markers', type=int, default=40, help='markers per row')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per measurement, best is reported')
+    args = parser.parse_args()
+
+    print(f"{'rows':>8} {'stage':>8} {'loop (s)':>9} {'loop MB':>8} {'vector (s)':>10} {'vector MB':>9} {'speedup':>8} {'same':>5}")
+    for num_rows in args.frames:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            mat_file_path = os.path.join(tmp_dir, 'P01.mat')
+            paths = write_subject_file(mat_file_path, num_rows, args.markers)
+
+            loop_time, loop_mb, loop_data = measure(lambda: extract_loadmat(mat_file_path, paths), args.repeat)
+            vector_time, vector_mb, marker_data = measure(lambda: extract_lazy(mat_file_path, paths), args.repeat)
+            same = marker_data.dtype == loop_data.dtype and np.array_equal(loop_data, marker_data)
+        print(f"{num_rows:>8} {'extract':>8} {loop_time:>9.3f} {loop_mb:>8.1f} {vector_time:>10.3f} {vector_mb:>9.1f} "
+              f"{loop_time / vector_time:>7.1f}x {str(same):>5}")
+
+        # same reshape as mat_to_c3d
+        markers = marker_data.reshape((marker_data.shape[0] // 3, -1, 3))
+        loop_time, loop_mb, loop_points = measure(lambda: c3d_points_loop(markers), args.repeat)
+        vector_time, vector_mb, points = measure(lambda: c3d_points(markers), args.repeat)
+        same = np.array_equal(loop_points, points)
+        print(f"{num_rows:>8} {'points':>8} {loop_time:>9.3f} {loop_mb:>8.1f} {vector_time:>10.3f} {vector_mb:>9.1f} "
+              f"{loop_time / vector_time:>7.1f}x {str(same):>5}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,23 @@
 '''
 convert MAT file to C3D file format
 '''
-import scipy.io
+import os
+import sys
 import ezc3d
 import numpy as np
+from numpy.lib import recfunctions
+
+# lazy MAT reader lives in mat/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mat'))
+from mat_lazy import LazyMatFile
 
 def extract_marker_data(nested_struct, paths):
     """
     Extracts marker data from specified paths within a nested structure.
     
     Parameters:
-    - nested_struct: The main nested structure containing marker data.
+    - nested_struct: The main nested structure containing marker data, or a LazyMatFile
+      (paths then start with the variable name and only the leaves are decoded).
     - paths: List of tuples, where each tuple represents a path to marker data.
     
     Returns:
@@ -19,13 +26,23 @@ def extract_marker_data(nested_struct, paths):
     marker_data = []
     
     for path in paths:
-        data = nested_struct
-        for field in path:
-            data = data[field][0, 0]  # Traverse the path
+        if isinstance(nested_struct, LazyMatFile):
+            # Decode this leaf only: the field value, still in its 1x1 cell / struct as data[field]
+            data = nested_struct[tuple(path)][0, 0]
+        else:
+            data = nested_struct
+            for field in path:
+                data = data[field][0, 0]  # Traverse the path
         
         # Ensure the data is converted to a plain array, ignoring any field names
         if isinstance(data, np.ndarray) and data.dtype.names:
-            data = np.array([list(d) for d in data])  # Convert structured array to plain numeric array
+            field_dtypes = {data.dtype.fields[name][0] for name in data.dtype.names}
+            if len(field_dtypes) == 1 and field_dtypes.pop().kind in 'biuf':
+                # (rows, fields) view of the record buffer, no per-row copies
+                data = recfunctions.structured_to_unstructured(data, copy=False)
+            else:
+                # object fields (every struct of loadmat / LazyMatFile) cannot be viewed
+                data = np.array([list(d) for d in data])
         
         # Append to marker data
         marker_data.append(data)
@@ -34,11 +51,8 @@ def extract_marker_data(nested_struct, paths):
     return np.vstack(marker_data)
 
 def mat_to_c3d(mat_file_path, c3d_file_path, frame_rate=100):
-    # Load MAT file
-    mat_data = scipy.io.loadmat(mat_file_path)
-    
-    # Extract nested structure under 'P01'
-    main_struct = mat_data.get('P01')[0, 0]
+    # Index the MAT file, arrays are decoded on access
+    mat_file = LazyMatFile(mat_file_path)
     
     # Define paths to marker data for LeftFoot and RightFoot ambulation
     paths_to_marker_data = [
@@ -52,29 +66,47 @@ def mat_to_c3d(mat_file_path, c3d_file_path, frame_rate=100):
     ]
     
     # Extract marker data and reshape it to (num_frames, num_markers, 3)
-    marker_data = extract_marker_data(main_struct, paths_to_marker_data)
+    # (nested structure under 'P01')
+    marker_data = extract_marker_data(mat_file, [('P01',) + path for path in paths_to_marker_data])
     num_frames = marker_data.shape[0] // 3
     marker_data = marker_data.reshape((num_frames, -1, 3))
     num_markers = marker_data.shape[1]
     
-    # Initialize a new C3D object
-    c3d = ezc3d.c3d()
+    # Write all frames at once
+    write_c3d(c3d_file_path, marker_data, [f'Marker_{m + 1}' for m in range(num_markers)], frame_rate)
+    print(f"C3D file saved as {c3d_file_path}")
+
+def c3d_points(markers):
+    """
+    Converts (num_frames, num_markers, 3) marker positions to the ezc3d point array
+    (XYZ1, num_markers, num_frames), all frames in one transposed write.
+    """
+    num_frames, num_markers, _ = markers.shape
+    points = np.ones((4, num_markers, num_frames))
+    points[:3] = np.transpose(markers, (2, 1, 0))
     
-    # Set C3D parameters
-    c3d['parameters']['POINT']['RATE'].value = [frame_rate]
-    c3d['parameters']['POINT']['FRAMES'].value = [num_frames]
-    c3d['parameters']['POINT']['USED'].value = [num_markers]
+    return points
+
+def write_c3d(c3d_file_path, markers, marker_names, frame_rate):
+    """
+    Writes marker positions to a C3D file.
     
-    # Populate marker data frame by frame
-    for frame in range(num_frames):
-        frame_points = marker_data[frame]
-        c3d['data']['points'][:, frame, :num_markers] = frame_points.T
+    Parameters:
+    - c3d_file_path: Output C3D file.
+    - markers: (num_frames, num_markers, 3) marker positions, NaN for gaps.
+    - marker_names: Point labels, one per marker.
+    - frame_rate: Sampling rate of the markers.
+    """
+    c3d = ezc3d.c3d()
+    c3d['parameters']['POINT']['RATE']['value'] = [float(frame_rate)]
+    c3d['parameters']['POINT']['LABELS']['value'] = [str(name) for name in marker_names]
+    
+    c3d['data']['points'] = c3d_points(markers)
     
-    # Save the C3D file
     c3d.write(c3d_file_path)
-    print(f"C3D file saved as {c3d_file_path}")
 
-# Usage
-mat_file_path = '/home/dkuan/Documents/research/gaitfm/P01.mat'
-c3d_file_path = '/home/dkuan/Documents/research/gaitfm/dimitrov_P01.c3d'
-mat_to_c3d(mat_file_path, c3d_file_path)
+if __name__ == '__main__':
+    # Usage
+    mat_file_path = '/home/dkuan/Documents/research/gaitfm/P01.mat'
+    c3d_file_path = '/home/dkuan/Documents/research/gaitfm/dimitrov_P01.c3d'
+    mat_to_c3d(mat_file_path, c3d_file_path)
@@ -0,0 +1,244 @@
+'''
+convert every trial of a MAT dataset to C3D files, in parallel
+
+python port of mat2c3d.m: each top-level variable of a MAT file is a subject,
+walked down its condition/stiffness structs to the leaves holding a 'markers'
+struct (one (frames, 3) array or cell per marker) and a 'time' struct. each leaf
+is written to <subject>_<condition>_<stiffness>.c3d.
+
+work is split per (MAT file, subject variable), so a single large file still
+spreads over the worker processes and each worker decodes only its variable.
+a manifest in the output directory records the size/mtime of the sources: a
+subject whose source file is unchanged and whose outputs all exist is skipped.
+
+usage:
+    python mat2c3d_batch.py data/ --output c3d/ --workers 8
+    python mat2c3d_batch.py data/SUB01.mat --output c3d/ --force
+'''
+
+import os
+import sys
+import json
+import argparse
+import tempfile
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import scipy.io
+from tqdm import tqdm
+
+from mat2c3d import write_c3d
+from mat2marker_traj import marker_xyz
+
+# dataset listing and source signatures are shared with the MAT index in mat/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mat'))
+from mat_index import find_mat_files, source_signature
+
+MANIFEST_NAME = 'mat2c3d_manifest.json'
+
+
+def struct_fields(value):
+    # field names of a struct loaded with struct_as_record=False, None for anything else
+    if isinstance(value, scipy.io.matlab.mat_struct):
+        return list(value._fieldnames)
+    return None
+
+
+def find_marker_leaves(value, path=()):
+    '''
+    Walk a subject struct down to the structs holding a 'markers' field.
+
+    Parameters:
+    - value: Struct loaded with squeeze_me=True, struct_as_record=False.
+    - path: Field names leading to value.
+
+    Returns:
+    - leaves: List of (path, struct) tuples.
+    '''
+    fields = struct_fields(value)
+    if fields is None:
+        return []
+    if 'markers' in fields:
+        return [(path, value)]
+
+    leaves = []
+    for field in fields:
+        leaves.extend(find_marker_leaves(getattr(value, field), path + (field,)))
+
+    return leaves
+
+
+def leaf_markers(leaf, default_frame_rate=None):
+    '''
+    Marker array, names and frame rate of one leaf, as built by mat2c3d.m.
+
+    Parameters:
+    - leaf: Struct with a 'markers' struct and a 'time' struct holding a 'time' vector.
+    - default_frame_rate: Used when the leaf has no time vector; None to skip such leaves.
+
+    Returns:
+    - (markers, marker_names, frame_rate) with markers (num_frames, num_markers, 3), NaN for
+      markers of the wrong size; None if the leaf cannot be converted.
+    - skipped: Messages about markers or leaves that were skipped.
+    '''
+    skipped = []
+    marker_struct = leaf.markers
+    marker_names = struct_fields(marker_struct)
+    if not marker_names:
+        return None, ['no marker data found']
+
+    marker_values = [marker_xyz(getattr(marker_struct, name)) for name in marker_names]
+
+    num_frames = len(marker_values[0])
+    markers = np.full((num_frames, len(marker_names), 3), np.nan)
+    for m, values in enumerate(marker_values):
+        if values.shape == (num_frames, 3):
+            markers[:, m, :] = values
+        else:
+            skipped.append(f"marker {marker_names[m]}: incorrect dimensions {values.shape}")
+
+    time_struct = getattr(leaf, 'time', None)
+    if time_struct is not None and struct_fields(time_struct) and 'time' in struct_fields(time_struct):
+        time = np.ravel(time_struct.time).astype(float)
+        frame_rate = 1.0 / np.mean(np.diff(time))
+    elif default_frame_rate is not None:
+        frame_rate = default_frame_rate
+    else:
+        return None, skipped + ['no time data found']
+
+    return (markers, marker_names, frame_rate), skipped
+
+
+def convert_subject(mat_path, subject, output_dir, default_frame_rate=None):
+    '''
+    Convert every leaf of one subject variable (runs in a worker process).
+
+    Returns:
+    - result: Dict with source, subject, worker pid, written outputs, skipped leaves and error message.
+    '''
+    result = {'source': mat_path, 'subject': subject, 'pid': os.getpid(), 'outputs': [], 'skipped': [], 'error': None}
+    try:
+        # decode only this subject's variable
+        mat_data = scipy.io.loadmat(mat_path, variable_names=[subject], squeeze_me=True, struct_as_record=False)
+        for path, leaf in find_marker_leaves(mat_data[subject], (subject,)):
+            name = '_'.join(path)
+            converted, skipped = leaf_markers(leaf, default_frame_rate)
+            result['skipped'].extend(f"{name}: {message}" for message in skipped)
+            if converted is None:
+                continue
+
+            markers, marker_names, frame_rate = converted
+            c3d_path = os.path.join(output_dir, name + '.c3d')
+
+            # write next to the output and rename, so an interrupted run leaves no partial C3D
+            fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix='.c3d')
+            os.close(fd)
+            try:
+                write_c3d(tmp_path, markers, marker_names, frame_rate)
+                os.replace(tmp_path, c3d_path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            result['outputs'].append(os.path.basename(c3d_path))
+    except Exception:
+        result['error'] = traceback.format_exc()
+
+    return result
+
+
+def read_manifest(output_dir):
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+
+def write_manifest(output_dir, manifest):
+    # rewritten after every finished subject, atomically
+    manifest_path = os.path.join(output_dir, MANIFEST_NAME)
+    fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix='.tmp')
+    with os.fdopen(fd, 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(tmp_path, manifest_path)
+
+
+def is_up_to_date(entry, signature, output_dir):
+    # same source file and every output of the previous run still there
+    return (entry is not None
+            and entry['mtime_ns'] == signature['mtime_ns']
+            and entry['size'] == signature['size']
+            and all(os.path.exists(os.path.join(output_dir, name)) for name in entry['outputs']))
+
+
+def convert_dataset(root, output_dir, workers=None, force=False, default_frame_rate=None):
+    '''
+    Convert every subject/condition/stiffness leaf of the MAT files under root to C3D.
+
+    Parameters:
+    - root: MAT file or dataset directory.
+    - output_dir: Directory of the C3D files and the manifest.
+    - workers: Number of worker processes, None for all cores.
+    - force: Convert everything, even subjects whose source is unchanged.
+    - default_frame_rate: Frame rate of leaves without a time vector, None to skip them.
+
+    Returns:
+    - failed: List of 'file:subject' that raised an error.
+    '''
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = {} if force else read_manifest(output_dir)
+
+    tasks = []
+    num_skipped = 0
+    for mat_path in find_mat_files(root):
+        signature = source_signature(mat_path)
+        # whosmat reads the variable headers only
+        for subject, _, _ in scipy.io.whosmat(mat_path):
+            key = f"{mat_path}:{subject}"
+            if is_up_to_date(manifest.get(key), signature, output_dir):
+                num_skipped += 1
+            else:
+                tasks.append((mat_path, subject, signature))
+    print(f"{len(tasks)} subjects to convert, {num_skipped} unchanged.")
+
+    failed = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(convert_subject, mat_path, subject, output_dir, default_frame_rate): signature
+                   for mat_path, subject, signature in tasks}
+        with tqdm(total=len(futures), unit='subject') as progress:
+            for future in as_completed(futures):
+                result = future.result()
+                key = f"{result['source']}:{result['subject']}"
+                for message in result['skipped']:
+                    tqdm.write(f"skip {message}")
+                if result['error'] is None:
+                    manifest[key] = dict(futures[future], outputs=result['outputs'])
+                    write_manifest(output_dir, manifest)
+                    tqdm.write(f"[worker {result['pid']}] {key}: {len(result['outputs'])} C3D files")
+                else:
+                    failed.append(key)
+                    tqdm.write(f"[worker {result['pid']}] {key}: FAILED\n{result['error']}")
+                progress.update(1)
+
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert a MAT gait dataset to C3D files.')
+    parser.add_argument('root', help='MAT file or dataset directory')
+    parser.add_argument('--output', default='c3d', help='output directory')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='convert unchanged sources again')
+    parser.add_argument('--frame-rate', type=float, default=None, help='frame rate of trials without a time vector')
+    args = parser.parse_args()
+
+    failed = convert_dataset(args.root, args.output, workers=args.workers, force=args.force,
+                             default_frame_rate=args.frame_rate)
+    if len(failed) > 0:
+        print(f"{len(failed)} subjects failed: {failed}")
+    sys.exit(1 if len(failed) > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,206 @@
+'''
+MAT struct leaves straight to marker_traj dicts (one per leg) for gait event detection
+same trajectories as MAT -> C3D (mat2c3d.m / mat2c3d_batch.py) -> read back
+(run_study.load_c3d_marker_traj), without writing or parsing the C3D: the trial
+leaves are found from the lazy index and only the mapped markers and the time
+vector of a leaf are decoded.
+'''
+
+import os
+import sys
+
+import numpy as np
+
+# lazy MAT reader lives in mat/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mat'))
+from mat_lazy import LazyMatFile
+
+LEGS = ('r', 'l')
+
+# candidate marker names per leg and for the pelvis, the first one present in a leaf
+# and not taken by an earlier role is used, so sacrum1/sacrum2 always get two different
+# pelvis markers (with the same marker the sacrum vector is zero and the angle filter
+# drops every event). Unprefixed single-leg names (Heel, Toe, MT2) are the left leg.
+MAT_MARKER_MAP = {'pelvis': {'sacrum1': ['Sacrum1', 'LPSI', 'Sacrum'],
+                             'sacrum2': ['Sacrum2', 'RPSI', 'Sacrum']},
+                  'r': {'heel': ['RCAL', 'RHEE'],
+                        'toe': ['RTOE'],
+                        'mt2': ['RMT2']},
+                  'l': {'heel': ['Heel', 'LCAL', 'LHEE'],
+                        'toe': ['Toe', 'LTOE'],
+                        'mt2': ['MT2', 'LMT2']}}
+
+def marker_xyz(values):
+    '''
+    (frames, 3) float array of one marker field, a numeric array or a cell of per-frame rows (as cell2mat).
+    '''
+    if isinstance(values, np.ndarray) and values.dtype == object:
+        values = np.vstack([np.atleast_2d(v) for v in values.ravel()])
+    return np.atleast_2d(np.asarray(values, dtype=float))
+
+
+def find_trial_leaves(mat_file):
+    '''
+    Paths of the structs holding a 'markers' struct (subject/condition/stiffness leaves), from the index only.
+    '''
+    leaves = []
+    for path in mat_file.paths():
+        entry = mat_file.index[path]
+        if entry['class'] == 'struct' and 'markers' in entry.get('fields', []):
+            leaves.append(path)
+
+    return sorted(leaves, key=lambda path: [str(p) for p in path])
+
+
+def resolve_marker_map(marker_names, marker_map, taken=()):
+    '''
+    Marker name of each role present in a leaf.
+
+    Parameters:
+    - marker_names: Fields of the leaf's markers struct.
+    - marker_map: Role -> marker name or list of candidate names.
+    - taken: Markers already used by other roles.
+
+    Returns:
+    - resolved: Role -> marker name, roles without a present marker are left out. A marker is
+      used by one role only (the first one in marker_map order).
+    '''
+    taken = set(taken)
+    resolved = {}
+    for role, candidates in marker_map.items():
+        candidates = [candidates] if isinstance(candidates, str) else candidates
+        present = [name for name in candidates if name in marker_names and name not in taken]
+        if present:
+            resolved[role] = present[0]
+            taken.add(present[0])
+
+    return resolved
+
+
+def resolve_leg_markers(marker_names, marker_map=MAT_MARKER_MAP, legs=LEGS, source=''):
+    '''
+    Pelvis and per-leg markers of a trial, for gait event detection on both legs.
+
+    Parameters:
+    - marker_names: Markers of the trial.
+    - marker_map: {'pelvis': {sacrum1, sacrum2 -> candidates}, leg: {heel, toe, mt2 -> candidates}}.
+    - legs: Legs to resolve, a leg without a heel and a toe or MT2 marker is left out.
+    - source: Trial name for the error messages.
+
+    Returns:
+    - leg_markers: Leg -> {role: marker name} of the legs that can be detected.
+    - pelvis: {'sacrum1': name, 'sacrum2': name}, two distinct markers.
+    - has_toe_marker: True if every leg has a toe marker (heel/toe height method), otherwise
+      the mix method is used and only the legs with an MT2 marker are kept.
+    '''
+    pelvis = resolve_marker_map(marker_names, marker_map['pelvis'])
+    if len(pelvis) < 2:
+        raise ValueError(f"{source} needs two distinct pelvis markers for the sacrum heading, "
+                         f"found {list(pelvis.values())}.")
+
+    leg_markers = {}
+    taken = set(pelvis.values())
+    for leg in legs:
+        resolved = resolve_marker_map(marker_names, marker_map[leg], taken)
+        if 'heel' in resolved and ('toe' in resolved or 'mt2' in resolved):
+            leg_markers[leg] = resolved
+            taken.update(resolved.values())
+    if len(leg_markers) == 0:
+        raise ValueError(f"{source} lacks a heel marker with a toe or 2nd metatarsal marker on both legs, "
+                         "necessary for gait analysis.")
+
+    has_toe_marker = all('toe' in resolved for resolved in leg_markers.values())
+    if not has_toe_marker:
+        leg_markers = {leg: resolved for leg, resolved in leg_markers.items() if 'mt2' in resolved}
+
+    return leg_markers, pelvis, has_toe_marker
+
+
+def build_marker_traj_legs(get_marker, leg_markers, pelvis, has_toe_marker):
+    '''
+    marker_traj dict of each leg, the layout of gait_event_mocap.get_marker_traj.
+
+    Parameters:
+    - get_marker: Marker name -> (frames, 3) array.
+    - leg_markers, pelvis, has_toe_marker: See resolve_leg_markers.
+
+    Returns:
+    - marker_traj_legs: Leg -> marker_traj. The sacrum entries are the same arrays for every
+      leg, so a shared GaitFeatures store computes the sacrum heading once.
+    '''
+    sacrum1, sacrum2 = get_marker(pelvis['sacrum1']), get_marker(pelvis['sacrum2'])
+    sacrum_traj = {'sacrum_marker_z': (sacrum1[:, 2] + sacrum2[:, 2]) / 2,
+                   'sacrum_marker1_x': sacrum1[:, 0],
+                   'sacrum_marker1_z': sacrum1[:, 2],
+                   'sacrum_marker2_x': sacrum2[:, 0],
+                   'sacrum_marker2_z': sacrum2[:, 2]}
+
+    marker_traj_legs = {}
+    for leg, resolved in leg_markers.items():
+        marker_traj = dict(sacrum_traj, heel_marker_y=get_marker(resolved['heel'])[:, 1])
+        if has_toe_marker:
+            marker_traj['toe_marker_y'] = get_marker(resolved['toe'])[:, 1]
+        else:
+            marker_traj['toe_marker_z'] = get_marker(resolved['mt2'])[:, 2]
+        marker_traj_legs[leg] = marker_traj
+
+    return marker_traj_legs
+
+
+def leaf_frame_rate(mat_file, leaf_path, default_frame_rate=None):
+    '''
+    Frame rate of a leaf from its time.time vector, as mat2c3d.m.
+    '''
+    time_path = tuple(leaf_path) + ('time', 'time')
+    if 'time' in mat_file.keys(tuple(leaf_path)) and 'time' in mat_file.keys(tuple(leaf_path) + ('time',)):
+        time = np.ravel(mat_file[time_path]).astype(float)
+        return 1.0 / np.mean(np.diff(time))
+    if default_frame_rate is None:
+        raise ValueError(f"{'/'.join(map(str, leaf_path))} has no time data, pass a default frame rate.")
+
+    return default_frame_rate
+
+
+def load_mat_marker_traj(mat_file, leaf_path, marker_map=MAT_MARKER_MAP, default_frame_rate=None, legs=LEGS):
+    '''
+    marker_traj of both legs of one MAT trial leaf, as run_study.load_c3d_marker_traj returns for its C3D export.
+
+    Parameters:
+    - mat_file: LazyMatFile (or path of the MAT file).
+    - leaf_path: Path of the leaf, e.g. ('SUB01', 'Walking', 'Stiff'), see find_trial_leaves.
+    - marker_map: Pelvis and per-leg candidate marker names, see resolve_leg_markers.
+    - default_frame_rate: Used when the leaf has no time vector.
+    - legs: Legs to detect.
+
+    Returns:
+    - marker_traj_legs: Leg -> dict of np.array for ge_heel_toe_height (toe marker) or ge_mix (MT2 marker).
+    - frame_rate: Sampling rate.
+    - has_toe_marker: True if the heel/toe height method can be used.
+    '''
+    if not isinstance(mat_file, LazyMatFile):
+        mat_file = LazyMatFile(mat_file, squeeze_me=True, struct_as_record=False)
+    leaf_path = tuple(leaf_path)
+
+    markers_path = leaf_path + ('markers',)
+    leg_markers, pelvis, has_toe_marker = resolve_leg_markers(mat_file.keys(markers_path), marker_map, legs,
+                                                              source='/'.join(map(str, markers_path)))
+
+    # decode only the mapped markers
+    marker_traj_legs = build_marker_traj_legs(lambda name: marker_xyz(mat_file[markers_path + (name,)]),
+                                              leg_markers, pelvis, has_toe_marker)
+
+    return marker_traj_legs, leaf_frame_rate(mat_file, leaf_path, default_frame_rate), has_toe_marker
+
+
+def iter_mat_marker_traj(mat_file_path, marker_map=MAT_MARKER_MAP, default_frame_rate=None, legs=LEGS):
+    '''
+    marker_traj of both legs of every trial leaf of a MAT file.
+
+    Yields:
+    - (leaf_path, marker_traj_legs, frame_rate, has_toe_marker)
+    '''
+    with LazyMatFile(mat_file_path, squeeze_me=True, struct_as_record=False) as mat_file:
+        for leaf_path in find_trial_leaves(mat_file):
+            marker_traj_legs, frame_rate, has_toe_marker = load_mat_marker_traj(mat_file, leaf_path, marker_map,
+                                                                                default_frame_rate, legs)
+            yield leaf_path, marker_traj_legs, frame_rate, has_toe_marker
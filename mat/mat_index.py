@@ -0,0 +1,184 @@
+'''
+persisted MAT structure index
+every struct path of a MAT file is recorded once with its class, shape, dtype and
+byte offset in a small sidecar next to the file (<file>.mat.index.json), keyed by
+the file size and mtime. later runs and conversion jobs read the sidecars to plan
+work across a whole dataset without opening the MAT files, and can query paths
+with a glob such as '*/Walking/*'.
+
+offsets: for uncompressed variables file_offset is the absolute byte offset of the
+element in the MAT file; for compressed (v7) variables it is the offset of the
+compressed variable and offset the position of the element in its inflated stream.
+v7.3 (HDF5) datasets record the HDF5 dataset offset (None when chunked).
+
+usage:
+    python mat_index.py data/ --query '*/Walking/*'
+    python mat_index.py data/SUB01.mat
+'''
+
+import os
+import json
+import fnmatch
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+from mat_lazy import LazyMatFile
+
+INDEX_SUFFIX = '.index.json'
+INDEX_COLUMNS = ['file', 'path', 'class', 'shape', 'dtype', 'file_offset', 'offset', 'nbytes', 'compressed']
+
+
+def index_path(mat_file_path):
+    return mat_file_path + INDEX_SUFFIX
+
+
+def source_signature(mat_file_path):
+    # changes whenever the MAT file is rewritten, so a stale sidecar is never used
+    stat = os.stat(mat_file_path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+def build_mat_index(mat_file_path):
+    '''
+    Index every path of a MAT file and write the sidecar.
+
+    Returns:
+    - sidecar: Dict with the source signature, format, variables and one entry per path.
+    '''
+    with LazyMatFile(mat_file_path) as mat_file:
+        mat_file.paths()
+        entries = []
+        for path, entry in mat_file.index.items():
+            entry = dict(entry, path=list(path), shape=list(entry['shape']))
+            if mat_file.is_hdf5:
+                entry.update(file_offset=entry['offset'], offset=None, compressed=False)
+            else:
+                position, _, compressed = mat_file.variables[entry['variable']]
+                entry.update(file_offset=position if compressed else position + entry['offset'], compressed=compressed)
+            entries.append(entry)
+
+        sidecar = dict(source_signature(mat_file_path),
+                       source=os.path.basename(mat_file_path),
+                       format='hdf5' if mat_file.is_hdf5 else 'v5',
+                       variables=None if mat_file.is_hdf5 else {name: list(v) for name, v in mat_file.variables.items()},
+                       entries=entries)
+
+    tmp_path = index_path(mat_file_path) + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(sidecar, f)
+    os.replace(tmp_path, index_path(mat_file_path))
+
+    return sidecar
+
+
+def load_mat_index(mat_file_path, rebuild=True):
+    '''
+    Read the sidecar of a MAT file, (re)building it if it is missing or stale.
+
+    Parameters:
+    - mat_file_path: MAT file.
+    - rebuild: Build a missing/stale sidecar; if False, return None instead.
+
+    Returns:
+    - sidecar: See build_mat_index.
+    '''
+    try:
+        with open(index_path(mat_file_path), 'r') as f:
+            sidecar = json.load(f)
+        signature = source_signature(mat_file_path)
+        if sidecar['mtime_ns'] == signature['mtime_ns'] and sidecar['size'] == signature['size']:
+            return sidecar
+    except (OSError, ValueError, KeyError):
+        pass
+
+    return build_mat_index(mat_file_path) if rebuild else None
+
+
+def open_indexed(mat_file_path, **options):
+    '''
+    LazyMatFile whose struct tree comes from the sidecar, so no variable is walked again.
+    '''
+    mat_file = LazyMatFile(mat_file_path, **options)
+    entries = load_mat_index(mat_file_path)['entries']
+    mat_file.add_index({tuple(e['path']): dict(e, shape=tuple(e['shape'])) for e in entries})
+
+    return mat_file
+
+
+def find_mat_files(root):
+    '''
+    List the MAT files of a dataset: root itself if it is a file, otherwise every .mat below it.
+    '''
+    if os.path.isfile(root):
+        return [os.path.abspath(root)]
+
+    mat_paths = []
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            if file_name.lower().endswith('.mat'):
+                mat_paths.append(os.path.abspath(os.path.join(dir_path, file_name)))
+    mat_paths.sort()
+
+    return mat_paths
+
+
+class MatDatasetIndex:
+    '''
+    Index of every MAT file under a root, from their sidecars.
+
+    Parameters:
+    - root: MAT file or dataset directory.
+    - workers: Processes used to build missing/stale sidecars, None for all cores.
+    '''
+    def __init__(self, root, workers=None):
+        self.mat_paths = find_mat_files(root)
+
+        stale = [p for p in self.mat_paths if load_mat_index(p, rebuild=False) is None]
+        if len(stale) > 0:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                list(executor.map(build_mat_index, stale))
+
+        rows = []
+        for mat_path in self.mat_paths:
+            for e in load_mat_index(mat_path)['entries']:
+                rows.append([mat_path, '/'.join(str(p) for p in e['path']), e['class'], tuple(e['shape']),
+                             e['dtype'], e['file_offset'], e['offset'], e['nbytes'], e['compressed']])
+        self.table = pd.DataFrame(rows, columns=INDEX_COLUMNS)
+
+    def query(self, pattern='*', leaves_only=False):
+        '''
+        Paths matching a glob, e.g. '*/Walking/*' or 'SUB01/*/markers'.
+
+        Parameters:
+        - pattern: fnmatch pattern on the '/'-joined path ('*' also matches '/').
+        - leaves_only: Drop structs and cells.
+
+        Returns:
+        - matches: Rows of the index table (file, path, class, shape, dtype, offsets).
+        '''
+        selected = self.table['path'].map(lambda path: fnmatch.fnmatchcase(path, pattern))
+        if leaves_only:
+            selected &= ~self.table['class'].isin(['struct', 'cell'])
+
+        return self.table[selected]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index the struct tree of MAT files and query it.')
+    parser.add_argument('root', help='MAT file or dataset directory')
+    parser.add_argument('--query', default='*', help="glob on struct paths, e.g. '*/Walking/*'")
+    parser.add_argument('--leaves', action='store_true', help='list arrays only, no structs or cells')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes for indexing (default: all cores)')
+    args = parser.parse_args()
+
+    dataset = MatDatasetIndex(args.root, workers=args.workers)
+    matches = dataset.query(args.query, leaves_only=args.leaves)
+    for file, path, class_name, shape in zip(matches['file'], matches['path'], matches['class'], matches['shape']):
+        print(f"{os.path.basename(file)}:{path} ({class_name}) - Size: {list(shape)}")
+    print(f"{len(matches)} paths in {matches['file'].nunique()} of {len(dataset.mat_paths)} files.")
+
+
+if __name__ == '__main__':
+    main()
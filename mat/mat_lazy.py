@@ -0,0 +1,442 @@
+'''
+lazy, selective MAT-file access
+the variable/struct tree of a MAT file is indexed once (path -> class, shape, byte
+offset) without decoding any array, and only the leaves that are asked for are
+decoded, e.g. one condition of a multi-GB gait dataset.
+
+- v5/v7 files (scipy.io.savemat, MATLAB -v7): the element tags are walked directly;
+  compressed variables are inflated as a stream and the bytes of non-requested
+  elements are discarded, then the requested element alone is decoded by scipy.
+- v7.3 files (HDF5): needs h5py, which reads datasets on demand. structs decode to
+  dicts, cells to object arrays, as far as h5py exposes them.
+
+leaves of v5/v7 files are decoded with scipy's private v5 reader
+(scipy.io.matlab._mio5.MatFile5Reader, scipy >= 1.8), which has no stability
+guarantee: if its import or interface breaks, get() raises an ImportError naming
+the scipy version instead of failing inside scipy. indexing does not use it.
+'''
+
+import io
+import zlib
+import struct
+
+import numpy as np
+import scipy
+
+try:
+    from scipy.io.matlab import _mio5
+    _MIO5_ERROR = None
+    # reader calls used by LazyMatFile.get
+    for _name in ('initialize_read', 'read_file_header', 'read_var_header', 'read_var_array'):
+        getattr(_mio5.MatFile5Reader, _name)
+except (ImportError, AttributeError) as e:
+    _mio5 = None
+    _MIO5_ERROR = e
+
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+
+# v5 element types and array classes
+MI_COMPRESSED = 15
+MX_CLASSES = {1: 'cell', 2: 'struct', 3: 'object', 4: 'char', 5: 'sparse', 6: 'double', 7: 'single',
+              8: 'int8', 9: 'uint8', 10: 'int16', 11: 'uint16', 12: 'int32', 13: 'uint32',
+              14: 'int64', 15: 'uint64', 16: 'function_handle', 17: 'opaque'}
+MX_DTYPES = {'double': 'float64', 'single': 'float32', 'int8': 'int8', 'uint8': 'uint8', 'int16': 'int16',
+             'uint16': 'uint16', 'int32': 'int32', 'uint32': 'uint32', 'int64': 'int64', 'uint64': 'uint64',
+             'char': 'str', 'sparse': 'float64'}
+
+
+class _InflateStream:
+    '''
+    forward-only reader of a zlib-compressed variable, keeping only the bytes asked for.
+    with checkpoints (a list), the inflate state is saved every checkpoint_every decompressed
+    bytes, so a later stream can resume near any offset instead of inflating from the start.
+    '''
+    def __init__(self, f, start, length, chunk_size=1 << 20, checkpoints=None, checkpoint_every=16 << 20):
+        self.f = f
+        self.remaining = length
+        self.inflate = zlib.decompressobj()
+        self.tail = b''
+        self.buffer = b''
+        self.position = 0
+        self.produced = 0
+        self.chunk_size = chunk_size
+        self.checkpoints = checkpoints
+        self.checkpoint_every = checkpoint_every
+        f.seek(start)
+
+    def resume(self, checkpoints, offset):
+        # jump to the last checkpoint at or before offset
+        usable = [c for c in checkpoints if c[0] <= offset]
+        if not usable:
+            return
+        produced, file_position, remaining, inflate = usable[-1]
+        self.f.seek(file_position)
+        self.remaining = remaining
+        self.inflate = inflate.copy()
+        self.tail = b''
+        self.buffer = b''
+        self.position = self.produced = produced
+
+    def _inflate(self):
+        # next decompressed chunk, b'' at the end of the variable
+        data = self.tail
+        if not data:
+            if self.remaining <= 0:
+                return b''
+            data = self.f.read(min(self.chunk_size, self.remaining))
+            self.remaining -= len(data)
+        if self.checkpoints is not None and self.produced >= len(self.checkpoints)*self.checkpoint_every:
+            # state before inflating data, which starts len(data) bytes before the file position
+            self.checkpoints.append((self.produced, self.f.tell() - len(data), self.remaining + len(data), self.inflate.copy()))
+        chunk = self.inflate.decompress(data, self.chunk_size)
+        self.tail = self.inflate.unconsumed_tail
+        self.produced += len(chunk)
+        return chunk
+
+    def read(self, n):
+        parts = [self.buffer[:n]]
+        size = len(parts[0])
+        self.buffer = self.buffer[n:]
+        while size < n:
+            chunk = self._inflate()
+            if not chunk:
+                break
+            parts.append(chunk[:n - size])
+            self.buffer = chunk[n - size:]
+            size += len(parts[-1])
+        self.position += size
+        return b''.join(parts)
+
+    def skip(self, n):
+        # inflate and drop, never holding more than one chunk
+        dropped = min(n, len(self.buffer))
+        self.buffer = self.buffer[dropped:]
+        self.position += dropped
+        n -= dropped
+        while n > 0:
+            chunk = self._inflate()
+            if not chunk:
+                break
+            dropped = min(n, len(chunk))
+            self.buffer = chunk[dropped:]
+            self.position += dropped
+            n -= dropped
+
+    def tell(self):
+        return self.position
+
+
+class _RawStream:
+    '''
+    same interface over an uncompressed variable: skips are seeks
+    '''
+    def __init__(self, f, start):
+        self.f = f
+        self.start = start
+        f.seek(start)
+
+    def read(self, n):
+        return self.f.read(n)
+
+    def skip(self, n):
+        self.f.seek(n, 1)
+
+    def tell(self):
+        return self.f.tell() - self.start
+
+
+class LazyMatFile:
+    '''
+    Lazily indexed MAT file.
+
+    Paths are tuples of struct field names, starting with the variable name; elements
+    of struct arrays and cells are addressed with an integer, e.g.
+    ('P01', 'LeftFoot_GaitCycle_Data', 'Level_Ground', 'Walking', 'Fast_Speed').
+
+    Parameters:
+    - mat_file_path: v5/v7 or v7.3 MAT file.
+    - squeeze_me, struct_as_record, chars_as_strings: decoding options of scipy.io.loadmat.
+      With the defaults, a decoded path equals parent[0, 0][field] of a full loadmat, the field
+      value before the final [0, 0] (a 1x1 cell or struct stays wrapped).
+    '''
+    def __init__(self, mat_file_path, squeeze_me=False, struct_as_record=True, chars_as_strings=True):
+        self.mat_file_path = mat_file_path
+        self.options = {'squeeze_me': squeeze_me, 'struct_as_record': struct_as_record,
+                        'chars_as_strings': chars_as_strings}
+        self.index = {}
+        self.indexed = set()
+        self.checkpoints = {}
+
+        with open(mat_file_path, 'rb') as f:
+            self.header = f.read(128)
+            f.seek(512)
+            self.is_hdf5 = f.read(8) == HDF5_SIGNATURE
+
+        if self.is_hdf5:
+            try:
+                import h5py
+            except ImportError:
+                raise ImportError(f"{mat_file_path} is a v7.3 (HDF5) MAT file, install h5py to read it.")
+            self.h5 = h5py.File(mat_file_path, 'r')
+            self.variables = {name: None for name in self.h5.keys() if not name.startswith('#')}
+        else:
+            if self.header[126:128] not in (b'IM', b'MI'):
+                raise ValueError(f"{mat_file_path} is not a v5/v7 or v7.3 MAT file.")
+            self.endian = '<' if self.header[126:128] == b'IM' else '>'
+            self.variables = self._list_variables()
+
+    # --- v5 element walking --- #
+    def _read_tag(self, stream):
+        '''
+        Element tag: (type, data size, inline data of a small element or None).
+        '''
+        raw = stream.read(8)
+        data_type, num_bytes = struct.unpack(self.endian + 'II', raw)
+        if data_type >> 16:
+            # small data element: size in the upper 16 bits, data in the last 4 tag bytes
+            num_bytes = data_type >> 16
+            data_type &= 0xffff
+            return data_type, num_bytes, raw[4:4 + num_bytes]
+        return data_type, num_bytes, None
+
+    def _read_element(self, stream):
+        data_type, num_bytes, data = self._read_tag(stream)
+        if data is None:
+            data = stream.read(num_bytes)
+            stream.skip((8 - num_bytes % 8) % 8)
+        return data_type, data
+
+    def _list_variables(self):
+        '''
+        Top-level variables: name -> (file offset, size, compressed), from the element tags only.
+        '''
+        variables = {}
+        with open(self.mat_file_path, 'rb') as f:
+            f.seek(0, 2)
+            file_size = f.tell()
+            position = 128
+            while position + 8 <= file_size:
+                f.seek(position)
+                data_type, num_bytes = struct.unpack(self.endian + 'II', f.read(8))
+                compressed = data_type == MI_COMPRESSED
+                if compressed:
+                    stream = _InflateStream(f, position + 8, num_bytes)
+                else:
+                    stream = _RawStream(f, position)
+                    stream.skip(8)
+                name = self._read_matrix_header(stream, skip_tag=not compressed)[2]
+                variables[name] = (position, num_bytes, compressed)
+                position += 8 + num_bytes
+                if not compressed:
+                    position += (8 - num_bytes % 8) % 8
+
+        return variables
+
+    def _read_matrix_header(self, stream, skip_tag=False):
+        '''
+        Array flags, dimensions and name of a miMATRIX element.
+
+        Returns:
+        - (element size, class name, array name, dims), element size None if skip_tag
+        '''
+        num_bytes = None
+        if not skip_tag:
+            data_type, num_bytes, _ = self._read_tag(stream)
+            if num_bytes == 0:
+                return 0, 'empty', '', (0, 0)
+        _, flags = self._read_element(stream)
+        _, dims = self._read_element(stream)
+        _, name = self._read_element(stream)
+        class_name = MX_CLASSES.get(struct.unpack(self.endian + 'I', flags[:4])[0] & 0xff, 'unknown')
+        dims = tuple(struct.unpack(self.endian + f'{len(dims) // 4}i', dims))
+
+        return num_bytes, class_name, name.decode('latin1'), dims
+
+    def _index_matrix(self, stream, path, variable):
+        '''
+        Record the miMATRIX element at the stream position and its children.
+        '''
+        offset = stream.tell()
+        num_bytes, class_name, _, dims = self._read_matrix_header(stream)
+        end = offset + 8 + num_bytes
+        entry = {'class': class_name, 'shape': dims, 'dtype': MX_DTYPES.get(class_name, 'object'),
+                 'variable': variable, 'offset': offset, 'nbytes': 8 + num_bytes}
+        self.index[path] = entry
+
+        num_elements = int(np.prod(dims))
+        if class_name == 'struct':
+            _, name_length = self._read_element(stream)
+            name_length = struct.unpack(self.endian + 'i', name_length[:4])[0]
+            _, names = self._read_element(stream)
+            fields = [names[i:i + name_length].split(b'\0', 1)[0].decode('latin1')
+                      for i in range(0, len(names), name_length)]
+            entry['fields'] = fields
+            for i in range(num_elements):
+                element_path = path if num_elements == 1 else path + (i,)
+                for field in fields:
+                    self._index_matrix(stream, element_path + (field,), variable)
+        elif class_name == 'cell':
+            for i in range(num_elements):
+                self._index_matrix(stream, path + (i,), variable)
+
+        # leaves (and anything unparsed) are skipped without decoding
+        stream.skip(end - stream.tell())
+
+    def _variable_stream(self, f, variable, checkpoints=None):
+        position, num_bytes, compressed = self.variables[variable]
+        if compressed:
+            return _InflateStream(f, position + 8, num_bytes, checkpoints=checkpoints)
+        return _RawStream(f, position)
+
+    def _index_variable(self, variable):
+        if variable in self.indexed:
+            return
+        if self.is_hdf5:
+            self._index_hdf5(variable)
+        else:
+            self.checkpoints[variable] = []
+            with open(self.mat_file_path, 'rb') as f:
+                stream = self._variable_stream(f, variable, self.checkpoints[variable])
+                self._index_matrix(stream, (variable,), variable)
+        self.indexed.add(variable)
+
+    # --- v7.3 (HDF5) --- #
+    def _hdf5_class(self, node):
+        matlab_class = node.attrs.get('MATLAB_class', b'')
+        return matlab_class.decode() if isinstance(matlab_class, bytes) else str(matlab_class)
+
+    def _hdf5_fields(self, node):
+        # MATLAB keeps the field order in MATLAB_fields, h5py lists the keys sorted
+        if 'MATLAB_fields' in node.attrs:
+            return [b''.join(field).decode() for field in node.attrs['MATLAB_fields']]
+        return [key for key in node.keys() if not key.startswith('#')]
+
+    def _hdf5_node(self, path):
+        # cell elements (int path items) are object references, in column-major order
+        node = self.h5[path[0]]
+        for p in path[1:]:
+            node = self.h5[node[()].ravel()[p]] if isinstance(p, int) else node[p]
+        return node
+
+    def _index_hdf5(self, variable):
+        def visit(path, node):
+            matlab_class = self._hdf5_class(node)
+            if hasattr(node, 'keys'):
+                entry = {'class': 'struct', 'shape': (1, 1), 'dtype': 'object', 'fields': self._hdf5_fields(node)}
+            else:
+                # MATLAB stores column-major: dims are the reversed HDF5 shape
+                entry = {'class': matlab_class or node.dtype.name, 'shape': tuple(reversed(node.shape)),
+                         'dtype': MX_DTYPES.get(matlab_class, node.dtype.name)}
+            entry.update({'variable': variable, 'offset': getattr(node.id, 'get_offset', lambda: None)(), 'nbytes': None})
+            self.index[path] = entry
+            if entry['class'] == 'struct':
+                for key in entry['fields']:
+                    visit(path + (key,), node[key])
+            elif entry['class'] == 'cell':
+                for i, ref in enumerate(node[()].ravel()):
+                    visit(path + (i,), self.h5[ref])
+
+        visit((variable,), self.h5[variable])
+
+    def _decode_hdf5(self, node):
+        matlab_class = self._hdf5_class(node)
+        if hasattr(node, 'keys'):
+            return {key: self._decode_hdf5(node[key]) for key in self._hdf5_fields(node)}
+
+        data = node[()].T
+        if matlab_class == 'cell':
+            cell = np.empty(data.shape, dtype=object)
+            for i in np.ndindex(data.shape):
+                cell[i] = self._decode_hdf5(self.h5[data[i]])
+            data = cell
+        elif matlab_class == 'char':
+            # one string per row, as scipy's chars_as_strings
+            data = np.atleast_2d(data)
+            data = np.array([''.join(chr(c) for c in row) for row in data])
+            if self.options['squeeze_me'] and data.size == 1:
+                return str(data[0])
+            return data
+        elif matlab_class == 'logical':
+            data = data.astype(bool)
+        return np.squeeze(data) if self.options['squeeze_me'] else data
+
+    # --- Public API --- #
+    def add_index(self, index):
+        '''
+        Use a saved index (path -> entry of whole variables, e.g. from mat_index.py) instead
+        of walking those variables again.
+        '''
+        for path, entry in index.items():
+            self.index[tuple(path)] = entry
+            self.indexed.add(entry['variable'])
+
+    def paths(self):
+        '''
+        Every indexed path of every variable (indexes the whole file once).
+        '''
+        for variable in self.variables:
+            self._index_variable(variable)
+        return list(self.index.keys())
+
+    def info(self, path):
+        '''
+        Class, shape (and fields of a struct) of a path, without decoding it.
+        '''
+        path = tuple(path)
+        self._index_variable(path[0])
+        return self.index[path]
+
+    def keys(self, path=()):
+        '''
+        Variable names, or field names of the struct at path.
+        '''
+        if len(path) == 0:
+            return list(self.variables)
+        return self.info(path).get('fields', [])
+
+    def get(self, path):
+        '''
+        Decode the array (or struct) at path; only its bytes are read and decoded.
+        '''
+        path = tuple(path)
+        entry = self.info(path)
+
+        if self.is_hdf5:
+            return self._decode_hdf5(self._hdf5_node(path))
+        if _mio5 is None:
+            raise ImportError(f"Decoding v5 MAT elements needs scipy.io.matlab._mio5.MatFile5Reader, which is not "
+                              f"usable in scipy {scipy.__version__} ({_MIO5_ERROR}); use scipy >= 1.8.")
+
+        with open(self.mat_file_path, 'rb') as f:
+            stream = self._variable_stream(f, entry['variable'])
+            if isinstance(stream, _RawStream):
+                # uncompressed: scipy reads the element in place, no copy of its bytes
+                reader = _mio5.MatFile5Reader(f, **self.options)
+                reader.initialize_read()
+                f.seek(stream.start + entry['offset'])
+                header, _ = reader.read_var_header()
+                return reader.read_var_array(header, process=True)
+
+            stream.resume(self.checkpoints.get(entry['variable'], []), entry['offset'])
+            stream.skip(entry['offset'] - stream.tell())
+            element = stream.read(entry['nbytes'])
+
+        # the element alone, behind the file header, is a one-variable MAT file for scipy
+        reader = _mio5.MatFile5Reader(io.BytesIO(self.header + element), **self.options)
+        reader.initialize_read()
+        reader.read_file_header()
+        header, _ = reader.read_var_header()
+        return reader.read_var_array(header, process=True)
+
+    def __getitem__(self, path):
+        return self.get(path if isinstance(path, tuple) else (path,))
+
+    def close(self):
+        if self.is_hdf5:
+            self.h5.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,253 @@
+'''
+column-selective b3d marker reader
+read frames of a SubjectOnDisk trial in fixed-size chunks and write the requested
+markers/axes straight into a preallocated float32 array, instead of building a
+{name: pos} dict and python lists for every frame.
+iter_b3d_frames / iter_b3d_marker_windows walk a trial in bounded, optionally
+overlapping windows so long trials can be processed in constant memory.
+read_b3d_joint_angles stacks the processing pass positions into one
+(frames x dofs) array and slices joint coordinates out of it, without setting
+the skeleton frame by frame
+'''
+
+import numpy as np
+import nimblephysics as nimble
+
+from marker_cache import DEFAULT_CACHE_DIR, load_markers_cached
+
+DEFAULT_CHUNK_FRAMES = 2048
+
+
+def open_subject(subject):
+    # accept a path or an already opened SubjectOnDisk
+    if isinstance(subject, str):
+        return nimble.biomechanics.SubjectOnDisk(subject)
+    return subject
+
+
+def get_trial_fs(subject_on_disk, trial):
+    return int(round(1.0 / subject_on_disk.getTrialTimestep(trial)))
+
+
+def iter_b3d_frames(subject, trial, window_frames=DEFAULT_CHUNK_FRAMES, overlap=0, start_frame=0, num_frames=None,
+                    include_sensor_data=False, include_processing_passes=True):
+    '''
+    Iterate over a B3D trial in bounded windows of frames.
+
+    Consecutive windows share `overlap` frames; the shared frames are kept from the
+    previous window, not read again. The generator only holds the current window,
+    so memory is bounded by window_frames whatever the trial length.
+
+    Parameters:
+    - subject: path to the b3d file or a nimble SubjectOnDisk.
+    - trial: trial index.
+    - window_frames: frames per window.
+    - overlap: frames shared by consecutive windows (0 <= overlap < window_frames).
+    - start_frame, num_frames: frame range, num_frames=None iterates to the end of the trial.
+    - include_sensor_data, include_processing_passes: passed to readFrames.
+
+    Yields:
+    - (window_start, frames): trial index of the first frame and the list of Frame objects.
+    '''
+    if not 0 <= overlap < window_frames:
+        raise ValueError("overlap must be in [0, window_frames).")
+
+    subject_on_disk = open_subject(subject)
+    trial_length = subject_on_disk.getTrialLength(trial)
+    if num_frames is None:
+        num_frames = trial_length - start_frame
+    end_frame = start_frame + max(0, min(num_frames, trial_length - start_frame))
+
+    window_start = start_frame
+    tail = []
+    next_frame = start_frame
+    while next_frame < end_frame:
+        new_frames = subject_on_disk.readFrames(
+            trial=trial,
+            startFrame=next_frame,
+            numFramesToRead=min(window_frames - len(tail), end_frame - next_frame),
+            includeSensorData=include_sensor_data,
+            includeProcessingPasses=include_processing_passes
+        )
+        if len(new_frames) == 0:
+            break
+        frames = tail + list(new_frames)
+        next_frame += len(new_frames)
+
+        yield window_start, frames
+
+        tail = frames[len(frames) - overlap:] if overlap > 0 else []
+        window_start = next_frame - len(tail)
+        frames = None
+
+
+def read_b3d_markers(subject, trial, marker_names, axes=(0, 1, 2), start_frame=0, num_frames=None,
+                     chunk_frames=DEFAULT_CHUNK_FRAMES):
+    '''
+    Read marker observations of one B3D trial.
+
+    Parameters:
+    - subject: path to the b3d file or a nimble SubjectOnDisk.
+    - trial: trial index.
+    - marker_names: markers to load, in this order.
+    - axes: coordinates to keep (0=x, 1=y, 2=z).
+    - start_frame, num_frames: frame range, num_frames=None reads to the end of the trial.
+    - chunk_frames: frames requested from readFrames at a time, bounds peak memory.
+
+    Returns:
+    - markers: float32 array (num_frames, num_markers, len(axes)), NaN where a marker is not observed.
+    - fs: sampling rate in Hz.
+    '''
+    subject_on_disk = open_subject(subject)
+    trial_length = subject_on_disk.getTrialLength(trial)
+    if num_frames is None:
+        num_frames = trial_length - start_frame
+    num_frames = max(0, min(num_frames, trial_length - start_frame))
+
+    markers = np.full((num_frames, len(marker_names), len(axes)), np.nan, dtype=np.float32)
+    for window_start, window_markers in iter_b3d_marker_windows(subject_on_disk, trial, marker_names, axes,
+                                                                window_frames=chunk_frames, start_frame=start_frame,
+                                                                num_frames=num_frames):
+        i = window_start - start_frame
+        markers[i:i + len(window_markers)] = window_markers
+
+    return markers, get_trial_fs(subject_on_disk, trial)
+
+
+def iter_b3d_marker_windows(subject, trial, marker_names, axes=(0, 1, 2), window_frames=DEFAULT_CHUNK_FRAMES,
+                            overlap=0, start_frame=0, num_frames=None):
+    '''
+    Same windows as iter_b3d_frames, as marker arrays (window_frames, num_markers, len(axes)),
+    NaN where a marker is not observed.
+
+    Yields:
+    - (window_start, markers)
+    '''
+    # name -> column resolved once for the whole trial
+    column = {name: i for i, name in enumerate(marker_names)}
+    axes = list(axes)
+
+    tail = None
+    for window_start, frames in iter_b3d_frames(subject, trial, window_frames, overlap, start_frame, num_frames,
+                                                include_sensor_data=True, include_processing_passes=False):
+        markers = np.full((len(frames), len(marker_names), len(axes)), np.nan, dtype=np.float32)
+        # overlapping frames were already decoded in the previous window
+        done = 0
+        if tail is not None:
+            done = len(tail)
+            markers[:done] = tail
+        for i in range(done, len(frames)):
+            for name, pos in frames[i].markerObservations:
+                col = column.get(name)
+                if col is not None:
+                    markers[i, col] = pos[axes]
+
+        yield window_start, markers
+
+        tail = markers[len(markers) - overlap:].copy() if overlap > 0 else None
+
+
+def read_b3d_pass_positions(subject, trial, processing_pass=0, start_frame=0, num_frames=None,
+                            chunk_frames=DEFAULT_CHUNK_FRAMES):
+    '''
+    Stack processingPasses[processing_pass].pos of every frame into one array.
+
+    Parameters:
+    - subject: path to the b3d file or a nimble SubjectOnDisk.
+    - trial: trial index.
+    - processing_pass: processing pass the positions are taken from.
+    - start_frame, num_frames: frame range, num_frames=None reads to the end of the trial.
+    - chunk_frames: frames requested from readFrames at a time.
+
+    Returns:
+    - positions: float64 array (num_frames, num_dofs), skeleton DOF positions (rad / m).
+    '''
+    subject_on_disk = open_subject(subject)
+    trial_length = subject_on_disk.getTrialLength(trial)
+    if num_frames is None:
+        num_frames = trial_length - start_frame
+    num_frames = max(0, min(num_frames, trial_length - start_frame))
+
+    positions = None
+    for window_start, frames in iter_b3d_frames(subject_on_disk, trial, chunk_frames, start_frame=start_frame,
+                                                num_frames=num_frames, include_sensor_data=False,
+                                                include_processing_passes=True):
+        if positions is None:
+            # DOF count is known from the first frame
+            num_dofs = len(frames[0].processingPasses[processing_pass].pos)
+            positions = np.full((num_frames, num_dofs), np.nan, dtype=np.float64)
+        i = window_start - start_frame
+        positions[i:i + len(frames)] = [frame.processingPasses[processing_pass].pos for frame in frames]
+
+    if positions is None:
+        return np.empty((0, 0), dtype=np.float64)
+    return positions
+
+
+def resolve_dof_indices(skeleton, joint_coordinates):
+    '''
+    Resolve (joint name, coordinate index) pairs to skeleton DOF indices, once per skeleton.
+
+    Parameters:
+    - skeleton: nimble Skeleton, e.g. from subject_on_disk.readSkel(processingPass=...).
+    - joint_coordinates: list of (joint_name, coordinate_index), e.g. [("knee_left", 0)].
+
+    Returns:
+    - dof_indices: int array, column of each coordinate in the pass positions.
+
+    Raises KeyError for a missing joint, or a coordinate that is not one of the joint's own
+    DOFs (derived coordinates have no column in the pass positions).
+    '''
+    dof_indices = []
+    for joint_name, coordinate in joint_coordinates:
+        joint = skeleton.getJoint(joint_name)
+        if joint is None:
+            raise KeyError(f"Joint not found in skeleton: {joint_name}")
+        num_dofs = joint.getNumDofs()
+        if not 0 <= coordinate < num_dofs:
+            raise KeyError(f"Coordinate {coordinate} of joint {joint_name} is not a direct DOF "
+                           f"(the joint has {num_dofs} DOFs).")
+        dof_indices.append(joint.getDof(coordinate).getIndexInSkeleton())
+    return np.array(dof_indices, dtype=int)
+
+
+def read_b3d_joint_angles(subject, trial, joint_coordinates, processing_pass=0, start_frame=0, num_frames=None,
+                          skeleton=None):
+    '''
+    Joint coordinates of every frame of a B3D trial, in one vectorized slice.
+
+    Parameters:
+    - subject: path to the b3d file or a nimble SubjectOnDisk.
+    - trial: trial index.
+    - joint_coordinates: list of (joint_name, coordinate_index), e.g.
+      [("hip_left", 2), ("knee_left", 0), ("ankle_left", 0)].
+    - processing_pass: processing pass of the positions and skeleton.
+    - start_frame, num_frames: frame range, num_frames=None reads to the end of the trial.
+    - skeleton: already loaded skeleton, read from the file if None.
+
+    Returns:
+    - angles: float64 array (num_frames, len(joint_coordinates)) in radians.
+    '''
+    subject_on_disk = open_subject(subject)
+    if skeleton is None:
+        skeleton = subject_on_disk.readSkel(processingPass=processing_pass, ignoreGeometry=True)
+    dof_indices = resolve_dof_indices(skeleton, joint_coordinates)
+
+    positions = read_b3d_pass_positions(subject_on_disk, trial, processing_pass, start_frame, num_frames)
+    if positions.size == 0:
+        return np.empty((0, len(dof_indices)), dtype=np.float64)
+    return positions[:, dof_indices]
+
+
+def read_b3d_markers_cached(b3d_path, trial, marker_names, cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    Same as read_b3d_markers (all three axes), cached on disk and memory-mapped on
+    the next call. The cache entry is specific to the trial and the marker list.
+    '''
+    def loader():
+        markers, fs = read_b3d_markers(b3d_path, trial, marker_names)
+        return markers, marker_names, fs
+
+    entry = f"{trial}|{'|'.join(marker_names)}"
+    markers, _, fs = load_markers_cached(b3d_path, loader, trial=entry, cache_dir=cache_dir)
+    return markers, int(fs)
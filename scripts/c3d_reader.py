@@ -0,0 +1,124 @@
+'''
+streaming c3d reader
+parse the header once, then read marker data in bulk chunks straight into a
+preallocated (frames x markers x 3) float32 array, optionally only for the
+markers a gait event method needs
+'''
+
+import c3d
+import numpy as np
+
+from marker_cache import DEFAULT_CACHE_DIR, load_markers_cached, select_markers
+
+# markers needed by each gait event method (see read_c3d.py)
+GE_METHOD_MARKERS = {
+    'ge_heel_toe_height': ['Heel', 'Toe', 'Sacrum'],
+    'ge_mix': ['Heel', 'MT2', 'Sacrum'],
+}
+
+DEFAULT_CHUNK_FRAMES = 4096
+
+
+def read_c3d_labels(filepath):
+    # header + parameter section only, no frame data is read
+    with open(filepath, 'rb') as handle:
+        reader = c3d.Reader(handle)
+        return [label.strip() for label in reader.point_labels]
+
+
+def ge_method_from_labels(marker_names):
+    # same choice as read_c3d.py: toe marker -> heel/toe height, MT2 -> mix
+    if 'Toe' in marker_names:
+        return 'ge_heel_toe_height'
+    if 'MT2' in marker_names:
+        return 'ge_mix'
+    raise ValueError("The data lacks both toe and 2nd metatarsal markers, necessary for gait analysis.")
+
+
+def read_c3d_markers(filepath, marker_names=None, chunk_frames=DEFAULT_CHUNK_FRAMES, mask_invalid=False):
+    '''
+    Read marker positions from a c3d file.
+
+    Parameters:
+    - filepath: path to the c3d file.
+    - marker_names: markers to load, in this order. None loads every marker.
+    - chunk_frames: number of frames decoded per read.
+    - mask_invalid: set points with a negative residual (not reconstructed) to NaN.
+
+    Returns:
+    - markers: contiguous float32 array (num_frames, num_markers, 3).
+    - marker_names: names of the loaded markers (axis 1 of markers).
+    - frame_rate: point sampling rate in Hz.
+    '''
+    with open(filepath, 'rb') as handle:
+        reader = c3d.Reader(handle)
+        frame_rate = reader.header.frame_rate
+        all_names = [label.strip() for label in reader.point_labels]
+
+        if marker_names is None:
+            marker_names = all_names
+        missing = [name for name in marker_names if name not in all_names]
+        if missing:
+            raise KeyError(f"Markers not found in {filepath}: {missing}")
+        marker_ids = np.array([all_names.index(name) for name in marker_names], dtype=int)
+
+        # header fields are numpy int16, cast before computing byte counts
+        num_frames = int(reader.last_frame) - int(reader.first_frame) + 1
+        point_used = int(reader.point_used)
+        markers = np.empty((num_frames, len(marker_names), 3), dtype=np.float32)
+
+        if reader._dtypes.is_dec:
+            # DEC floats need a per-word conversion, let the c3d package do it
+            frame = 0
+            for _, points, _ in reader.read_frames(copy=False):
+                markers[frame] = points[marker_ids, :3]
+                if mask_invalid:
+                    markers[frame][points[marker_ids, 3] < 0] = np.nan
+                frame += 1
+            return markers[:frame], list(marker_names), frame_rate
+
+        # Frame layout: point_used x (x, y, z, residual) words, then the analog samples
+        is_float = reader.point_scale < 0
+        if is_float:
+            point_dtype = reader._dtypes.float32
+            word_bytes = 4
+            scale = None
+        else:
+            point_dtype = reader._dtypes.int16
+            word_bytes = 2
+            scale = abs(reader.point_scale)
+        point_bytes = 4 * point_used * word_bytes
+        analog_bytes = int(reader.analog_used) * int(reader.analog_per_frame) * word_bytes
+        frame_bytes = point_bytes + analog_bytes
+
+        handle.seek((int(reader.header.data_block) - 1) * 512)
+        frame = 0
+        while frame < num_frames:
+            raw = handle.read(min(chunk_frames, num_frames - frame) * frame_bytes)
+            count = len(raw) // frame_bytes
+            if count == 0:
+                break
+            # Strided view over the point words of every frame in the chunk, analog bytes are skipped
+            points = np.ndarray((count, point_used, 4), dtype=point_dtype, buffer=raw,
+                                strides=(frame_bytes, 4 * word_bytes, word_bytes))
+            if scale is None:
+                markers[frame:frame + count] = points[:, marker_ids, :3]
+            else:
+                markers[frame:frame + count] = points[:, marker_ids, :3] * scale
+            if mask_invalid:
+                markers[frame:frame + count][points[:, marker_ids, 3] < 0] = np.nan
+            frame += count
+
+    # truncated files: keep the frames that were actually read
+    return markers[:frame], list(marker_names), frame_rate
+
+
+def read_c3d_markers_cached(filepath, marker_names=None, cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    Same as read_c3d_markers, but all markers of the file are cached on disk and
+    memory-mapped on the next call (see marker_cache.py).
+    '''
+    markers, all_names, frame_rate = load_markers_cached(filepath, lambda: read_c3d_markers(filepath), cache_dir=cache_dir)
+    if marker_names is None:
+        return markers, all_names, frame_rate
+    return select_markers(markers, all_names, marker_names), list(marker_names), frame_rate
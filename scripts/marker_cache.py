@@ -0,0 +1,153 @@
+'''
+on-disk marker cache
+decoded marker trajectories are stored as one .npy per trial plus a small json
+entry, keyed by source path + mtime + size, and opened memory-mapped on the next
+run. the least recently used entries are evicted once the cache grows past
+max_bytes.
+'''
+
+import os
+import json
+import time
+import hashlib
+import tempfile
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.environ.get('GAITFM_CACHE_DIR', os.path.expanduser('~/.cache/gaitfm/markers'))
+DEFAULT_MAX_BYTES = 4 * 1024 ** 3
+
+
+def cache_key(source_path, trial=0):
+    # changes whenever the source file is rewritten, so stale entries are never hit
+    stat = os.stat(source_path)
+    key = f"{os.path.abspath(source_path)}|{stat.st_mtime_ns}|{stat.st_size}|{trial}"
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+
+def _entry_paths(cache_dir, key):
+    return os.path.join(cache_dir, key + '.npy'), os.path.join(cache_dir, key + '.json')
+
+
+def _atomic_write(path, write):
+    # write to a temp file in the same directory, then rename, so readers never see a partial file
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def get_cached_markers(source_path, trial=0, cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    Open cached markers of a source file.
+
+    Returns:
+    - (markers, marker_names, frame_rate) with markers a read-only memory-mapped
+      (num_frames, num_markers, 3) array, or None on a cache miss.
+    '''
+    npy_path, meta_path = _entry_paths(cache_dir, cache_key(source_path, trial))
+    try:
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        markers = np.load(npy_path, mmap_mode='r')
+    except (OSError, ValueError):
+        return None
+
+    # the json mtime is the LRU clock
+    os.utime(meta_path)
+
+    return markers, meta['marker_names'], meta['frame_rate']
+
+
+def put_cached_markers(source_path, markers, marker_names, frame_rate, trial=0,
+                       cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    '''
+    Store decoded markers of a source file and evict old entries past max_bytes.
+    '''
+    os.makedirs(cache_dir, exist_ok=True)
+    npy_path, meta_path = _entry_paths(cache_dir, cache_key(source_path, trial))
+    markers = np.ascontiguousarray(markers, dtype=np.float32)
+
+    meta = {
+        'source': os.path.abspath(source_path),
+        'trial': trial,
+        'marker_names': list(marker_names),
+        'frame_rate': float(frame_rate),
+        'nbytes': int(markers.nbytes),
+        'created': time.time(),
+    }
+    # the json is written last: an entry without it is incomplete and never read
+    _atomic_write(npy_path, lambda f: np.save(f, markers))
+    _atomic_write(meta_path, lambda f: f.write(json.dumps(meta).encode('utf-8')))
+
+    evict_cache(cache_dir, max_bytes)
+
+
+def evict_cache(cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    '''
+    Remove least recently used entries until the cache holds at most max_bytes.
+    '''
+    entries = []
+    total = 0
+    for file_name in os.listdir(cache_dir):
+        if not file_name.endswith('.json'):
+            continue
+        meta_path = os.path.join(cache_dir, file_name)
+        npy_path = meta_path[:-len('.json')] + '.npy'
+        try:
+            last_used = os.path.getmtime(meta_path)
+            nbytes = os.path.getsize(npy_path)
+        except OSError:
+            continue
+        entries.append((last_used, nbytes, npy_path, meta_path))
+        total += nbytes
+
+    entries.sort()
+    for _, nbytes, npy_path, meta_path in entries:
+        if total <= max_bytes:
+            break
+        for path in (meta_path, npy_path):
+            if os.path.exists(path):
+                os.remove(path)
+        total -= nbytes
+
+
+def load_markers_cached(source_path, loader, trial=0, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+    '''
+    Cached markers of a source file, decoding it with loader() on a miss.
+
+    Parameters:
+    - source_path: raw C3D/B3D file, its path + mtime + size form the cache key.
+    - loader: callable returning (markers, marker_names, frame_rate) for the trial.
+    - trial: trial index, or any label identifying the cached slice of the file.
+
+    Returns:
+    - markers, marker_names, frame_rate (markers is memory-mapped and read-only).
+    '''
+    cached = get_cached_markers(source_path, trial, cache_dir)
+    if cached is not None:
+        return cached
+
+    markers, marker_names, frame_rate = loader()
+    put_cached_markers(source_path, markers, marker_names, frame_rate, trial, cache_dir, max_bytes)
+
+    cached = get_cached_markers(source_path, trial, cache_dir)
+    if cached is None:
+        # evicted straight away (entry larger than max_bytes), hand back the decoded array
+        return markers, list(marker_names), frame_rate
+    return cached
+
+
+def select_markers(markers, marker_names, selected_names):
+    '''
+    Pick markers by name from a (num_frames, num_markers, 3) array.
+    '''
+    missing = [name for name in selected_names if name not in marker_names]
+    if missing:
+        raise KeyError(f"Markers not found: {missing}")
+    return markers[:, [marker_names.index(name) for name in selected_names]]
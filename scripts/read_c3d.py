@@ -7,50 +7,40 @@ detect gait events
 # test_gait_event_detection.py
 from gait_event_mocap_vu import ge_heel_toe_height, ge_mix
 
-import c3d
 import numpy as np
 import matplotlib.pyplot as plt
 
+from c3d_reader import GE_METHOD_MARKERS, ge_method_from_labels, read_c3d_labels, read_c3d_markers, read_c3d_markers_cached
+from marker_cache import select_markers
+
 # --- Function Definitions ---
 
-def load_and_prepare_marker_traj(filepath):
-    with open(filepath, 'rb') as handle:
-        reader = c3d.Reader(handle)
-        
-        marker_traj = {}
-        frame_rate = reader.header.frame_rate
-        
-        first_frame = next(reader.read_frames())
-        marker_names = [reader.point_label(i) for i in range(len(first_frame[0]))]
-        
-        has_toe_marker = 'Toe' in marker_names
-        has_metatarsal_marker = 'MT2' in marker_names
-        if not has_toe_marker and not has_metatarsal_marker:
-            raise ValueError("The data lacks both toe and 2nd metatarsal markers, necessary for gait analysis.")
-        
-        marker_data = {name: [] for name in marker_names}
-        
-        for points, _ in reader.read_frames():
-            for i, point in enumerate(points):
-                marker_data[marker_names[i]].append(point)
-        
-        for name, data in marker_data.items():
-            marker_data[name] = np.array(data)
-        
-        marker_traj['heel_marker_y'] = marker_data['Heel'][:, 1]
-        
-        if has_toe_marker:
-            marker_traj['toe_marker_y'] = marker_data['Toe'][:, 1]
-            ge_method = 'ge_heel_toe_height'
-        elif has_metatarsal_marker:
-            marker_traj['toe_marker_z'] = marker_data['MT2'][:, 2]
-            ge_method = 'ge_mix'
-        
-        marker_traj['sacrum_marker1_x'] = marker_data['Sacrum'][:, 0]
-        marker_traj['sacrum_marker1_z'] = marker_data['Sacrum'][:, 2]
-        marker_traj['sacrum_marker2_x'] = marker_data['Sacrum'][:, 0]
-        marker_traj['sacrum_marker2_z'] = marker_data['Sacrum'][:, 2]
-        
+def load_and_prepare_marker_traj(filepath, use_cache=True):
+    if use_cache:
+        # decoded once, then memory-mapped from the marker cache on every later call
+        markers, marker_names, frame_rate = read_c3d_markers_cached(filepath)
+        ge_method = ge_method_from_labels(marker_names)
+        markers = select_markers(markers, marker_names, GE_METHOD_MARKERS[ge_method])
+    else:
+        # labels come from the header, then only the markers of the chosen method are read
+        ge_method = ge_method_from_labels(read_c3d_labels(filepath))
+        markers, marker_names, frame_rate = read_c3d_markers(filepath, GE_METHOD_MARKERS[ge_method])
+    heel, toe, sacrum = markers[:, 0], markers[:, 1], markers[:, 2]
+
+    marker_traj = {}
+    marker_traj['heel_marker_y'] = heel[:, 1]
+
+    if ge_method == 'ge_heel_toe_height':
+        marker_traj['toe_marker_y'] = toe[:, 1]
+    elif ge_method == 'ge_mix':
+        marker_traj['toe_marker_z'] = toe[:, 2]
+        marker_traj['sacrum_marker_z'] = sacrum[:, 2]
+
+    marker_traj['sacrum_marker1_x'] = sacrum[:, 0]
+    marker_traj['sacrum_marker1_z'] = sacrum[:, 2]
+    marker_traj['sacrum_marker2_x'] = sacrum[:, 0]
+    marker_traj['sacrum_marker2_z'] = sacrum[:, 2]
+
     return marker_traj, frame_rate, ge_method
 
 def detect_gait_events(filepath, task='walking', vis=False):
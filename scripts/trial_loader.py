@@ -0,0 +1,198 @@
+'''
+format-agnostic trial loader
+one entry point for c3d, b3d and mat files: dispatches on the file type to the
+fastest installed backend and returns a MarkerTrial, a contiguous float32
+(frames x markers x 3) array with a name -> index map and the frame rate, NaN
+where a marker is missing (gaps). decoded trials go through the marker cache, so
+later loads are memory-mapped and zero-copy.
+
+backends, in order of preference:
+- .c3d: c3d package (bulk strided read, c3d_reader.py), ezc3d
+- .b3d: nimblephysics (chunked readFrames, b3d_reader.py)
+- .mat: lazy MAT reader, trial = subject/condition/stiffness leaf (conversions/mat2marker_traj.py)
+'''
+
+import os
+import sys
+
+import numpy as np
+
+from marker_cache import DEFAULT_CACHE_DIR, load_markers_cached, select_markers
+
+# MAT adapter lives in conversions/, the lazy MAT reader in mat/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'conversions'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'mat'))
+
+
+class MarkerTrial:
+    '''
+    Marker positions of one trial.
+
+    Attributes:
+    - markers: C-contiguous float32 array (num_frames, num_markers, 3), NaN for gaps;
+      read-only and memory-mapped when it comes from the marker cache.
+    - marker_names: names of axis 1 of markers.
+    - marker_index: name -> index in marker_names.
+    - frame_rate: sampling rate in Hz.
+    - source, trial: file and trial the markers were read from.
+    '''
+    def __init__(self, markers, marker_names, frame_rate, source=None, trial=0):
+        self.markers = markers if markers.dtype == np.float32 and markers.flags.c_contiguous \
+            else np.ascontiguousarray(markers, dtype=np.float32)
+        self.marker_names = list(marker_names)
+        self.marker_index = {name: i for i, name in enumerate(self.marker_names)}
+        self.frame_rate = float(frame_rate)
+        self.source = source
+        self.trial = trial
+
+    @property
+    def num_frames(self):
+        return self.markers.shape[0]
+
+    @property
+    def gaps(self):
+        # (num_frames, num_markers) True where a marker is missing
+        return np.isnan(self.markers).any(axis=2)
+
+    def __getitem__(self, name):
+        # (num_frames, 3) view of one marker, no copy
+        return self.markers[:, self.marker_index[name]]
+
+    def __contains__(self, name):
+        return name in self.marker_index
+
+    def select(self, marker_names):
+        '''
+        New MarkerTrial with only these markers, in this order (one copy of the selected columns).
+        '''
+        return MarkerTrial(select_markers(self.markers, self.marker_names, marker_names), marker_names,
+                           self.frame_rate, self.source, self.trial)
+
+
+# --- Backends: (file_path, trial, marker_names) -> (markers, marker_names, frame_rate) --- #
+def _load_c3d(file_path, trial, marker_names):
+    from c3d_reader import read_c3d_markers
+
+    return read_c3d_markers(file_path, mask_invalid=True)
+
+
+def _load_c3d_ezc3d(file_path, trial, marker_names):
+    import ezc3d
+
+    c3d = ezc3d.c3d(file_path)
+    # ezc3d points are (XYZ1, markers, frames), NaN where the residual is negative
+    markers = np.ascontiguousarray(np.transpose(c3d['data']['points'][:3], (2, 1, 0)), dtype=np.float32)
+    marker_names = [label.strip() for label in c3d['parameters']['POINT']['LABELS']['value']]
+    return markers, marker_names, c3d['parameters']['POINT']['RATE']['value'][0]
+
+
+def b3d_marker_names(subject, trial, num_frames=None):
+    '''
+    Names of the markers observed in a B3D trial (first chunk of frames if num_frames is None).
+    '''
+    from b3d_reader import DEFAULT_CHUNK_FRAMES, iter_b3d_frames
+
+    names = {}
+    num_frames = num_frames or DEFAULT_CHUNK_FRAMES
+    for _, frames in iter_b3d_frames(subject, trial, num_frames=num_frames, include_sensor_data=True,
+                                     include_processing_passes=False):
+        for frame in frames:
+            for name, _ in frame.markerObservations:
+                names.setdefault(name, None)
+    return list(names)
+
+
+def _load_b3d(file_path, trial, marker_names):
+    from b3d_reader import open_subject, read_b3d_markers
+
+    subject_on_disk = open_subject(file_path)
+    if marker_names is None:
+        marker_names = b3d_marker_names(subject_on_disk, trial)
+    markers, fs = read_b3d_markers(subject_on_disk, trial, marker_names)
+    return markers, marker_names, fs
+
+
+def _load_mat(file_path, trial, marker_names):
+    from mat_lazy import LazyMatFile
+    from mat2marker_traj import find_trial_leaves, leaf_frame_rate, marker_xyz
+
+    with LazyMatFile(file_path, squeeze_me=True, struct_as_record=False) as mat_file:
+        leaf_path = find_trial_leaves(mat_file)[trial] if isinstance(trial, int) else tuple(trial.split('/'))
+        markers_path = leaf_path + ('markers',)
+        if marker_names is None:
+            marker_names = mat_file.keys(markers_path)
+        missing = [name for name in marker_names if name not in mat_file.keys(markers_path)]
+        if missing:
+            raise KeyError(f"Markers not found: {missing}")
+
+        columns = [marker_xyz(mat_file[markers_path + (name,)]) for name in marker_names]
+        num_frames = max(len(c) for c in columns)
+        markers = np.full((num_frames, len(marker_names), 3), np.nan, dtype=np.float32)
+        for m, values in enumerate(columns):
+            # markers of the wrong size stay NaN, as in mat2c3d.m
+            if values.shape == (num_frames, 3):
+                markers[:, m] = values
+
+        return markers, list(marker_names), leaf_frame_rate(mat_file, leaf_path)
+
+
+TRIAL_BACKENDS = {'.c3d': [('c3d', _load_c3d), ('ezc3d', _load_c3d_ezc3d)],
+                  '.b3d': [('nimblephysics', _load_b3d)],
+                  '.mat': [('mat', _load_mat)]}
+
+# third-party packages of each backend: only a missing one of these means "not installed",
+# any other ImportError (e.g. a broken in-repo import) is raised
+BACKEND_PACKAGES = {'c3d': ('c3d',),
+                    'ezc3d': ('ezc3d',),
+                    'nimblephysics': ('nimblephysics',),
+                    'mat': ('scipy',)}
+
+
+def load_trial(file_path, trial=0, marker_names=None, backend=None, cache=True, cache_dir=DEFAULT_CACHE_DIR):
+    '''
+    Load the markers of one trial of a c3d, b3d or mat file.
+
+    Parameters:
+    - file_path: trial file, the backend is chosen from its extension.
+    - trial: trial index (b3d trial, mat leaf in sorted path order) or mat leaf path
+      'SUB01/Walking/Stiff'; c3d files hold a single trial.
+    - marker_names: markers to keep, in this order; None keeps every marker
+      (b3d: the markers observed in the first frames). b3d and mat files only decode these.
+    - backend: force a backend name of TRIAL_BACKENDS, None for the first installed one.
+    - cache: store the decoded trial in the marker cache and memory-map it on later calls.
+
+    Returns:
+    - trial: MarkerTrial.
+    '''
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in TRIAL_BACKENDS:
+        raise ValueError(f"Unsupported trial file {file_path}, expected one of {list(TRIAL_BACKENDS)}.")
+    backends = [b for b in TRIAL_BACKENDS[extension] if backend is None or b[0] == backend]
+    if len(backends) == 0:
+        raise ValueError(f"Unknown backend {backend} for {extension} files.")
+
+    # b3d and mat markers are read by name, so the selection is part of the cached slice
+    read_names = marker_names if extension in ('.b3d', '.mat') else None
+    entry = f"trial|{trial}" + (f"|{'|'.join(read_names)}" if read_names is not None else '')
+
+    errors = []
+    for name, loader in backends:
+        try:
+            if cache:
+                markers, names, frame_rate = load_markers_cached(file_path, lambda: loader(file_path, trial, read_names),
+                                                                 trial=entry, cache_dir=cache_dir)
+            else:
+                markers, names, frame_rate = loader(file_path, trial, read_names)
+        except ModuleNotFoundError as e:
+            if (e.name or '').split('.')[0] not in BACKEND_PACKAGES[name]:
+                raise
+            # backend not installed, try the next one
+            errors.append(f"{name}: {e}")
+            continue
+
+        loaded = MarkerTrial(markers, names, frame_rate, source=file_path, trial=trial)
+        if marker_names is not None and read_names is None:
+            loaded = loaded.select(marker_names)
+        return loaded
+
+    raise ImportError(f"No backend installed for {extension} files: {errors}")
@@ -2,9 +2,10 @@
 load b3d files with motion data, print # trials and specific trial
 '''
 import nimblephysics as nimble
-from typing import List
 import time
 
+from b3d_reader import iter_b3d_frames
+
 # Load the model, need absolute path
 your_subject = nimble.biomechanics.SubjectOnDisk("/home/dkuan/Documents/research/gaitfm/data/Falisse2017_subject_1.b3d")
 
@@ -27,30 +28,18 @@ trial = 0
 
 print(f"Viewing trial: {trial}")
 
-trial_frames: List[nimble.biomechanics.Frame] = your_subject.readFrames(
-    trial=trial,
-    startFrame=0,
-    numFramesToRead=your_subject.getTrialLength(trial))
-
 # Figure out how many (fractional) seconds each frame represents
 seconds_per_frame = your_subject.getTrialTimestep(trial)
 
-# Loop through all the frames, and render them to the GUI
-frame = 0
+# Loop through the trial window by window (bounded memory for long trials), and render each frame to the GUI
 while True:
-    # Get the frame we want to render
-    frame_to_render = trial_frames[frame]
-
-    # Set the skeleton's state to the state in the frame
-    skeleton.setPositions(frame_to_render.processingPasses[0].pos)
-
-    # Render the skeleton to the GUI
-    gui.nativeAPI().renderSkeleton(skeleton)
+    for window_start, trial_frames in iter_b3d_frames(your_subject, trial):
+        for frame_to_render in trial_frames:
+            # Set the skeleton's state to the state in the frame
+            skeleton.setPositions(frame_to_render.processingPasses[0].pos)
 
-    # Sleep for the appropriate amount of time
-    time.sleep(seconds_per_frame)
+            # Render the skeleton to the GUI
+            gui.nativeAPI().renderSkeleton(skeleton)
 
-    # Increment the frame counter
-    frame += 1
-    if frame >= len(trial_frames):
-        frame = 0
+            # Sleep for the appropriate amount of time
+            time.sleep(seconds_per_frame)
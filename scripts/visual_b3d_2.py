@@ -2,9 +2,10 @@
 load all trials, print # of trials
 '''
 import nimblephysics as nimble
-from typing import List
 import time
 
+from b3d_reader import iter_b3d_frames
+
 # Load the model, need absolute path
 your_subject = nimble.biomechanics.SubjectOnDisk("/home/dkuan/Documents/research/gaitfm/steps_detection/SN001-test-liangmodel-1.b3d")
 
@@ -30,42 +31,30 @@ def load_and_render_trial(trial_number: int):
     """
     print(f"Loading trial {trial_number}...")
     
-    # Load all the frames from the selected trial
-    trial_frames: List[nimble.biomechanics.Frame] = your_subject.readFrames(
-        trial=trial_number,
-        startFrame=0,
-        numFramesToRead=your_subject.getTrialLength(trial_number))
-
     # Figure out how many (fractional) seconds each frame represents
     seconds_per_frame = your_subject.getTrialTimestep(trial_number)
 
-    # Loop through all the frames, and render them to the GUI
-    frame = 0
+    # Loop through the trial window by window (bounded memory for long trials), and render each frame to the GUI
     while True:
-        # Get the frame we want to render
-        frame_to_render = trial_frames[frame]
-
-        # Set the skeleton's state to the state in the frame
-        skeleton.setPositions(frame_to_render.processingPasses[0].pos)
-
-        # Render the skeleton to the GUI
-        gui.nativeAPI().renderSkeleton(skeleton)
+        for window_start, trial_frames in iter_b3d_frames(your_subject, trial_number):
+            for frame_to_render in trial_frames:
+                # Set the skeleton's state to the state in the frame
+                skeleton.setPositions(frame_to_render.processingPasses[0].pos)
 
-        # Sleep for the appropriate amount of time
-        time.sleep(seconds_per_frame)
+                # Render the skeleton to the GUI
+                gui.nativeAPI().renderSkeleton(skeleton)
 
-        # Increment the frame counter
-        frame += 1
-        if frame >= len(trial_frames):
-            frame = 0  # Restart loop for playback
+                # Sleep for the appropriate amount of time
+                time.sleep(seconds_per_frame)
 
-        # Check for user input to switch trials
-        if gui.nativeAPI().hasMessage():
-            message = gui.nativeAPI().getNextMessage()
-            if message.startswith("trial:"):
-                new_trial = int(message.split(":")[1])
-                print(f"Switching to trial {new_trial}...")
-                return new_trial
+                # Check for user input to switch trials
+                if gui.nativeAPI().hasMessage():
+                    message = gui.nativeAPI().getNextMessage()
+                    if message.startswith("trial:"):
+                        new_trial = int(message.split(":")[1])
+                        print(f"Switching to trial {new_trial}...")
+                        return new_trial
+        # Restart loop for playback
 
 # Main loop for dynamic trial loading
 current_trial = 0
@@ -0,0 +1,80 @@
+# name: benchmark_foot_vel.py
+# description: timing of foot_vel_peak_enhancement against the former per-sample loop,
+#              on synthetic foot velocity signals of increasing length
+# usage: python benchmark_foot_vel.py [--fs 1000] [--minutes 1 10 60] [--repeat 3]
+
+
+import argparse
+import time
+
+import numpy as np
+
+from gait_event_mocap import foot_vel_peak_enhancement
+
+
+def foot_vel_peak_enhancement_loop(foot_center_y_vel):
+    ''' Reference per-sample implementation (previous version of foot_vel_peak_enhancement)
+    '''
+    INCREASE   = .05
+    gain       = 1
+    direction  = 1
+    num_sample = len(foot_center_y_vel)
+
+    foot_center_y_vel_enhanced = []
+    for i in range(num_sample - 1):
+        curr_vel = foot_center_y_vel[i]
+        next_vel = foot_center_y_vel[i + 1]
+
+        if curr_vel >= 0:
+            gain += INCREASE*direction
+            if next_vel - curr_vel >= 0:
+                direction = 1
+            else:
+                direction = -1
+        else:
+            gain = 1.0
+
+        foot_center_y_vel_enhanced.append(curr_vel*gain)
+
+    return np.array(foot_center_y_vel_enhanced)
+
+
+def synthetic_foot_vel(num_sample, fs, stride_time = 1.1, noise = 0.02, seed = 0):
+    ''' Vertical foot velocity: one positive (swing) lobe per stride plus noise
+    '''
+    rng = np.random.default_rng(seed)
+    t   = np.arange(num_sample)/fs
+
+    return np.sin(2*np.pi*t/stride_time) + 0.3*np.sin(4*np.pi*t/stride_time) + noise*rng.standard_normal(num_sample)
+
+
+def best_time(func, x, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(x)
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark foot_vel_peak_enhancement')
+    parser.add_argument('--fs', type = int, default = 1000, help = 'sampling rate (Hz)')
+    parser.add_argument('--minutes', type = float, nargs = '+', default = [1, 10, 60], help = 'signal lengths (min)')
+    parser.add_argument('--repeat', type = int, default = 3, help = 'runs per measurement, best is reported')
+    args = parser.parse_args()
+
+    print(f"{'samples':>10} {'loop (s)':>10} {'vector (s)':>11} {'speedup':>8} {'same':>5}")
+    for minutes in args.minutes:
+        x = synthetic_foot_vel(int(minutes*60*args.fs), args.fs)
+
+        same        = np.array_equal(foot_vel_peak_enhancement_loop(x), foot_vel_peak_enhancement(x))
+        loop_time   = best_time(foot_vel_peak_enhancement_loop, x, args.repeat)
+        vector_time = best_time(foot_vel_peak_enhancement, x, args.repeat)
+
+        print(f"{len(x):>10} {loop_time:>10.4f} {vector_time:>11.4f} {loop_time/vector_time:>7.1f}x {str(same):>5}")
+
+
+if __name__ == '__main__':
+    main()
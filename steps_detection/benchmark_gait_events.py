@@ -0,0 +1,318 @@
+# name: benchmark_gait_events.py
+# description: throughput and peak memory of the gait event methods, the toe-off corrections,
+#              the streaming detector (checked against the offline method on quantized markers)
+#              and the marker loaders on synthetic trials from seconds to hours long, and
+#              accuracy of the methods against the synthetic truth / labelled trials
+# usage: python benchmark_gait_events.py [--durations 10 60 600 3600] [--fs 100] [--noise 0.001]
+#                                        [--dropout 0] [--repeat 3] [--csv benchmark.csv]
+#                                        [--skip-loaders] [--b3d trial.b3d]
+#                                        [--trials /data/labelled] [--tolerance 0.1]
+#                                        [--accuracy-csv accuracy.csv]
+
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from scipy.signal import find_peaks
+
+from gait_event_mocap import GE_METHODS, GaitFeatures, get_gait_event_mocap, eric_lauren_correction, vu_correction
+from gait_event_stream import StreamingGaitEventDetector
+from gait_synth import synthesize_gait
+from gait_event_accuracy import ACCURACY_COLUMNS, gait_event_accuracy, truth_events_path, load_truth_events
+
+from utils.mocap import constants_mocap
+
+# C3D/B3D readers live next to read_c3d.py
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+
+
+BENCHMARK_COLUMNS = ['section', 'name', 'duration_s', 'frames', 'time_s', 'frames_per_s', 'peak_mb', 'note']
+
+# marker names of the synthetic C3D files (see scripts/c3d_reader.py)
+SYNTH_C3D_MARKERS = {'Heel': ('heel_marker_y', 'heel_marker_z'),
+                     'Toe': ('toe_marker_y', 'toe_marker_z'),
+                     'MT2': ('toe_marker_y', 'toe_marker_z'),
+                     'Sacrum': ('sacrum_marker1_x', 'sacrum_marker1_z')}
+
+
+# --- Measurement --- #
+def measure(func, repeat = 3):
+    ''' Best wall time over repeat runs, then peak traced memory of one more run
+
+    Returns:
+        + best_time (float): seconds
+        + peak_mb (float): peak memory allocated during the call (MB, numpy buffers included)
+        + result: return value of the last call
+    '''
+    best_time = np.inf
+    for _ in range(repeat):
+        start     = time.perf_counter()
+        result    = func()
+        best_time = min(best_time, time.perf_counter() - start)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return best_time, peak/1024**2, result
+
+def benchmark_row(section, name, duration, frames, func, repeat):
+    try:
+        best_time, peak_mb, result = measure(func, repeat)
+    except Exception as e:
+        return [section, name, duration, frames, np.nan, np.nan, np.nan, type(e).__name__ + ': ' + str(e)], None
+
+    return [section, name, duration, frames, best_time, frames/best_time if best_time > 0 else np.inf, peak_mb, ''], result
+
+
+# --- Accuracy --- #
+def accuracy_rows(events, truth, fs, tolerance, source):
+    ''' Accuracy of each method output against the labelled events of the same trial
+    '''
+    rows = []
+    for ge_method, gait_events in events.items():
+        if gait_events is None:
+            continue
+        for row in gait_event_accuracy(gait_events, truth, ge_method, fs, tolerance):
+            rows.append([source] + row)
+
+    return rows
+
+def benchmark_labelled_trials(root, task, repeat, tolerance):
+    ''' Methods on C3D trials with force-plate events in <trial>.events.csv (see gait_event_accuracy)
+
+    Returns:
+        + rows (list): timing rows, one per trial and method that can run on its markers
+        + accuracy (list): accuracy rows
+    '''
+    from run_study import find_study_files, load_c3d_marker_traj
+
+    rows     = []
+    accuracy = []
+    for file_path in find_study_files(root):
+        if not file_path.lower().endswith('.c3d') or not os.path.exists(truth_events_path(file_path)):
+            continue
+        marker_traj_legs, frame_rate, _ = load_c3d_marker_traj(file_path)
+        fs = int(round(frame_rate))
+        # one leg of single-leg files; with a leg column in the labels each leg is scored on its own
+        labelled_legs = 'leg' in pd.read_csv(truth_events_path(file_path), nrows = 0).columns
+        if not labelled_legs:
+            marker_traj_legs = dict(list(marker_traj_legs.items())[:1])
+
+        for leg, marker_traj in marker_traj_legs.items():
+            marker_traj = {key: np.asarray(value, dtype = float) for key, value in marker_traj.items()}
+            truth       = load_truth_events(truth_events_path(file_path), leg if labelled_legs else None)
+            frames      = len(marker_traj['heel_marker_y'])
+            source      = os.path.basename(file_path) + (':' + leg if labelled_legs else '')
+
+            events = {}
+            for ge_method in GE_METHODS:
+                if not GaitFeatures(marker_traj, fs).available(GE_METHODS[ge_method]['features']):
+                    continue
+                func        = lambda: get_gait_event_mocap(marker_traj, task, ge_method, fs = fs, features = GaitFeatures(marker_traj, fs))
+                row, result = benchmark_row('trial', ge_method, frames/fs, frames, func, repeat)
+                rows.append(row[:-1] + [source])
+                events[ge_method] = result
+            accuracy += accuracy_rows(events, truth, fs, tolerance, source)
+
+    return rows, accuracy
+
+
+# --- Benchmarks --- #
+def benchmark_methods(marker_traj, task, fs, duration, repeat):
+    ''' Every registered ge_* method, shared features rebuilt for each run
+    '''
+    frames = len(marker_traj['heel_marker_y'])
+    rows   = []
+    events = {}
+    for ge_method in GE_METHODS:
+        func        = lambda: get_gait_event_mocap(marker_traj, task, ge_method, correction = 'eric_lauren_correction', fs = fs,
+                                                   features = GaitFeatures(marker_traj, fs))
+        row, result = benchmark_row('method', ge_method, duration, frames, func, repeat)
+        rows.append(row)
+        events[ge_method] = result
+
+    return rows, events
+
+def benchmark_corrections(marker_traj, fs, duration, repeat):
+    ''' Toe-off corrections on the toe-height candidates of ge_heel_toe_height
+    '''
+    frames        = len(marker_traj['toe_marker_y'])
+    toe_marker_y  = marker_traj['toe_marker_y']
+    near_to_index, temp_to_value = find_peaks(-1*toe_marker_y, height = [-1, 0], distance = fs*0.6)
+    to_value      = -1*temp_to_value['peak_heights']
+
+    rows = []
+    for name, correction in (('eric_lauren_correction', eric_lauren_correction), ('vu_correction', vu_correction)):
+        row, _ = benchmark_row('correction', name, duration, frames, lambda: correction(near_to_index, to_value, toe_marker_y, fs), repeat)
+        rows.append(row)
+
+    return rows
+
+def stream_events(marker_traj, fs, chunk):
+    # StreamingGaitEventDetector (ge_heel_toe_height, max_delay = None) fed chunk samples at a time
+    detector = StreamingGaitEventDetector('ge_heel_toe_height', fs = fs)
+    frames   = len(marker_traj['heel_marker_y'])
+    parts    = [detector.push({key: value[start:start + chunk] for key, value in marker_traj.items()})
+                for start in range(0, frames, chunk)] + [detector.flush()]
+
+    return {key: np.concatenate([part[key] for part in parts]) for key in ('hc_index', 'to_index')}
+
+def benchmark_stream(marker_traj, fs, duration, repeat, quantum = 1e-4):
+    ''' Streaming detector pushed one second at a time, checked against the offline
+    ge_heel_toe_height on the markers rounded to quantum (0.1 mm, integer C3D storage); the note
+    counts the events found by only one of the two and how many of them sit at an exact height
+    tie with another candidate within the minimum peak distance
+    '''
+    frames    = len(marker_traj['heel_marker_y'])
+    quantized = {key: np.round(np.asarray(value, dtype = float)/quantum)*quantum for key, value in marker_traj.items()}
+    row, streamed = benchmark_row('stream', 'StreamingGaitEventDetector', duration, frames,
+                                  lambda: stream_events(quantized, fs, int(fs)), repeat)
+    if streamed is None:
+        return [row]
+    offline = get_gait_event_mocap(quantized, 'walking', constants_mocap.GE_METHOD_HEEL_TOE_HEIGHT, fs = fs)
+
+    distance   = int(np.ceil(fs*0.6))
+    num_events = num_differ = num_ties = 0
+    for event, marker in (('hc', 'heel_marker_y'), ('to', 'toe_marker_y')):
+        detection  = -1*quantized[marker]
+        candidates = find_peaks(detection, height = [-1, 0])[0]
+        differ     = np.setxor1d(streamed[event + '_index'], offline[event + '_index'])
+        for p in differ:
+            close     = candidates[(np.abs(candidates - p) < distance) & (candidates != p)]
+            num_ties += bool(np.any(detection[close] == detection[p]))
+        num_events += len(offline[event + '_index'])
+        num_differ += len(differ)
+    row[-1] = (f'{num_differ} of {num_events} events differ from offline on {quantum*1000:g} mm markers, '
+               f'{num_ties} at height ties')
+
+    return [row]
+
+def write_synthetic_c3d(file_path, marker_traj, fs):
+    ''' Write the synthetic trial as a C3D file with Heel, Toe, MT2 and Sacrum markers (float format)
+    '''
+    import c3d
+
+    num_frames = len(marker_traj['heel_marker_y'])
+    points     = np.zeros((num_frames, len(SYNTH_C3D_MARKERS), 5), dtype = np.float32)
+    for i, (y_key, z_key) in enumerate(SYNTH_C3D_MARKERS.values()):
+        points[:, i, 1] = marker_traj[y_key]
+        points[:, i, 2] = marker_traj[z_key]
+    if 'sacrum_marker1_x' in marker_traj:
+        points[:, list(SYNTH_C3D_MARKERS).index('Sacrum'), 0] = marker_traj['sacrum_marker1_x']
+    points[np.isnan(points)] = 0
+
+    writer = c3d.Writer(point_rate = fs, point_scale = -1)
+    writer.set_point_labels(list(SYNTH_C3D_MARKERS))
+    writer.add_frames([(frame, np.zeros((0, 0), dtype = np.float32)) for frame in points])
+    with open(file_path, 'wb') as handle:
+        writer.write(handle)
+
+def benchmark_c3d_loaders(marker_traj, fs, duration, repeat):
+    ''' Streaming C3D reader, cold and warm marker cache
+    '''
+    try:
+        from c3d_reader import read_c3d_markers, read_c3d_markers_cached
+    except ImportError as e:
+        return [['loader', 'read_c3d_markers', duration, np.nan, np.nan, np.nan, np.nan, 'skipped: ' + str(e)]]
+
+    frames = len(marker_traj['heel_marker_y'])
+    rows   = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, 'synthetic.c3d')
+        cache_dir = os.path.join(tmp_dir, 'cache')
+        write_synthetic_c3d(file_path, marker_traj, fs)
+
+        row, _ = benchmark_row('loader', 'read_c3d_markers', duration, frames, lambda: read_c3d_markers(file_path), repeat)
+        rows.append(row)
+
+        def cold_cache():
+            for file_name in os.listdir(cache_dir) if os.path.isdir(cache_dir) else []:
+                os.remove(os.path.join(cache_dir, file_name))
+            return read_c3d_markers_cached(file_path, cache_dir = cache_dir)
+        row, _ = benchmark_row('loader', 'read_c3d_markers_cached (miss)', duration, frames, cold_cache, repeat)
+        rows.append(row)
+
+        read_c3d_markers_cached(file_path, cache_dir = cache_dir)
+        row, _ = benchmark_row('loader', 'read_c3d_markers_cached (hit)', duration, frames,
+                               lambda: np.asarray(read_c3d_markers_cached(file_path, cache_dir = cache_dir)[0]).sum(), repeat)
+        rows.append(row)
+
+    return rows
+
+def benchmark_b3d_loader(b3d_path, repeat):
+    ''' B3D marker reader on an existing file (trial 0), needs nimblephysics
+    '''
+    try:
+        from b3d_reader import read_b3d_markers, open_subject
+    except ImportError as e:
+        return [['loader', 'read_b3d_markers', np.nan, np.nan, np.nan, np.nan, np.nan, 'skipped: ' + str(e)]]
+
+    subject = open_subject(b3d_path)
+    frames  = subject.getTrialLength(0)
+    names   = ['LeftCAL', 'LeftTOE', 'Sacrum1', 'Sacrum2']
+    row, _  = benchmark_row('loader', 'read_b3d_markers', np.nan, frames, lambda: read_b3d_markers(subject, 0, names), repeat)
+
+    return [row]
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Benchmark the gait event methods on synthetic gait')
+    parser.add_argument('--durations', type = float, nargs = '+', default = [10, 60, 600, 3600], help = 'trial lengths (s)')
+    parser.add_argument('--fs', type = int, default = 100, help = 'sampling rate (Hz)')
+    parser.add_argument('--cadence', type = float, default = 110, help = 'steps per minute')
+    parser.add_argument('--noise', type = float, default = 0.001, help = 'marker noise std (m)')
+    parser.add_argument('--dropout', type = float, default = 0.0, help = 'fraction of frames lost in gaps')
+    parser.add_argument('--task', default = 'walking', choices = ['walking', 'treadmill_walking'])
+    parser.add_argument('--repeat', type = int, default = 3, help = 'runs per measurement, best is reported')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--skip-loaders', action = 'store_true', help = 'do not write / read synthetic C3D files')
+    parser.add_argument('--b3d', default = None, help = 'also time read_b3d_markers on this file')
+    parser.add_argument('--csv', default = None, help = 'write the results to this CSV file')
+    parser.add_argument('--trials', default = None, help = 'also run on the C3D trials under this directory that have <trial>.events.csv')
+    parser.add_argument('--tolerance', type = float, default = 0.1, help = 'maximum timing error of a matched event (s)')
+    parser.add_argument('--accuracy-csv', default = None, help = 'write the accuracy table to this CSV file')
+    args = parser.parse_args()
+
+    rows     = []
+    accuracy = []
+    for duration in args.durations:
+        marker_traj, truth = synthesize_gait(duration = duration, fs = args.fs, cadence = args.cadence, noise = args.noise,
+                                             dropout_rate = args.dropout, treadmill = args.task == 'treadmill_walking', seed = args.seed)
+
+        method_rows, events = benchmark_methods(marker_traj, args.task, args.fs, duration, args.repeat)
+        rows               += method_rows
+        accuracy           += accuracy_rows(events, truth, args.fs, args.tolerance, 'synthetic ' + str(duration) + ' s')
+        rows               += benchmark_corrections(marker_traj, args.fs, duration, args.repeat)
+        rows               += benchmark_stream(marker_traj, args.fs, duration, args.repeat)
+        if not args.skip_loaders:
+            rows += benchmark_c3d_loaders(marker_traj, args.fs, duration, args.repeat)
+    if args.b3d is not None:
+        rows += benchmark_b3d_loader(args.b3d, args.repeat)
+    if args.trials is not None:
+        trial_rows, trial_accuracy = benchmark_labelled_trials(args.trials, args.task, args.repeat, args.tolerance)
+        rows     += trial_rows
+        accuracy += trial_accuracy
+
+    results  = pd.DataFrame(rows, columns = BENCHMARK_COLUMNS)
+    accuracy = pd.DataFrame(accuracy, columns = ['source'] + ACCURACY_COLUMNS)
+    with pd.option_context('display.max_rows', None, 'display.width', 200, 'display.float_format', '{:.4g}'.format):
+        print(results.to_string(index = False))
+        print()
+        print(accuracy.to_string(index = False))
+
+    if args.csv is not None:
+        results.to_csv(args.csv, index = False)
+    if args.accuracy_csv is not None:
+        accuracy.to_csv(args.accuracy_csv, index = False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+# name: gait_cycle.py
+# description: slice every gait cycle of a trial, time-normalize each to 0-100 % and
+#              average them, for marker trajectories or joint angles
+# note: numpy only
+
+
+import warnings
+
+import numpy as np
+
+from gait_event_utils import align_events
+
+
+NUM_POINTS = 101    # 0, 1, ..., 100 % of the gait cycle
+
+
+# --- Cycle boundaries --- #
+def gait_cycles(hc_index, end_index = None, min_frames = 2, max_frames = None):
+    ''' Start and end frames of all cycles
+
+    Args:
+        + hc_index (np.array): heel contact indices
+        + end_index (np.array): cycle end events, e.g. toe-off indices for stance; None for full
+          strides from each heel contact to the next one
+        + min_frames, max_frames (int): keep cycles whose length (frames) is within these bounds,
+          e.g. to drop strides spanning a turn or a missed heel contact
+
+    Returns:
+        + start_index, stop_index (np.array of int): cycle start and end frames (end included)
+    '''
+    hc_index = np.sort(np.asarray(hc_index, dtype = int))
+
+    if end_index is None:
+        start_index = hc_index[:-1]
+        stop_index  = hc_index[1:]
+    else:
+        # first end event after each heel contact
+        end_index       = np.sort(np.asarray(end_index, dtype = int))
+        position, found = align_events(hc_index, end_index, direction = 'next')
+        start_index     = hc_index[found]
+        stop_index      = end_index[position[found]]
+
+    length = stop_index - start_index
+    keep   = length >= min_frames
+    if max_frames is not None:
+        keep &= length <= max_frames
+
+    return start_index[keep], stop_index[keep]
+
+
+# --- Time normalization --- #
+def time_normalize(signals, start_index, stop_index, num_points = NUM_POINTS):
+    ''' Resample every cycle of the signals to num_points samples, all cycles at once
+
+    Linear interpolation at num_points evenly spaced positions between the start and end frame of
+    each cycle (both included), as np.interp would do per cycle.
+
+    Args:
+        + signals (np.array): (frames,) or (frames, channels)
+        + start_index, stop_index (np.array of int): cycle boundaries, from gait_cycles
+        + num_points (int): samples per normalized cycle
+
+    Returns:
+        + cycles (np.array): (num_cycles, num_points, channels), NaN where the signal has gaps
+    '''
+    signals = np.asarray(signals, dtype = float)
+    if signals.ndim == 1:
+        signals = signals[:, None]
+    start_index = np.asarray(start_index, dtype = int)
+    stop_index  = np.asarray(stop_index, dtype = int)
+
+    # fractional frame of each normalized sample: (num_cycles, num_points)
+    position = start_index[:, None] + (stop_index - start_index)[:, None]*np.linspace(0, 1, num_points)[None, :]
+    left     = np.clip(np.floor(position).astype(int), 0, len(signals) - 1)
+    right    = np.clip(left + 1, 0, len(signals) - 1)
+    weight   = (position - left)[:, :, None]
+
+    cycles = signals[left]*(1 - weight) + signals[right]*weight
+    # exact samples (cycle ends) must not pick up a NaN / out of range right neighbour
+    exact  = weight[:, :, 0] == 0
+    cycles[exact] = signals[left[exact]]
+
+    return cycles
+
+
+# --- Ensemble average --- #
+def ensemble_average(cycles):
+    ''' Mean and SD band over the cycles, ignoring NaN gaps
+
+    Args:
+        + cycles (np.array): (num_cycles, num_points, channels)
+
+    Returns:
+        + mean, sd (np.array): (num_points, channels)
+    '''
+    # all-NaN points (a gap in every cycle) stay NaN without a warning
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        mean = np.nanmean(cycles, axis = 0)
+        sd   = np.nanstd(cycles, axis = 0)
+
+    return mean, sd
+
+
+def normalize_gait_cycles(signals, hc_index, end_index = None, num_points = NUM_POINTS, min_frames = 2, max_frames = None):
+    ''' Slice, time-normalize and average all gait cycles of a trial
+
+    Args:
+        + signals (np.array or dict of np.array): (frames,) / (frames, channels) array, or named
+          signals of equal length, e.g. a marker_traj dict or joint angles
+        + hc_index (np.array): heel contact indices
+        + end_index (np.array): cycle end events (e.g. toe-off for stance), None for full strides
+        + num_points (int): samples per normalized cycle (101 = 0-100 %)
+        + min_frames, max_frames (int): accepted cycle lengths (frames)
+
+    Returns:
+        + gait_cycle (dict): cycles (num_cycles, num_points, channels), mean and sd
+          (num_points, channels), start_index and stop_index of each cycle, and channels (the
+          signal names if a dict was given)
+    '''
+    channels = None
+    if isinstance(signals, dict):
+        channels = list(signals.keys())
+        signals  = np.stack([np.asarray(signals[name], dtype = float) for name in channels], axis = 1)
+
+    start_index, stop_index = gait_cycles(hc_index, end_index, min_frames, max_frames)
+    cycles                  = time_normalize(signals, start_index, stop_index, num_points)
+    mean, sd                = ensemble_average(cycles)
+
+    gait_cycle = {'cycles': cycles,
+                  'mean': mean,
+                  'sd': sd,
+                  'start_index': start_index,
+                  'stop_index': stop_index,
+                  'channels': channels}
+
+    return gait_cycle
@@ -0,0 +1,150 @@
+# name: gait_event_accuracy.py
+# description: compare detected gait events with labelled ones (synthetic truth or
+#              force-plate events), timing errors and miss / false-positive rates
+
+
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import linear_sum_assignment
+
+
+ACCURACY_COLUMNS = ['ge_method', 'event', 'num_truth', 'num_detected', 'num_matched', 'miss_rate', 'fp_rate',
+                    'mean_error_ms', 'sd_error_ms', 'median_abs_error_ms', 'p95_abs_error_ms']
+
+
+# --- Match detected events to the labelled ones --- #
+def match_events(detected_index, truth_index, tolerance):
+    ''' One-to-one matching of detected and true events within a tolerance
+
+    Optimal assignment: the largest number of pairs within the tolerance, and among those the
+    smallest total |detected - truth|. Events are split into clusters wherever consecutive events
+    (detected and true, merged) are more than the tolerance apart, no match can cross such a gap,
+    and each cluster is solved with linear_sum_assignment; most clusters hold one event of each.
+
+    Args:
+        + detected_index (np.array): detected event indices
+        + truth_index (np.array): sorted true event indices
+        + tolerance (int): maximum |detected - truth| of a match (samples)
+
+    Returns:
+        + matched_detected, matched_truth (np.array of int): indices of the matched pairs
+        + num_missed (int): true events without a detection
+        + num_false (int): detections without a true event
+    '''
+    detected_index = np.sort(np.asarray(detected_index, dtype = int))
+    truth_index    = np.asarray(truth_index, dtype = int)
+    if len(detected_index) == 0 or len(truth_index) == 0:
+        return np.array([], dtype = int), np.array([], dtype = int), len(truth_index), len(detected_index)
+
+    # clusters of the merged events
+    merged   = np.concatenate([detected_index, truth_index])
+    is_truth = np.concatenate([np.zeros(len(detected_index), dtype = bool), np.ones(len(truth_index), dtype = bool)])
+    order    = np.argsort(merged, kind = 'stable')
+    merged   = merged[order]
+    is_truth = is_truth[order]
+    bounds   = np.concatenate([[0], np.flatnonzero(np.diff(merged) > tolerance) + 1, [len(merged)]])
+
+    matched_detected = []
+    matched_truth    = []
+    for start, stop in zip(bounds[:-1], bounds[1:]):
+        detected = merged[start:stop][~is_truth[start:stop]]
+        truth    = merged[start:stop][is_truth[start:stop]]
+        if len(detected) == 0 or len(truth) == 0:
+            continue
+        if len(detected) == 1 and len(truth) == 1:
+            if abs(detected[0] - truth[0]) <= tolerance:
+                matched_detected.append(detected)
+                matched_truth.append(truth)
+            continue
+
+        # pairs within tolerance cost |error| - bonus, so more pairs always beat a smaller error
+        error    = np.abs(detected[:, None] - truth[None, :])
+        feasible = error <= tolerance
+        bonus    = (tolerance + 1)*(min(len(detected), len(truth)) + 1)
+        rows, columns = linear_sum_assignment(np.where(feasible, error - bonus, 0))
+        keep     = feasible[rows, columns]
+        matched_detected.append(detected[rows[keep]])
+        matched_truth.append(truth[columns[keep]])
+
+    matched_detected = np.concatenate(matched_detected) if matched_detected else np.array([], dtype = int)
+    matched_truth    = np.concatenate(matched_truth) if matched_truth else np.array([], dtype = int)
+
+    return matched_detected, matched_truth, len(truth_index) - len(matched_truth), len(detected_index) - len(matched_detected)
+
+def event_accuracy(detected_index, truth_index, fs = 100, tolerance = 0.1):
+    ''' Timing error distribution and miss / false-positive rates of one event type
+
+    Args:
+        + detected_index (np.array): detected event indices
+        + truth_index (np.array): true event indices
+        + fs (int): sampling rate
+        + tolerance (float): maximum timing error of a match (s)
+
+    Returns:
+        + accuracy (dict): counts, miss_rate (missed / true), fp_rate (false / detected) and
+          signed timing error statistics of the matched events (ms, detected - truth)
+    '''
+    truth_index = np.sort(np.asarray(truth_index, dtype = int))
+    matched_detected, matched_truth, num_missed, num_false = match_events(detected_index, truth_index, int(round(tolerance*fs)))
+
+    error_ms     = (matched_detected - matched_truth)*1000.0/fs
+    num_detected = len(np.asarray(detected_index))
+    accuracy     = {'num_truth': len(truth_index),
+                    'num_detected': num_detected,
+                    'num_matched': len(matched_truth),
+                    'miss_rate': num_missed/len(truth_index) if len(truth_index) else np.nan,
+                    'fp_rate': num_false/num_detected if num_detected else np.nan,
+                    'mean_error_ms': error_ms.mean() if len(error_ms) else np.nan,
+                    'sd_error_ms': error_ms.std() if len(error_ms) else np.nan,
+                    'median_abs_error_ms': np.median(np.abs(error_ms)) if len(error_ms) else np.nan,
+                    'p95_abs_error_ms': np.percentile(np.abs(error_ms), 95) if len(error_ms) else np.nan}
+
+    return accuracy
+
+def gait_event_accuracy(gait_events, truth, ge_method = '', fs = 100, tolerance = 0.1):
+    ''' Accuracy rows of one method on one trial, heel contact and toe-off
+
+    Args:
+        + gait_events (dict of np.array): detector output (hc_index, to_index)
+        + truth (dict of np.array): labelled hc_index and to_index
+        + ge_method (str): method name written in the rows
+        + fs (int): sampling rate
+        + tolerance (float): maximum timing error of a match (s)
+
+    Returns:
+        + rows (list of list): one row per event type, ACCURACY_COLUMNS order
+    '''
+    rows = []
+    for event in ('hc', 'to'):
+        accuracy = event_accuracy(gait_events[event + '_index'], truth[event + '_index'], fs, tolerance)
+        rows.append([ge_method, event] + [accuracy[column] for column in ACCURACY_COLUMNS[2:]])
+
+    return rows
+
+
+# --- Labelled events stored next to the trials --- #
+def truth_events_path(trial_path):
+    # force-plate events of <trial>.c3d are stored in <trial>.events.csv
+    return os.path.splitext(trial_path)[0] + '.events.csv'
+
+def load_truth_events(csv_path, leg = None):
+    ''' Read labelled events, a CSV with columns event ('hc' / 'to'), frame and optionally leg
+
+    Args:
+        + csv_path (str): labelled events
+        + leg (str): keep the events of this leg ('r' / 'l'); files without a leg column
+          label a single leg and are returned whole
+
+    Returns:
+        + truth (dict of np.array): sorted hc_index and to_index
+    '''
+    events = pd.read_csv(csv_path)
+    if leg is not None and 'leg' in events.columns:
+        events = events[events['leg'] == leg]
+    truth  = {}
+    for event in ('hc', 'to'):
+        truth[event + '_index'] = np.sort(events.loc[events['event'] == event, 'frame'].to_numpy(dtype = int))
+
+    return truth
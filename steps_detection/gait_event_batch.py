@@ -0,0 +1,98 @@
+# name: gait_event_batch.py
+# description: batch gait event detection over many trials and both legs,
+#              returning one columnar event table
+
+
+import numpy as np
+import pandas as pd
+
+from gait_event_mocap import MARKER_TRAJ_GE_METHODS, GaitFeatures, get_gait_event_mocap, get_marker_traj, select_ge_method
+from gait_event_utils import EVENT_NAMES, EVENT_TABLE_COLUMNS, gait_events_to_columns
+
+
+# --- Detect events for a batch of trials --- #
+def get_gait_event_mocap_batch(trials, task, ge_method = None, correction = None, fs = 100, legs = ('r', 'l'), trial_ids = None):
+    ''' Obtain heel contact and toe-off events for many trials and both legs in one call
+
+    Marker columns are extracted once per trial for both legs with one get_marker_traj() call,
+    which hands both legs the same sacrum arrays. The legs' feature stores are linked
+    (GaitFeatures(shared = ...)), so the sacrum heading is computed once per trial; the heel /
+    toe signals differ between legs and are computed once per leg.
+
+    Args:
+        + trials (list of pd.DataFrame): synchronized mocap data per trial, lengths may differ
+        + task (str): 'walking' or 'treadmill_walking'
+        + ge_method (str): method for gait detection, one of MARKER_TRAJ_GE_METHODS, None to select it
+          per trial with select_ge_method
+        + correction (str): method for correction (GE_METHOD_HEEL_TOE_HEIGHT_C), None if no correction applied
+        + fs (int or list of int): sampling rate, shared or per trial
+        + legs (tuple of str): the two legs to process, e.g. ('r', 'l')
+        + trial_ids (list): optional unique labels for the trials, defaults to their position
+
+    Returns:
+        + event_table (pd.DataFrame): one row per event with columns trial_id, leg, event
+          (EVENT_HC or EVENT_TO), frame and value (NaN if the method returns no value),
+          sorted by trial, leg and frame
+    '''
+    if ge_method is not None and ge_method not in MARKER_TRAJ_GE_METHODS:
+        raise ValueError('Unsupported gait detection method for mocap trials: ' + str(ge_method))
+
+    num_trials = len(trials)
+    if np.ndim(fs) == 0:
+        fs = [fs]*num_trials
+    if trial_ids is not None and len(trial_ids) != num_trials:
+        raise ValueError('trial_ids must have one label per trial.')
+
+    columns = []
+    for trial_code, s_mocap_data in enumerate(trials):
+        trial_ge_method = ge_method
+        if trial_ge_method is None:
+            trial_ge_method = select_ge_method(s_mocap_data.columns)
+
+        marker_traj_legs = get_marker_traj(s_mocap_data, trial_ge_method, legs[0], legs[1])
+        trial_features   = None
+        for leg_code, marker_traj in enumerate(marker_traj_legs):
+            features       = GaitFeatures(marker_traj, fs[trial_code], shared = trial_features)
+            trial_features = features if trial_features is None else trial_features
+            gait_events    = get_gait_event_mocap(marker_traj, task, trial_ge_method, correction = correction,
+                                                  fs = fs[trial_code], features = features)
+            columns.append(gait_events_to_columns(gait_events, trial_code, leg_code))
+
+    if len(columns) == 0:
+        columns = [gait_events_to_columns({'hc_index': [], 'hc_value': [], 'to_index': [], 'to_value': []}, 0, 0)]
+    table = {name: np.concatenate([c[name] for c in columns]) for name in EVENT_TABLE_COLUMNS}
+
+    order = np.lexsort((table['event'], table['frame'], table['leg'], table['trial_id']))
+    table = {name: values[order] for name, values in table.items()}
+
+    if trial_ids is None:
+        trial_ids = np.arange(num_trials)
+    table['trial_id'] = pd.Categorical.from_codes(table['trial_id'], categories = list(trial_ids))
+    table['leg']      = pd.Categorical.from_codes(table['leg'], categories = list(legs))
+
+    event_table = pd.DataFrame(table, columns = EVENT_TABLE_COLUMNS)
+
+    return event_table
+
+
+# --- Back to the per-call dict format --- #
+def event_table_to_gait_events(event_table, trial_id, leg):
+    ''' Select the events of one trial and leg from an event table
+
+    Args:
+        + event_table (pd.DataFrame): output of get_gait_event_mocap_batch
+        + trial_id: label of the trial
+        + leg (str): leg label
+
+    Returns:
+        + gait_events (dict of np.array): index and value arrays of heel strike and toe-offs
+    '''
+    selected = event_table[(event_table['trial_id'] == trial_id) & (event_table['leg'] == leg)]
+
+    gait_events = {}
+    for event_code, prefix in EVENT_NAMES.items():
+        rows = selected[selected['event'] == event_code]
+        gait_events[prefix + '_index'] = rows['frame'].to_numpy()
+        gait_events[prefix + '_value'] = rows['value'].to_numpy()
+
+    return gait_events
@@ -0,0 +1,132 @@
+# name: gait_event_consensus.py
+# description: run several gait event methods on one shared feature pass and fuse their
+#              events by tolerance-window voting
+
+
+import numpy as np
+import pandas as pd
+
+from utils.mocap import constants_mocap
+
+from gait_event_mocap import GE_METHODS, GaitFeatures, get_gait_event_mocap
+
+
+# Methods voting by default, in this order
+CONSENSUS_METHODS = [constants_mocap.GE_METHOD_HEEL_TOE_HEIGHT,
+                     constants_mocap.GE_METHOD_MIX,
+                     constants_mocap.GE_METHOD_HEEL_TOE_SACRUM,
+                     constants_mocap.GE_METHOD_FOOT_VEL]
+
+AGREEMENT_COLUMNS = ['ge_method', 'event', 'num_events', 'num_agreed', 'agreement', 'coverage', 'mean_abs_offset']
+
+
+# --- Fuse event indices of several methods --- #
+def fuse_events(event_index_list, tolerance, min_votes):
+    ''' Tolerance-window voting over the events of several methods
+
+    All events are merged into one sorted array (O(n log n)) and split into clusters wherever two
+    consecutive events are more than tolerance samples apart. A cluster is accepted if at least
+    min_votes different methods contributed to it; its fused index is the median of its members.
+
+    Args:
+        + event_index_list (list of np.array): event indices, one array per method
+        + tolerance (int): maximum gap between events of one cluster (samples)
+        + min_votes (int): minimum number of methods agreeing on an event
+
+    Returns:
+        + fused_index (np.array of int): accepted events
+        + votes (np.array of int): number of methods agreeing on each accepted event
+        + member_fused (list of np.array of int): per method and event, position of its accepted
+          cluster in fused_index, -1 if the event was not accepted
+    '''
+    num_methods = len(event_index_list)
+    index       = np.concatenate([np.asarray(e, dtype = int) for e in event_index_list] + [np.array([], dtype = int)])
+    method      = np.concatenate([np.full(len(e), m, dtype = int) for m, e in enumerate(event_index_list)] + [np.array([], dtype = int)])
+
+    order         = np.argsort(index, kind = 'stable')
+    index_sorted  = index[order]
+    method_sorted = method[order]
+
+    # cluster ids along the sorted events
+    new_cluster = np.concatenate([[True], np.diff(index_sorted) > tolerance]) if len(index_sorted) else np.array([], dtype = bool)
+    cluster     = np.cumsum(new_cluster) - 1
+    num_cluster = int(cluster[-1]) + 1 if len(cluster) else 0
+
+    # distinct methods per cluster
+    cluster_method = np.unique(cluster*num_methods + method_sorted)
+    votes          = np.bincount(cluster_method//num_methods, minlength = num_cluster) if num_methods else np.zeros(0, dtype = int)
+
+    # median of each cluster from its sorted members
+    start  = np.flatnonzero(new_cluster)
+    size   = np.diff(np.concatenate([start, [len(index_sorted)]]))
+    median = (index_sorted[start + (size - 1)//2] + index_sorted[start + size//2])/2
+
+    accepted    = votes >= min_votes
+    fused_index = np.round(median[accepted]).astype(int)
+
+    # sorted event -> accepted cluster position, back to the per-method order
+    accepted_position = np.cumsum(accepted) - 1
+    member            = np.full(len(index), -1, dtype = int)
+    member[order]     = np.where(accepted[cluster], accepted_position[cluster], -1)
+    bounds            = np.cumsum([0] + [len(e) for e in event_index_list])
+    member_fused      = [member[bounds[m]:bounds[m + 1]] for m in range(num_methods)]
+
+    return fused_index, votes[accepted], member_fused
+
+
+# --- Consensus of several methods on one trial --- #
+def get_gait_event_consensus(marker_traj, task, ge_methods = None, fs = 100, tolerance = 0.05, min_votes = None, features = None):
+    ''' Obtain heel contact and toe-off events agreed on by several detection methods
+
+    Methods whose markers are missing from marker_traj are skipped. All methods read their
+    derived signals from one GaitFeatures store, so shared signals are computed once.
+
+    Args:
+        + marker_traj (dict of np.array): union of the markers needed by the methods
+        + task (str): 'walking' or 'treadmill_walking'
+        + ge_methods (list of str): methods that vote, defaults to CONSENSUS_METHODS
+        + fs (int): sampling rate
+        + tolerance (float): maximum gap between events of different methods counted as one (s)
+        + min_votes (int): minimum number of agreeing methods, defaults to a majority of the methods run
+        + features (GaitFeatures): feature store of marker_traj, built here if None
+
+    Returns:
+        + gait_events (dict of np.array): fused hc/to indices, the values are the number of
+          agreeing methods
+        + agreement (pd.DataFrame): per method and event type, number of events, number and
+          fraction agreeing with the consensus, fraction of the consensus events the method
+          found (coverage) and mean absolute offset to the fused index (samples)
+    '''
+    if ge_methods is None:
+        ge_methods = CONSENSUS_METHODS
+    if features is None:
+        features = GaitFeatures(marker_traj, fs)
+
+    ge_methods = [m for m in ge_methods if features.available(GE_METHODS[m]['features'])]
+    if len(ge_methods) == 0:
+        raise ValueError('None of the consensus methods can run on the given markers.')
+    if min_votes is None:
+        min_votes = len(ge_methods)//2 + 1
+
+    method_events = [get_gait_event_mocap(marker_traj, task, m, fs = fs, features = features) for m in ge_methods]
+
+    gait_events = {}
+    agreement   = []
+    for event in ('hc', 'to'):
+        event_index_list = [np.asarray(e[event + '_index'], dtype = int) for e in method_events]
+        fused_index, votes, member_fused = fuse_events(event_index_list, int(round(tolerance*fs)), min_votes)
+
+        gait_events[event + '_index'] = fused_index
+        gait_events[event + '_value'] = votes
+
+        for ge_method, event_index, member in zip(ge_methods, event_index_list, member_fused):
+            agreed = member >= 0
+            offset = np.abs(event_index[agreed] - fused_index[member[agreed]])
+            agreement.append([ge_method, event, len(event_index), int(np.count_nonzero(agreed)),
+                              np.count_nonzero(agreed)/len(event_index) if len(event_index) else np.nan,
+                              len(np.unique(member[agreed]))/len(fused_index) if len(fused_index) else np.nan,
+                              offset.mean() if len(offset) else np.nan])
+
+    agreement = pd.DataFrame(agreement, columns = AGREEMENT_COLUMNS)
+
+    return gait_events, agreement
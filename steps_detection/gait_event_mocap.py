@@ -20,6 +20,8 @@ from utils import common, visualizer
 from utils.mt import constants_mt
 from utils.mocap import constants_mocap
 
+from gait_event_utils import sacrum_vec_angle_filter, run_length_forward, align_events, first_crossing
+
 
 # # --- Remove noisy peaks --- #
 # def remove_noisy_peaks_mocap(raw_index, raw_value, task):
@@ -74,41 +76,110 @@ def angle_between_vectors(v1, v2):
 
     return angle
 
+# --- Derived signals shared by the detectors --- #
+# name: (marker_traj keys needed, function of the feature store)
+GE_FEATURES = {
+    'heel_height':       (['heel_marker_y'], lambda f: -1*f.marker_traj['heel_marker_y']),
+    'toe_height':        (['toe_marker_y'], lambda f: -1*f.marker_traj['toe_marker_y']),
+    'toe_distance_z':    (['sacrum_marker_z', 'toe_marker_z'], lambda f: f.marker_traj['sacrum_marker_z'] - f.marker_traj['toe_marker_z']),
+    'heel_distance_z':   (['heel_marker_z', 'sacrum_marker_z'], lambda f: f.marker_traj['heel_marker_z'] - f.marker_traj['sacrum_marker_z']),
+    'foot_vel':          (['heel_marker_y', 'toe_marker_y'], lambda f: common.filter_signal(np.diff((f.marker_traj['heel_marker_y'] + f.marker_traj['toe_marker_y'])/2)/(1.0/f.fs), 7)),
+    'foot_vel_enhanced': (['heel_marker_y', 'toe_marker_y'], lambda f: foot_vel_peak_enhancement(f['foot_vel'])),
+    'heel_vel_z':        (['heel_marker_z'], lambda f: np.diff(f.marker_traj['heel_marker_z'])/(1.0/f.fs)),
+    'toe_vel_z':         (['toe_marker_z'], lambda f: np.diff(f.marker_traj['toe_marker_z'])/(1.0/f.fs)),
+    'sacrum_heading':    (['sacrum_marker1_x', 'sacrum_marker1_z', 'sacrum_marker2_x', 'sacrum_marker2_z'],
+                          lambda f: np.stack([f.marker_traj['sacrum_marker1_x'] - f.marker_traj['sacrum_marker2_x'],
+                                              f.marker_traj['sacrum_marker1_z'] - f.marker_traj['sacrum_marker2_z']], axis = 1)),
+}
+
+class GaitFeatures:
+    ''' Derived signals of one trial, computed on first use and reused by every detector
+
+    A store built with shared = the store of another leg of the same trial takes from it every
+    signal whose input trajectories are the same arrays in both marker_traj dicts (e.g. the
+    sacrum heading of get_marker_traj()), so those are computed once per trial, not per leg.
+
+    Usage:
+        features    = GaitFeatures(marker_traj, fs)
+        gait_events = ge_mix(marker_traj, fs, features = features)
+        heel_height = features['heel_height']
+    '''
+    def __init__(self, marker_traj, fs = 100, shared = None):
+        self.marker_traj = marker_traj
+        self.fs          = fs
+        self.shared      = shared
+        self.cache       = {}
+
+    def __getitem__(self, name):
+        if name not in self.cache:
+            if self.is_shared(name):
+                self.cache[name] = self.shared[name]
+            else:
+                self.cache[name] = GE_FEATURES[name][1](self)
+
+        return self.cache[name]
+
+    def is_shared(self, name):
+        ''' True if the shared store computes this signal from the very same trajectories
+        '''
+        if self.shared is None or self.shared.fs != self.fs:
+            return False
+        keys = GE_FEATURES[name][0]
+
+        return all(key in self.marker_traj and self.marker_traj[key] is self.shared.marker_traj.get(key) for key in keys)
+
+    def available(self, names):
+        ''' True if the marker trajectories needed by all these features are present
+        '''
+        return all(key in self.marker_traj for name in names for key in GE_FEATURES[name][0])
+
+    def compute(self, names):
+        for name in names:
+            self[name]
+
+
+# --- Drop candidate events where the sacrum heading flips (turns) --- #
+def sacrum_heading_filter(candidate_index, features, angle_thresh = 90):
+    ''' Batched sacrum-angle filter over the candidates of one event type
+
+    Args:
+        + candidate_index (np.array): candidate event indices from find_peaks
+        + features (GaitFeatures): feature store of the trial (sacrum_heading)
+        + angle_thresh (float): maximum heading change between consecutive candidates (deg)
+
+    Returns:
+        + keep (np.array of bool): mask over candidate_index, see gait_event_utils.sacrum_angle_filter
+    '''
+    return sacrum_vec_angle_filter(features['sacrum_heading'][candidate_index], angle_thresh = angle_thresh)
+
 
 # --- Identify heel-contact and toe-off events from the mocap data --- #
 # Method using the height of heel and toe markers
-def ge_heel_toe_height(marker_traj, fs = 100, correction = None, vis = False):
+def ge_heel_toe_height(marker_traj, fs = 100, correction = None, vis = False, features = None):
     ''' Obtain gait events from the height of heel and toe markers
     '''
+    if features is None:
+        features = GaitFeatures(marker_traj, fs)
+
     min_peak_distance_hc = fs*0.6
     min_peak_distance_to = fs*0.6
     gait_events = {'hc_index': [], 'hc_value': [], 'to_index': [], 'to_value': []}
 
     heel_marker_y                = marker_traj['heel_marker_y']
-    temp_hc_index, temp_hc_value = find_peaks(-1*heel_marker_y, height = [-1, 0], distance = min_peak_distance_hc)
+    temp_hc_index, temp_hc_value = find_peaks(features['heel_height'], height = [-1, 0], distance = min_peak_distance_hc)
     # hc_index                     = 1*temp_hc_index
     # hc_value                     = -1*temp_hc_value['peak_heights']
     # hc_index, hc_value           = remove_noisy_peaks_mocap(hc_index, hc_value, 'walking')
 
-    for i in range(1, len(temp_hc_index)):
-        prev_vec = np.array([marker_traj['sacrum_marker1_x'][temp_hc_index[i - 1]] - marker_traj['sacrum_marker2_x'][temp_hc_index[i - 1]], marker_traj['sacrum_marker1_z'][temp_hc_index[i - 1]] - marker_traj['sacrum_marker2_z'][temp_hc_index[i - 1]]])
-        curr_vec = np.array([marker_traj['sacrum_marker1_x'][temp_hc_index[i]] - marker_traj['sacrum_marker2_x'][temp_hc_index[i]], marker_traj['sacrum_marker1_z'][temp_hc_index[i]] - marker_traj['sacrum_marker2_z'][temp_hc_index[i]]])
-        angle    = angle_between_vectors(prev_vec, curr_vec)
-        if angle < 90:
-            gait_events['hc_index'].append(temp_hc_index[i])
-        # gait_events['hc_index'].append(temp_hc_index[i])
+    hc_keep                 = sacrum_heading_filter(temp_hc_index, features)
+    gait_events['hc_index'] = temp_hc_index[hc_keep]
 
 
     toe_marker_y                 = marker_traj['toe_marker_y']
-    temp_to_index, temp_to_value = find_peaks(-1*toe_marker_y, height = [-1, 0], distance = min_peak_distance_to)
+    temp_to_index, temp_to_value = find_peaks(features['toe_height'], height = [-1, 0], distance = min_peak_distance_to)
 
-    for i in range(1, len(temp_to_index)):
-        prev_vec = np.array([marker_traj['sacrum_marker1_x'][temp_to_index[i - 1]] - marker_traj['sacrum_marker2_x'][temp_to_index[i - 1]], marker_traj['sacrum_marker1_z'][temp_to_index[i - 1]] - marker_traj['sacrum_marker2_z'][temp_to_index[i - 1]]])
-        curr_vec = np.array([marker_traj['sacrum_marker1_x'][temp_to_index[i]] - marker_traj['sacrum_marker2_x'][temp_to_index[i]], marker_traj['sacrum_marker1_z'][temp_to_index[i]] - marker_traj['sacrum_marker2_z'][temp_to_index[i]]])
-        angle    = angle_between_vectors(prev_vec, curr_vec)
-        if angle < 90:
-            gait_events['to_index'].append(temp_to_index[i])
-        # gait_events['to_index'].append(temp_to_index[i])
+    to_keep                 = sacrum_heading_filter(temp_to_index, features)
+    gait_events['to_index'] = temp_to_index[to_keep]
 
     if correction == 'eric_lauren_correction':
         to_index, to_value = eric_lauren_correction(temp_to_index, -1*temp_to_value['peak_heights'], toe_marker_y, fs)
@@ -135,20 +206,15 @@ def ge_heel_toe_height(marker_traj, fs = 100, correction = None, vis = False):
 
 def eric_lauren_correction(near_to_index, temp_to_value, toe_marker_y, fs = 100):
     ''' Eric and Lauren correction when using metatarsal instead of toe markers
+
+    Toe-off is moved to the first sample at or after each candidate where the toe velocity
+    exceeds 0.2; candidates without such a sample are dropped.
     '''
     toe_marker_y_vel = np.diff(toe_marker_y)/(1.0/fs)
 
-    to_index = []
-    to_value = []
-    for m in range(len(near_to_index)):
-        for g in range(near_to_index[m], len(toe_marker_y_vel)):
-            if toe_marker_y_vel[g] > 0.2:
-                to_index.append(g)
-                to_value.append(temp_to_value[m])
-                break
-
-    to_index = np.array(to_index)
-    to_value = np.array(to_value)
+    to_index, found = first_crossing(near_to_index, toe_marker_y_vel, 0.2)
+    to_index        = to_index[found]
+    to_value        = np.asarray(temp_to_value)[found]
 
     return to_index, to_value
 
@@ -161,60 +227,55 @@ def vu_correction(near_to_index, temp_to_value, toe_marker_y, fs = 100):
     toe_marker_y_vel = np.diff(toe_marker_y)/(1.0/fs)
     temp_to_index, _ = find_peaks(toe_marker_y_vel, height = 0)
 
-    to_index = []
-    to_value = []
-    for i in range(len(near_to_index)):
-        id = np.where(temp_to_index > near_to_index[i])[0][0]
-        if (temp_to_index[id] - near_to_index[i]) < 0.2*fs:
-            slope = (toe_marker_y_vel[temp_to_index[id]] - toe_marker_y_vel[near_to_index[i]])/(temp_to_index[id] - near_to_index[i])
-            to_index.append(near_to_index[i] + int(alpha*slope))
-        else:
-            to_index.append(near_to_index[i])
-        
-        to_value.append(temp_to_value[i])
-
-    to_index = np.array(to_index)
-    to_value = np.array(to_value)
+    # first velocity peak after each candidate
+    position, found = align_events(near_to_index, temp_to_index, direction = 'next')
+    if not found.all():
+        raise IndexError('No toe velocity peak after toe-off candidate ' + str(near_to_index[~found][0]))
+    peak_index = temp_to_index[position]
+
+    distance = peak_index - near_to_index
+    slope    = (toe_marker_y_vel[peak_index] - toe_marker_y_vel[near_to_index])/distance
+    close    = distance < 0.2*fs
+    # a NaN slope (marker gap) cannot be cast to a frame shift, as int() refused it before
+    not_finite = close & ~np.isfinite(slope)
+    if not_finite.any():
+        raise ValueError('Toe velocity slope is not finite at toe-off candidate ' + str(near_to_index[not_finite][0]))
+    shift    = np.where(close, alpha*slope, 0).astype(int)
+    to_index = near_to_index + shift
+    to_value = np.asarray(temp_to_value)[:len(near_to_index)]
 
     return to_index, to_value
 
 # Method using the height of heel markers and distance between toe/metatarsal markers to the sacrum
-def ge_mix(marker_traj, fs = 100, vis = False, task = 'walking'):
+def ge_mix(marker_traj, fs = 100, vis = False, task = 'walking', features = None):
     ''' Obtain gait events from the height of heel markers and distance between toe/metatarsal markers to the sacrum
     '''
+    if features is None:
+        features = GaitFeatures(marker_traj, fs)
+
     min_peak_distance_hc = fs*0.5
     min_peak_distance_to = fs*0.5
     gait_events = {'hc_index': [], 'hc_value': [], 'to_index': [], 'to_value': []}
 
     heel_marker_y                = marker_traj['heel_marker_y']
-    temp_hc_index, temp_hc_value = find_peaks(-1*heel_marker_y, height = [-1, 0], distance = min_peak_distance_hc)
+    temp_hc_index, temp_hc_value = find_peaks(features['heel_height'], height = [-1, 0], distance = min_peak_distance_hc)
     # hc_index                     = 1*temp_hc_index
     # hc_value                     = -1*temp_hc_value['peak_heights']
 
-    for i in range(1, len(temp_hc_index)):
-        prev_vec = np.array([marker_traj['sacrum_marker1_x'][temp_hc_index[i - 1]] - marker_traj['sacrum_marker2_x'][temp_hc_index[i - 1]], marker_traj['sacrum_marker1_z'][temp_hc_index[i - 1]] - marker_traj['sacrum_marker2_z'][temp_hc_index[i - 1]]])
-        curr_vec = np.array([marker_traj['sacrum_marker1_x'][temp_hc_index[i]] - marker_traj['sacrum_marker2_x'][temp_hc_index[i]], marker_traj['sacrum_marker1_z'][temp_hc_index[i]] - marker_traj['sacrum_marker2_z'][temp_hc_index[i]]])
-        angle    = angle_between_vectors(prev_vec, curr_vec)
-        if angle < 90:
-            gait_events['hc_index'].append(temp_hc_index[i])
+    hc_keep                 = sacrum_heading_filter(temp_hc_index, features)
+    gait_events['hc_index'] = temp_hc_index[hc_keep]
 
-    toe_marker_z                 = marker_traj['toe_marker_z']
-    sacrum_marker_z              = marker_traj['sacrum_marker_z']
     if task == 'treadmill_walking':
-        toe_distance_z               = sacrum_marker_z - toe_marker_z
+        toe_distance_z               = features['toe_distance_z']
         temp_to_index, temp_to_value = find_peaks(toe_distance_z, height = [0, 1], distance = min_peak_distance_to)
     elif task == 'walking':
-        toe_distance_z               = abs(sacrum_marker_z - toe_marker_z) # modification for overground walking
+        toe_distance_z               = abs(features['toe_distance_z']) # modification for overground walking
         temp_to_index, temp_to_value = find_peaks(toe_distance_z, height = [0.05, 0.2], distance = min_peak_distance_to)
     # to_index                     = 1*temp_to_index
     # to_value                     = 1*temp_to_value['peak_heights']
 
-    for i in range(1, len(temp_to_index)):
-        prev_vec = np.array([marker_traj['sacrum_marker1_x'][temp_to_index[i - 1]] - marker_traj['sacrum_marker2_x'][temp_to_index[i - 1]], marker_traj['sacrum_marker1_z'][temp_to_index[i - 1]] - marker_traj['sacrum_marker2_z'][temp_to_index[i - 1]]])
-        curr_vec = np.array([marker_traj['sacrum_marker1_x'][temp_to_index[i]] - marker_traj['sacrum_marker2_x'][temp_to_index[i]], marker_traj['sacrum_marker1_z'][temp_to_index[i]] - marker_traj['sacrum_marker2_z'][temp_to_index[i]]])
-        angle    = angle_between_vectors(prev_vec, curr_vec)
-        if angle < 90:
-            gait_events['to_index'].append(temp_to_index[i])
+    to_keep                 = sacrum_heading_filter(temp_to_index, features)
+    gait_events['to_index'] = temp_to_index[to_keep]
 
     # gait_events['hc_index'] = hc_index
     # gait_events['hc_value'] = hc_value
@@ -231,23 +292,22 @@ def ge_mix(marker_traj, fs = 100, vis = False, task = 'walking'):
     return gait_events
 
 # Method using the distance from heel and toe/metatarsal markers to the sacrum
-def ge_heel_toe_sacrum(marker_traj, fs = 100, vis = False):
+def ge_heel_toe_sacrum(marker_traj, fs = 100, vis = False, features = None):
     ''' Obtain gait events from the distance between heel and toe/metatarsal markers to the sacrum
     '''
+    if features is None:
+        features = GaitFeatures(marker_traj, fs)
+
     min_peak_distance_hc = fs*0.5
     min_peak_distance_to = fs*0.5
     gait_events = {'hc_index': [], 'hc_value': [], 'to_index': [], 'to_value': []}
 
-    heel_marker_z = marker_traj['heel_marker_z']
-    toe_marker_z  = marker_traj['toe_marker_z']
-    sacrum_marker_z = marker_traj['sacrum_marker_z']
-
-    heel_distance_z = heel_marker_z - sacrum_marker_z
+    heel_distance_z = features['heel_distance_z']
     temp_hc_index, temp_hc_value = find_peaks(heel_distance_z, height = [0, 1], distance = min_peak_distance_hc)
     hc_index                     = 1*temp_hc_index
     hc_value                     = 1*temp_hc_value['peak_heights']
 
-    toe_distance_z = sacrum_marker_z - toe_marker_z
+    toe_distance_z = features['toe_distance_z']
     temp_to_index, temp_to_value = find_peaks(toe_distance_z, height = [0, 1], distance = min_peak_distance_to)
     to_index                     = 1*temp_to_index
     to_value                     = 1*temp_to_value['peak_heights']
@@ -266,50 +326,55 @@ def ge_heel_toe_sacrum(marker_traj, fs = 100, vis = False):
 # Peak enhancement before detection
 def foot_vel_peak_enhancement(foot_center_y_vel, vis = False):
     ''' Enhance toe-off peaks for detection
-    '''
-    INCREASE   = .05
-    gain_arr   = []
-    gain       = 1
-    direction  = 1
-    num_sample = len(foot_center_y_vel)
-
-    foot_center_y_vel_enhanced = []
-    for i in range(num_sample - 1):
-        curr_vel = foot_center_y_vel[i]
-        next_vel = foot_center_y_vel[i + 1]
-
-        if curr_vel >= 0:
-            gain += INCREASE*direction
-            if next_vel - curr_vel >= 0:
-                direction = 1
-            else:
-                direction = -1
-        else:
-            gain = 1.0
-
-        foot_center_y_vel_enhanced.append(curr_vel*gain)
-        gain_arr.append(gain)
 
-    foot_center_y_vel_enhanced = np.array(foot_center_y_vel_enhanced)
+    The gain grows by INCREASE*direction on every non-negative sample, direction being +1/-1
+    from the slope at the previous non-negative sample, and is reset to 1 on negative samples.
+    Each run of non-negative samples is one cumulative sum, so the loop is over runs, not samples.
+    '''
+    INCREASE          = .05
+    foot_center_y_vel = np.asarray(foot_center_y_vel)
+    num_sample        = len(foot_center_y_vel)
+    if num_sample < 2:
+        return np.array([])
+
+    curr_vel = foot_center_y_vel[:-1]
+    next_vel = foot_center_y_vel[1:]
+    positive = curr_vel >= 0
+
+    # direction set at each non-negative sample, used by the next non-negative one
+    step_direction = np.where(next_vel - curr_vel >= 0, 1, -1)
+    last_set       = np.maximum.accumulate(np.where(positive, np.arange(num_sample - 1), -1))
+    last_set       = np.concatenate([[-1], last_set[:-1]])
+    direction      = np.where(last_set >= 0, step_direction[np.maximum(last_set, 0)], 1)
+
+    # same left-to-right float additions as gain += INCREASE*direction
+    gain      = np.ones(num_sample - 1)
+    increment = INCREASE*direction
+    edges     = np.diff(np.concatenate([[False], positive, [False]]).astype(np.int8))
+    for start, stop in zip(np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)):
+        run    = increment[start:stop].copy()
+        run[0] += 1.0
+        np.add.accumulate(run, out = gain[start:stop])
+
+    foot_center_y_vel_enhanced = curr_vel*gain
 
     # if vis:
-    #     visualizer.plot_foot_vel_enhancement(foot_center_y_vel_enhanced, foot_center_y_vel, gain_arr)
+    #     visualizer.plot_foot_vel_enhancement(foot_center_y_vel_enhanced, foot_center_y_vel, gain)
 
     return foot_center_y_vel_enhanced
 
-def ge_foot_vel(marker_traj, fs = 100, vis = False):
+def ge_foot_vel(marker_traj, fs = 100, vis = False, features = None):
     ''' Obtain gait events from foot velocity in the vertical direction
     '''
+    if features is None:
+        features = GaitFeatures(marker_traj, fs)
+
     min_peak_distance_hc = fs*0.1
     min_peak_distance_to = fs*0.5
     gait_events = {'hc_index': [], 'hc_value': [], 'to_index': [], 'to_value': []}
 
-    heel_marker_y       = marker_traj['heel_marker_y']
-    toe_marker_y        = marker_traj['toe_marker_y']
-    foot_center_y       = (heel_marker_y + toe_marker_y)/2
-    foot_center_y_vel_r = np.diff(foot_center_y)/(1.0/fs)
-    foot_center_y_vel   = common.filter_signal(foot_center_y_vel_r, 7)
-    foot_center_y_vel_  = foot_vel_peak_enhancement(foot_center_y_vel, vis)
+    foot_center_y_vel   = features['foot_vel']
+    foot_center_y_vel_  = features['foot_vel_enhanced']
 
     temp_hc_index, temp_hc_value = find_peaks(-1*foot_center_y_vel_, height = [0.1, 1], distance = min_peak_distance_hc)
     hc_index                     = 1*temp_hc_index
@@ -320,16 +385,13 @@ def ge_foot_vel(marker_traj, fs = 100, vis = False):
     to_index                     = 1*temp_to_index
     to_value                     = 1*temp_to_value['peak_heights']
 
-    for id in to_index:
-        try:
-            temp_id = np.where(hc_index < id)[0][-1]
-            gait_events['hc_index'].append(hc_index[temp_id])
-            gait_events['hc_value'].append(hc_value[temp_id])
-        except:
-            print('...mid swing with no stance following detected...')
+    # last heel contact before each toe-off
+    position, found = align_events(to_index, hc_index, direction = 'previous')
+    if not found.all():
+        print('...mid swing with no stance following detected... (' + str(np.count_nonzero(~found)) + ' toe-off)')
 
-    gait_events['hc_index'] = np.array(gait_events['hc_index'])
-    gait_events['hc_value'] = np.array(gait_events['hc_value'])
+    gait_events['hc_index'] = hc_index[position[found]]
+    gait_events['hc_value'] = hc_value[position[found]]
     gait_events['to_index'] = to_index
     gait_events['to_value'] = to_value
 
@@ -340,32 +402,48 @@ def ge_foot_vel(marker_traj, fs = 100, vis = False):
 
 # Method using heel and toe velocity
 # TODO: Need validation
-def ge_heel_toe_vel(marker_traj, fs = 100, vis = False):
-    gait_events = {'hc_index': [], 'hc_value': [], 'to_index': [], 'to_value': []}
+def ge_heel_toe_vel(marker_traj, fs = 100, vis = False, window = 20, threshold = 0.0, features = None):
+    ''' Obtain gait events from the vertical velocity of heel and toe markers
+
+    Toe-off: toe velocity below threshold followed by window - 1 samples above it.
+    Heel contact: window samples of heel velocity above threshold followed by one below it.
+    Both conditions are read from the run lengths of velocity > threshold, computed once.
+
+    Args:
+        + marker_traj (dict of np.array): heel_marker_z and toe_marker_z trajectories
+        + fs (int): sampling rate
+        + window (int): number of samples the velocity must stay above threshold, at least 1
+        + threshold (float): velocity threshold
+        + features (GaitFeatures): shared feature store of the trial, built here if None
+
+    Returns:
+        + gait_events (dict of np.array): hc/to indices, values are 0
+    '''
+    if window < 1:
+        raise ValueError('window must be at least 1 sample, got ' + str(window))
 
-    threshold = 0.0
-    window    = 20
+    if features is None:
+        features = GaitFeatures(marker_traj, fs)
 
-    heel_marker_z     = marker_traj['heel_marker_z']
-    heel_marker_z_vel = np.diff(heel_marker_z)/(1.0/fs)
+    gait_events = {'hc_index': [], 'hc_value': [], 'to_index': [], 'to_value': []}
 
-    toe_marker_z      = marker_traj['toe_marker_z']
-    toe_marker_z_vel  = np.diff(toe_marker_z)/(1.0/fs)
+    heel_marker_z_vel = features['heel_vel_z']
+    toe_marker_z_vel  = features['toe_vel_z']
 
-    for i in range(len(heel_marker_z_vel) - window):
-        if (toe_marker_z_vel[i] < threshold) and (toe_marker_z_vel[i + 1:i + window] > threshold).all():
-            gait_events['to_index'].append(i + 1 + 1)
-            gait_events['to_value'].append(0)
+    # candidate samples i, so that i + window is still a velocity sample
+    num_candidate = max(len(heel_marker_z_vel) - window, 0)
+    i             = np.arange(num_candidate)
 
-        if (heel_marker_z_vel[i:i + window] > threshold).all() and (heel_marker_z_vel[i + window] < threshold):
-            gait_events['hc_index'].append(i + window + 1)
-            gait_events['hc_value'].append(0)
+    toe_above     = run_length_forward(toe_marker_z_vel > threshold)
+    to_candidate  = (toe_marker_z_vel[:num_candidate] < threshold) & (toe_above[i + 1] >= window - 1)
 
-    gait_events['hc_index'] = np.array(gait_events['hc_index'])
-    gait_events['hc_value'] = np.array(gait_events['hc_value'])
-    gait_events['to_index'] = np.array(gait_events['to_index'])
-    gait_events['to_value'] = np.array(gait_events['to_value'])
+    heel_above    = run_length_forward(heel_marker_z_vel > threshold)
+    hc_candidate  = (heel_above[:num_candidate] >= window) & (heel_marker_z_vel[i + window] < threshold)
 
+    gait_events['to_index'] = np.flatnonzero(to_candidate) + 1 + 1
+    gait_events['to_value'] = np.zeros(len(gait_events['to_index']), dtype = int)
+    gait_events['hc_index'] = np.flatnonzero(hc_candidate) + window + 1
+    gait_events['hc_value'] = np.zeros(len(gait_events['hc_index']), dtype = int)
 
     if vis:
         visualizer.plot_gait_events_mocap(heel_marker_z_vel, toe_marker_z_vel, gait_events)
@@ -373,32 +451,58 @@ def ge_heel_toe_vel(marker_traj, fs = 100, vis = False):
     return gait_events
 
 
-def get_gait_event_mocap(marker_traj, task, ge_method, correction = None, fs = 100, vis = False):
+# --- Detector registry --- #
+# ge_method: detector, derived signals it reads, runtime arguments it takes, fixed arguments
+GE_METHODS = {}
+
+def register_ge_method(ge_method, detector, features, args = (), **fixed_kwargs):
+    ''' Register a gait event detector for get_gait_event_mocap
+
+    Args:
+        + ge_method (str): method name, e.g. constants_mocap.GE_METHOD_MIX
+        + detector (function): detector(marker_traj, fs = fs, vis = vis, features = features, ...)
+        + features (list of str): GE_FEATURES names the detector reads
+        + args (tuple of str): runtime arguments passed through, among 'task' and 'correction'
+        + fixed_kwargs: arguments always passed with the same value
+    '''
+    GE_METHODS[ge_method] = {'detector': detector, 'features': list(features), 'args': tuple(args), 'kwargs': fixed_kwargs}
+
+register_ge_method(constants_mocap.GE_METHOD_HEEL_TOE_HEIGHT, ge_heel_toe_height, ['heel_height', 'toe_height', 'sacrum_heading'], correction = None)
+register_ge_method(constants_mocap.GE_METHOD_MIX, ge_mix, ['heel_height', 'toe_distance_z', 'sacrum_heading'], args = ('task',))
+register_ge_method(constants_mocap.GE_METHOD_HEEL_TOE_SACRUM, ge_heel_toe_sacrum, ['heel_distance_z', 'toe_distance_z'])
+register_ge_method(constants_mocap.GE_METHOD_FOOT_VEL, ge_foot_vel, ['foot_vel', 'foot_vel_enhanced'])
+register_ge_method(constants_mocap.GE_METHOD_HEEL_TOE_VEL, ge_heel_toe_vel, ['heel_vel_z', 'toe_vel_z'])
+register_ge_method(constants_mocap.GE_METHOD_HEEL_TOE_HEIGHT_C, ge_heel_toe_height, ['heel_height', 'toe_height', 'sacrum_heading'], args = ('correction',))
+
+
+def get_gait_event_mocap(marker_traj, task, ge_method, correction = None, fs = 100, vis = False, features = None):
     ''' Obtain heel contact and toe-off events
 
     Args:
         + marker_traj (dict of np.array): necessary markers for gait event identification
         + task (str): 'walking' or 'treadmill_walking'
-        + ge_method (str): method for gait detection
+        + ge_method (str): method for gait detection, a key of GE_METHODS
         + correction (str): method for correction, None if no correction applied
         + fs (int): sampling rate
         + vis (boolean): set True to visualize peak detection
+        + features (GaitFeatures): feature store of marker_traj, pass the same one to several
+          methods to compute the shared signals once
 
     Returns:
         + gait_events (dict of np.array): index and value arrays of heel strike and toe-offs
     '''
-    if ge_method == constants_mocap.GE_METHOD_HEEL_TOE_HEIGHT:
-        gait_events = ge_heel_toe_height(marker_traj, correction = None, fs = fs, vis = vis)
-    elif ge_method == constants_mocap.GE_METHOD_MIX:
-        gait_events = ge_mix(marker_traj, fs = fs, vis = vis, task = task)
-    elif ge_method == constants_mocap.GE_METHOD_HEEL_TOE_SACRUM:
-        gait_events = ge_heel_toe_sacrum(marker_traj, fs = fs, vis = vis)
-    elif ge_method == constants_mocap.GE_METHOD_FOOT_VEL:
-        gait_events = ge_foot_vel(marker_traj, fs = fs, vis = vis)
-    elif ge_method == constants_mocap.GE_METHOD_HEEL_TOE_VEL:
-        gait_events = ge_heel_toe_vel(marker_traj, fs = fs, vis = vis)
-    elif ge_method == constants_mocap.GE_METHOD_HEEL_TOE_HEIGHT_C:
-        gait_events = ge_heel_toe_height(marker_traj, correction = correction, fs = fs, vis = vis)
+    if ge_method not in GE_METHODS:
+        raise ValueError('Unsupported gait detection method: ' + str(ge_method))
+    method = GE_METHODS[ge_method]
+
+    if features is None:
+        features = GaitFeatures(marker_traj, fs)
+
+    runtime_args = {'task': task, 'correction': correction}
+    kwargs       = {arg: runtime_args[arg] for arg in method['args']}
+    kwargs.update(method['kwargs'])
+
+    gait_events = method['detector'](marker_traj, fs = fs, vis = vis, features = features, **kwargs)
 
     return gait_events
 
@@ -424,12 +528,17 @@ def select_ge_method(marker_list):
 
 
 # Get marker trajectory based on the selected ge method
+# methods whose trajectories get_marker_traj builds from the synchronized mocap columns
+MARKER_TRAJ_GE_METHODS = (constants_mocap.GE_METHOD_HEEL_TOE_HEIGHT,
+                          constants_mocap.GE_METHOD_HEEL_TOE_HEIGHT_C,
+                          constants_mocap.GE_METHOD_MIX)
+
 def get_marker_traj(s_mocap_data, ge_method, id_target_leg, id_adjacent_leg):
     ''' Get marker trajectory for gait event detection 
 
     Args:
         + s_mocap_data (pd.DataFrame): synchronized mocap data
-        + ge_method (int): selected method for gait event detection
+        + ge_method (int): selected method for gait event detection, one of MARKER_TRAJ_GE_METHODS
         + id_target_leg (str): target leg
         + id_adjacent_leg (str): adjacent leg
 
@@ -437,6 +546,9 @@ def get_marker_traj(s_mocap_data, ge_method, id_target_leg, id_adjacent_leg):
         + marker_traj_target (dict of np.array): marker trajectory for gait event detection of the target leg
         + marker_traj_adjacent (dict of np.array): marker trajectory for gait event detection of the adjacent leg
     '''
+    if ge_method not in MARKER_TRAJ_GE_METHODS:
+        raise ValueError('No marker trajectory for gait detection method: ' + str(ge_method))
+
     heel_y_target   = s_mocap_data[id_target_leg.upper() + 'CAL Y'].to_numpy()
     heel_y_adjacent = s_mocap_data[id_adjacent_leg.upper() + 'CAL Y'].to_numpy()
 
@@ -446,7 +558,7 @@ def get_marker_traj(s_mocap_data, ge_method, id_target_leg, id_adjacent_leg):
     sacrum_x_adjacent = s_mocap_data[id_adjacent_leg.upper() + 'PS2 X'].to_numpy()
     sacrum_z_adjacent = s_mocap_data[id_adjacent_leg.upper() + 'PS2 Z'].to_numpy()
 
-    if ge_method == constants_mocap.GE_METHOD_HEEL_TOE_HEIGHT:
+    if ge_method in (constants_mocap.GE_METHOD_HEEL_TOE_HEIGHT, constants_mocap.GE_METHOD_HEEL_TOE_HEIGHT_C):
         toe_y_target         = s_mocap_data[id_target_leg.upper() + 'TOE Y'].to_numpy()
         toe_y_adjacent       = s_mocap_data[id_adjacent_leg.upper() + 'TOE Y'].to_numpy()
         marker_traj_target   = {'heel_marker_y': heel_y_target,
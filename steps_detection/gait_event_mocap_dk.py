@@ -5,7 +5,8 @@ angle_event_detection.py
 
 Self-contained angle-based detection of heel contact (HC) and toe off (TO).
 Replicates the logic in the original "gait_event_mocap.py" code, but
-without external dependencies.
+without external dependencies (only numpy/scipy and the sibling
+gait_event_utils.py, which holds the shared sacrum-angle filter).
 
 Core steps:
 1) Find local minima in heel (HC) and toe (TO) signals, using find_peaks() on -1*marker_y.
@@ -19,6 +20,8 @@ just the angle-based filter.
 import numpy as np
 from scipy.signal import find_peaks
 
+from gait_event_utils import sacrum_angle_filter
+
 def angle_between_vectors(v1, v2):
     """
     Calculate the angle (in degrees) between two 2D vectors v1 and v2.
@@ -87,28 +90,15 @@ def detect_heel_toe_with_angle(
     hc_values = inv_heel[hc_indices]  # these are the inverted peaks
 
     # 2) Filter them by sacrum angle
-    #    We'll replicate the "for i in range(1, len(temp_hc_index))" approach:
-    #    keep event i if angle < angle_thresh_deg w.r.t. event (i-1).
-    #    Note: the original code constructs 2D vectors from (x1,z1) - (x2,z2).
-
-    filtered_hc_indices = []
-    filtered_hc_values  = []
-    for i in range(1, len(hc_indices)):
-        prev_idx = hc_indices[i - 1]
-        curr_idx = hc_indices[i]
-
-        prev_vec = [
-            sacrum_marker1_x[prev_idx] - sacrum_marker2_x[prev_idx],
-            sacrum_marker1_z[prev_idx] - sacrum_marker2_z[prev_idx]
-        ]
-        curr_vec = [
-            sacrum_marker1_x[curr_idx] - sacrum_marker2_x[curr_idx],
-            sacrum_marker1_z[curr_idx] - sacrum_marker2_z[curr_idx]
-        ]
-        angle = angle_between_vectors(prev_vec, curr_vec)
-        if angle < angle_thresh_deg:
-            filtered_hc_indices.append(curr_idx)
-            filtered_hc_values.append(inv_heel[curr_idx])
+    #    Same rule as the original "for i in range(1, len(temp_hc_index))" loop:
+    #    keep event i if angle < angle_thresh_deg w.r.t. candidate (i-1), computed
+    #    for all candidates at once. Vectors are 2D (x1,z1) - (x2,z2).
+    hc_keep = sacrum_angle_filter(
+        hc_indices, sacrum_marker1_x, sacrum_marker1_z, sacrum_marker2_x, sacrum_marker2_z,
+        angle_thresh=angle_thresh_deg, min_norm=1e-12
+    )
+    filtered_hc_indices = hc_indices[hc_keep]
+    filtered_hc_values  = inv_heel[filtered_hc_indices]
 
     # 3) Find potential toe offs
     to_indices, to_props = find_peaks(
@@ -117,24 +107,12 @@ def detect_heel_toe_with_angle(
     to_values = inv_toe[to_indices]
 
     # Filter them with the same sacrum angle approach
-    filtered_to_indices = []
-    filtered_to_values  = []
-    for i in range(1, len(to_indices)):
-        prev_idx = to_indices[i - 1]
-        curr_idx = to_indices[i]
-
-        prev_vec = [
-            sacrum_marker1_x[prev_idx] - sacrum_marker2_x[prev_idx],
-            sacrum_marker1_z[prev_idx] - sacrum_marker2_z[prev_idx]
-        ]
-        curr_vec = [
-            sacrum_marker1_x[curr_idx] - sacrum_marker2_x[curr_idx],
-            sacrum_marker1_z[curr_idx] - sacrum_marker2_z[curr_idx]
-        ]
-        angle = angle_between_vectors(prev_vec, curr_vec)
-        if angle < angle_thresh_deg:
-            filtered_to_indices.append(curr_idx)
-            filtered_to_values.append(inv_toe[curr_idx])
+    to_keep = sacrum_angle_filter(
+        to_indices, sacrum_marker1_x, sacrum_marker1_z, sacrum_marker2_x, sacrum_marker2_z,
+        angle_thresh=angle_thresh_deg, min_norm=1e-12
+    )
+    filtered_to_indices = to_indices[to_keep]
+    filtered_to_values  = inv_toe[filtered_to_indices]
 
     if print_debug:
         print(f"[DEBUG] Original HC candidates: {hc_indices}")
@@ -0,0 +1,225 @@
+# name: gait_event_store.py
+# description: append-only columnar store of detected gait events, indexed by subject and
+#              trial, the handoff between event detection and angle extraction
+# layout: <store>/trial_id.i32, leg.u8, event.u8, frame.i32, value.f32 (one raw column per file,
+#         one row per event) and <store>/trials.jsonl (one line per trial: subject, trial,
+#         first row, row count and the trial metadata such as fs and timestep_sec) and
+#         <store>/.lock (appends hold an exclusive lock on it)
+
+
+import os
+import json
+try:
+    import fcntl
+except ImportError:
+    # no advisory file locks (Windows): one writer per store at a time
+    fcntl = None
+
+import numpy as np
+import pandas as pd
+
+from gait_event_utils import EVENT_NAMES, EVENT_TABLE_COLUMNS, gait_events_to_columns
+
+
+STORE_COLUMNS = {'trial_id': np.int32,
+                 'leg': np.uint8,
+                 'event': np.uint8,
+                 'frame': np.int32,
+                 'value': np.float32}
+
+STORE_EXTENSIONS = {np.int32: '.i32', np.uint8: '.u8', np.float32: '.f32'}
+
+EVENT_CODES = {name: code for code, name in EVENT_NAMES.items()}
+
+
+def column_path(store_path, name):
+    return os.path.join(store_path, name + STORE_EXTENSIONS[STORE_COLUMNS[name]])
+
+
+# --- Event store --- #
+class GaitEventStore:
+    ''' Append-only gait event store
+
+    Events of one trial are written as one contiguous block sorted by leg, event and frame, so a
+    query reads only the blocks of the selected trials (memory-mapped) and finds the frame range
+    with a binary search. A trial is visible once its line is in trials.jsonl, which is written
+    after its columns: rows left by an interrupted append are ignored and overwritten by the next
+    one. A trial appended again with overwrite = True supersedes its earlier block (the latest
+    line of a subject / trial wins), the old rows stay in the columns.
+
+    Appends from several processes are serialized with an exclusive lock on <store>/.lock
+    (fcntl.flock, POSIX), and each append re-reads trials.jsonl under the lock. Without fcntl the
+    store supports a single writer at a time.
+
+    Args:
+        + store_path (str): store directory, created if missing
+    '''
+    def __init__(self, store_path):
+        self.store_path = store_path
+        self.index_path = os.path.join(store_path, 'trials.jsonl')
+        self.lock_path  = os.path.join(store_path, '.lock')
+        os.makedirs(store_path, exist_ok = True)
+        self.load_index()
+
+    def load_index(self):
+        # trials.jsonl -> trials, by_key (latest trial_id of each subject / trial) and num_rows
+        self.trials = []
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as f:
+                self.trials = [json.loads(line) for line in f if line.strip()]
+
+        self.by_key = {(t['subject'], t['trial']): t['trial_id'] for t in self.trials}
+        self.num_rows = self.trials[-1]['start'] + self.trials[-1]['count'] if self.trials else 0
+
+    # --- Write --- #
+    def append(self, subject, trial, gait_events, fs, overwrite = False, **meta):
+        ''' Append the events of one trial
+
+        Args:
+            + subject (str): subject label, e.g. the B3D / C3D file name
+            + trial (str or int): trial label within the subject
+            + gait_events (dict): gait_events dict of get_gait_event_mocap (one leg), or leg label ->
+              gait_events dict
+            + fs (float): sampling rate
+            + overwrite (bool): supersede the trial if it is already in the store, otherwise raise
+            + meta: other JSON-serializable trial metadata (source path, trial_index, timestep_sec, ...)
+
+        Returns:
+            + trial_id (int): id of the trial in the store
+        '''
+        if fcntl is None:
+            return self.append_unlocked(subject, trial, gait_events, fs, overwrite, meta)
+
+        with open(self.lock_path, 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                # another writer may have appended since this store was opened
+                self.load_index()
+                return self.append_unlocked(subject, trial, gait_events, fs, overwrite, meta)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def append_unlocked(self, subject, trial, gait_events, fs, overwrite, meta):
+        # append of one trial, the caller holds the store lock
+        trial = int(trial) if isinstance(trial, (int, np.integer)) else str(trial)
+        key   = (str(subject), trial)
+        if key in self.by_key and not overwrite:
+            raise ValueError(f'Trial {trial} of subject {subject} is already in the store.')
+
+        if 'hc_index' in gait_events:
+            gait_events = {'': gait_events}
+        legs     = list(gait_events.keys())
+        trial_id = len(self.trials)
+        columns  = [gait_events_to_columns(gait_events[leg], trial_id, leg_code) for leg_code, leg in enumerate(legs)]
+        block    = {name: np.concatenate([c[name] for c in columns]) for name in STORE_COLUMNS}
+
+        order = np.lexsort((block['frame'], block['event'], block['leg']))
+        for name, dtype in STORE_COLUMNS.items():
+            values = np.ascontiguousarray(block[name][order], dtype = dtype)
+            with open(column_path(self.store_path, name), 'ab') as f:
+                # drop rows of an interrupted append before writing
+                f.truncate(self.num_rows*values.itemsize)
+                f.write(values.tobytes())
+
+        entry = dict(meta, subject = str(subject), trial = trial, trial_id = trial_id, legs = legs,
+                     fs = float(fs), start = self.num_rows, count = len(order))
+        with open(self.index_path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+        self.trials.append(entry)
+        self.by_key[key] = trial_id
+        self.num_rows += len(order)
+
+        return trial_id
+
+    # --- Read --- #
+    def trial_table(self):
+        ''' One row per trial with its metadata, superseded trials left out '''
+        return pd.DataFrame([self.trials[trial_id] for trial_id in self.trial_ids()])
+
+    def trial_ids(self, subject = None, trial = None):
+        ''' Ids of the trials of a subject (all subjects if None), or of one trial '''
+        if subject is not None and trial is not None:
+            key = (str(subject), int(trial) if isinstance(trial, (int, np.integer)) else str(trial))
+            return [self.by_key[key]] if key in self.by_key else []
+
+        return [t['trial_id'] for t in self.trials
+                if self.by_key[(t['subject'], t['trial'])] == t['trial_id'] and (subject is None or t['subject'] == str(subject))]
+
+    def trial_meta(self, subject, trial):
+        ''' Metadata of one trial (fs, timestep_sec, source path, ...) '''
+        return self.trials[self.trial_ids(subject, trial)[0]]
+
+    def read_columns(self, start, stop):
+        # rows [start, stop) of every column, memory-mapped
+        columns = {}
+        for name, dtype in STORE_COLUMNS.items():
+            if stop > start:
+                columns[name] = np.memmap(column_path(self.store_path, name), dtype = dtype, mode = 'r',
+                                          offset = start*np.dtype(dtype).itemsize, shape = (stop - start,))
+            else:
+                columns[name] = np.zeros(0, dtype = dtype)
+
+        return columns
+
+    def query(self, subject = None, trial = None, event = None, leg = None, start_frame = None, stop_frame = None):
+        ''' Events of the selected trials, e.g. all heel contacts of a subject between two frames
+
+        Args:
+            + subject (str): subject label, None for all subjects
+            + trial (str or int): trial label, None for all trials of the subject(s)
+            + event (str): 'hc' or 'to', None for both
+            + leg (str): leg label given at append, None for all legs
+            + start_frame, stop_frame (int): frame range [start_frame, stop_frame), None for open ends
+
+        Returns:
+            + event_table (pd.DataFrame): columns subject, trial, leg, event, frame and value, in
+              the layout of get_gait_event_mocap_batch (event as EVENT_HC / EVENT_TO)
+        '''
+        lo_frame = np.iinfo(np.int32).min if start_frame is None else start_frame
+        hi_frame = np.iinfo(np.int32).max if stop_frame is None else stop_frame
+        events   = list(EVENT_NAMES.keys()) if event is None else [EVENT_CODES[event]]
+
+        parts = []
+        for trial_id in self.trial_ids(subject, trial):
+            entry = self.trials[trial_id]
+            legs  = range(len(entry['legs']))
+            if leg is not None:
+                legs = [entry['legs'].index(leg)] if leg in entry['legs'] else []
+            block = self.read_columns(entry['start'], entry['start'] + entry['count'])
+
+            # block is sorted by (leg, event, frame): binary search on the combined key
+            key = (block['leg'].astype(np.int64)*256 + block['event'])*2**32 + block['frame'].astype(np.int64)
+            for leg_code in legs:
+                for event_code in events:
+                    group = (leg_code*256 + event_code)*2**32
+                    lo    = np.searchsorted(key, group + lo_frame, side = 'left')
+                    hi    = np.searchsorted(key, group + hi_frame, side = 'left')
+                    if hi > lo:
+                        part = {name: np.array(values[lo:hi]) for name, values in block.items()}
+                        part['subject'] = np.full(hi - lo, entry['subject'], dtype = object)
+                        part['trial']   = np.full(hi - lo, entry['trial'], dtype = object)
+                        part['leg']     = np.full(hi - lo, entry['legs'][leg_code], dtype = object)
+                        parts.append(part)
+
+        columns = ['subject', 'trial'] + EVENT_TABLE_COLUMNS[1:]
+        if len(parts) == 0:
+            return pd.DataFrame({name: np.zeros(0, dtype = STORE_COLUMNS[name] if name in EVENT_TABLE_COLUMNS[2:] else object) for name in columns}, columns = columns)
+        table = {name: np.concatenate([part[name] for part in parts]) for name in columns}
+
+        return pd.DataFrame(table, columns = columns)
+
+    def gait_events(self, subject, trial, leg = None):
+        ''' Events of one trial and leg as a gait_events dict (hc/to index and value arrays) '''
+        entry = self.trial_meta(subject, trial)
+        if leg is None:
+            leg = entry['legs'][0]
+        selected = self.query(subject, trial, leg = leg)
+
+        gait_events = {}
+        for event_code, prefix in EVENT_NAMES.items():
+            rows = selected[selected['event'] == event_code]
+            gait_events[prefix + '_index'] = rows['frame'].to_numpy()
+            gait_events[prefix + '_value'] = rows['value'].to_numpy()
+
+        return gait_events
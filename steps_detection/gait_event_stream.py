@@ -0,0 +1,254 @@
+# name: gait_event_stream.py
+# description: online heel-contact / toe-off detection from streamed marker samples,
+#              the events of the offline ge_heel_toe_height and ge_mix up to exact height ties
+
+
+import numpy as np
+from scipy.signal import find_peaks
+
+from gait_event_utils import sacrum_vec_angle_filter
+
+
+# --- Incremental find_peaks(x, height, distance) --- #
+class PeakStream:
+    ''' Incremental version of find_peaks(x, height = height, distance = distance)
+
+    Local maxima are searched on the carried tail + new chunk; only the samples of a plateau
+    that is still rising/flat at the end of the chunk are carried over. The distance rule of
+    find_peaks (keep a peak unless a kept, higher peak lies within distance) is resolved per
+    candidate as soon as no future sample can change it, i.e. once distance samples past it
+    have been seen and its higher neighbours are decided. Equal heights are broken by position
+    (the later peak wins). find_peaks orders equal heights with an unstable argsort over the
+    whole signal, which no incremental rule can reproduce, so where two candidates within
+    distance have exactly the same height (e.g. markers quantized by integer C3D storage) the
+    two may keep different peaks of the tie.
+    '''
+    def __init__(self, height, distance):
+        self.hmin, self.hmax = height
+        self.distance        = int(np.ceil(distance))
+
+        self.tail         = None    # samples carried to the next push
+        self.tail_payload = None
+        self.tail_start   = 0       # global index of tail[0]
+        self.num_samples  = 0
+
+        # candidates in time order: [position, height, payload, kept (None until decided)]
+        self.candidates = []
+        self.next_emit  = 0
+
+    def push(self, x, payload, max_delay = None):
+        ''' Add samples, return the newly confirmed peaks
+
+        Args:
+            + x (np.array): next samples of the detection signal
+            + payload (np.array): per-sample data returned with each peak (first axis = samples)
+            + max_delay (int): decide candidates older than this many samples even if a later
+              sample could still change them, None to wait until the result is exact
+
+        Returns:
+            + peaks (list of (int, float, payload)): confirmed peaks in time order
+        '''
+        if self.tail is None:
+            buffer, buffer_payload = np.asarray(x), np.asarray(payload)
+        else:
+            buffer         = np.concatenate([self.tail, x])
+            buffer_payload = np.concatenate([self.tail_payload, payload])
+        start = self.tail_start
+        if len(buffer) == 0:
+            return []
+
+        peaks, _ = find_peaks(buffer)
+        heights  = buffer[peaks]
+        selected = (self.hmin <= heights) & (heights <= self.hmax)
+        for p in peaks[selected]:
+            self.candidates.append([start + p, buffer[p], buffer_payload[p], None])
+
+        # carry a plateau reached by a rise at the end of the buffer, else only the last sample
+        j = len(buffer) - 1
+        while j > 0 and buffer[j - 1] == buffer[j]:
+            j -= 1
+        resume = j - 1 if (j > 0 and buffer[j - 1] < buffer[j]) else len(buffer) - 1
+
+        self.tail         = buffer[resume:]
+        self.tail_payload = buffer_payload[resume:]
+        self.tail_start   = start + resume
+        self.num_samples  = start + len(buffer)
+
+        # any future peak lies after the carried sample
+        horizon = self.tail_start + 1
+        self._resolve(horizon)
+        if max_delay is not None:
+            self._force(self.num_samples - 1 - max_delay)
+
+        return self._pop_confirmed(horizon)
+
+    def flush(self):
+        ''' End of stream: decide all remaining candidates
+
+        Returns:
+            + peaks (list of (int, float, payload)): confirmed peaks in time order
+        '''
+        horizon = np.inf
+        self._resolve(horizon)
+
+        return self._pop_confirmed(horizon)
+
+    def _higher_neighbours(self, c):
+        return [o for o in self.candidates
+                if o is not c and abs(o[0] - c[0]) < self.distance and (o[1], o[0]) > (c[1], c[0])]
+
+    def _resolve(self, horizon):
+        changed = True
+        while changed:
+            changed = False
+            for c in self.candidates[self.next_emit:]:
+                if c[3] is not None:
+                    continue
+                higher = self._higher_neighbours(c)
+                if any(o[3] is True for o in higher):
+                    c[3]    = False
+                    changed = True
+                elif all(o[3] is False for o in higher) and c[0] + self.distance <= horizon:
+                    c[3]    = True
+                    changed = True
+
+    def _force(self, limit):
+        # greedy find_peaks selection over the known candidates, applied to the overdue ones only
+        undecided = [c for c in self.candidates[self.next_emit:] if c[3] is None]
+        if len(undecided) == 0 or undecided[0][0] > limit:
+            return
+        status = {id(c): c[3] for c in self.candidates}
+        for c in sorted(undecided, key = lambda c: (c[1], c[0]), reverse = True):
+            status[id(c)] = not any(status[id(o)] is True for o in self._higher_neighbours(c))
+        for c in undecided:
+            if c[0] <= limit:
+                c[3] = status[id(c)]
+
+    def _pop_confirmed(self, horizon):
+        confirmed = []
+        while self.next_emit < len(self.candidates) and self.candidates[self.next_emit][3] is not None:
+            c = self.candidates[self.next_emit]
+            if c[3]:
+                confirmed.append((c[0], c[1], c[2]))
+            self.next_emit += 1
+
+        # emitted candidates are only kept while they can still suppress an undecided one
+        if self.next_emit < len(self.candidates):
+            oldest = self.candidates[self.next_emit][0]
+        else:
+            oldest = horizon
+        drop = 0
+        while drop < self.next_emit and self.candidates[drop][0] + self.distance <= oldest:
+            drop += 1
+        del self.candidates[:drop]
+        self.next_emit -= drop
+
+        return confirmed
+
+
+# --- Online gait event detection --- #
+class StreamingGaitEventDetector:
+    ''' Online heel-contact / toe-off detection
+
+    Marker samples are pushed in chunks (dicts of arrays with the marker_traj keys used by the
+    offline method). Only a few samples per signal plus the undecided peaks are buffered. With
+    max_delay = None each event is reported once the find_peaks distance rule is settled (about
+    the minimum peak distance after it), and the events are those of the offline method on the
+    same recording except at exact height ties between candidates closer than the minimum peak
+    distance (see PeakStream), common on quantized markers. With max_delay set, every event is
+    reported within max_delay seconds, which may differ from the offline result where a later,
+    higher peak would have suppressed it.
+
+    Usage:
+        detector = StreamingGaitEventDetector('ge_heel_toe_height', fs = 200, max_delay = 1.0)
+        for marker_chunk in stream:
+            gait_events = detector.push(marker_chunk)
+        gait_events = detector.flush()
+    '''
+    def __init__(self, ge_method = 'ge_heel_toe_height', fs = 100, task = 'walking', max_delay = None):
+        ''' Args:
+            + ge_method (str): 'ge_heel_toe_height' or 'ge_mix'
+            + fs (int): sampling rate
+            + task (str): 'walking' or 'treadmill_walking' (ge_mix only)
+            + max_delay (float): maximum reporting delay in seconds, None to wait until the distance
+              rule is settled (offline events up to height ties)
+        '''
+        if ge_method == 'ge_heel_toe_height':
+            self.streams = {'hc': PeakStream((-1, 0), fs*0.6), 'to': PeakStream((-1, 0), fs*0.6)}
+        elif ge_method == 'ge_mix':
+            if task == 'treadmill_walking':
+                to_height = (0, 1)
+            elif task == 'walking':
+                to_height = (0.05, 0.2)
+            else:
+                raise ValueError('Unsupported task: ' + str(task))
+            self.streams = {'hc': PeakStream((-1, 0), fs*0.5), 'to': PeakStream(to_height, fs*0.5)}
+        else:
+            raise ValueError('Unsupported gait detection method: ' + str(ge_method))
+
+        self.ge_method = ge_method
+        self.task      = task
+        self.max_delay = None if max_delay is None else int(round(max_delay*fs))
+
+        # sacrum vector of the previous peak candidate, per event type
+        self.prev_sacrum_vec = {'hc': None, 'to': None}
+
+    def _signals(self, marker_chunk):
+        signals = {'hc': -1*np.asarray(marker_chunk['heel_marker_y'])}
+        if self.ge_method == 'ge_heel_toe_height':
+            signals['to'] = -1*np.asarray(marker_chunk['toe_marker_y'])
+        elif self.task == 'treadmill_walking':
+            signals['to'] = np.asarray(marker_chunk['sacrum_marker_z']) - np.asarray(marker_chunk['toe_marker_z'])
+        else:
+            signals['to'] = abs(np.asarray(marker_chunk['sacrum_marker_z']) - np.asarray(marker_chunk['toe_marker_z']))
+
+        return signals
+
+    def _sacrum_filter(self, event, peaks):
+        ''' Same consecutive-candidate sacrum-angle rule as the offline methods
+        '''
+        if len(peaks) == 0:
+            return np.array([], dtype = int), np.array([])
+
+        index      = np.array([p[0] for p in peaks], dtype = int)
+        value      = np.array([p[1] for p in peaks])
+        sacrum_vec = np.array([p[2] for p in peaks])
+        if self.prev_sacrum_vec[event] is not None:
+            sacrum_vec = np.concatenate([self.prev_sacrum_vec[event][None, :], sacrum_vec])
+        self.prev_sacrum_vec[event] = sacrum_vec[-1]
+
+        keep = sacrum_vec_angle_filter(sacrum_vec)[len(sacrum_vec) - len(peaks):]
+
+        return index[keep], value[keep]
+
+    def _events(self, peaks):
+        gait_events = {}
+        for event in ('hc', 'to'):
+            gait_events[event + '_index'], gait_events[event + '_value'] = self._sacrum_filter(event, peaks[event])
+
+        return gait_events
+
+    def push(self, marker_chunk):
+        ''' Add the next marker samples
+
+        Args:
+            + marker_chunk (dict of np.array): next samples of heel_marker_y, toe_marker_y or
+              toe_marker_z/sacrum_marker_z, and sacrum_marker1_x/z, sacrum_marker2_x/z
+
+        Returns:
+            + gait_events (dict of np.array): newly confirmed hc/to indices (sample index since the
+              start of the stream) and the detection signal value at each event
+        '''
+        sacrum_vec = np.stack([np.asarray(marker_chunk['sacrum_marker1_x']) - np.asarray(marker_chunk['sacrum_marker2_x']),
+                               np.asarray(marker_chunk['sacrum_marker1_z']) - np.asarray(marker_chunk['sacrum_marker2_z'])], axis = 1)
+        signals    = self._signals(marker_chunk)
+        peaks      = {event: self.streams[event].push(signals[event], sacrum_vec, self.max_delay) for event in self.streams}
+
+        return self._events(peaks)
+
+    def flush(self):
+        ''' End of stream, return the remaining events
+        '''
+        peaks = {event: self.streams[event].flush() for event in self.streams}
+
+        return self._events(peaks)
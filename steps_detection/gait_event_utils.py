@@ -0,0 +1,178 @@
+# name: gait_event_utils.py
+# description: shared helpers for the mocap gait event detectors
+# note: numpy only, so both gait_event_mocap.py and the self-contained
+#       gait_event_mocap_dk.py can import it
+
+
+import numpy as np
+
+
+# --- Filter candidate events by the sacrum heading --- #
+def sacrum_angle_filter(candidate_index, sacrum_marker1_x, sacrum_marker1_z, sacrum_marker2_x, sacrum_marker2_z, angle_thresh = 90, min_norm = None):
+    ''' Keep candidate events whose sacrum heading changed by less than angle_thresh since the previous candidate
+
+    The sacrum vectors (marker1 - marker2 in the x-z plane) are gathered at all candidates at once
+    and the angles between consecutive candidates are computed in one pass. Same keep/drop rule as
+    calling angle_between_vectors() pair by pair: the first candidate is always dropped, and
+    undefined angles (zero-length vectors, NaN gaps) drop the event.
+
+    Args:
+        + candidate_index (np.array): candidate event indices, e.g. from find_peaks
+        + sacrum_marker1_x, sacrum_marker1_z (np.array): trajectory of the first sacrum marker
+        + sacrum_marker2_x, sacrum_marker2_z (np.array): trajectory of the second sacrum marker
+        + angle_thresh (float): keep an event if its angle to the previous candidate is below this (deg)
+        + min_norm (float): if set, pairs whose norm product is below this count as 0 deg (kept)
+
+    Returns:
+        + keep (np.array of bool): mask over candidate_index
+    '''
+    candidate_index = np.asarray(candidate_index, dtype = int)
+    sacrum_vec      = np.stack([np.asarray(sacrum_marker1_x)[candidate_index] - np.asarray(sacrum_marker2_x)[candidate_index],
+                                np.asarray(sacrum_marker1_z)[candidate_index] - np.asarray(sacrum_marker2_z)[candidate_index]], axis = 1)
+
+    return sacrum_vec_angle_filter(sacrum_vec, angle_thresh = angle_thresh, min_norm = min_norm)
+
+
+def sacrum_vec_angle_filter(sacrum_vec, angle_thresh = 90, min_norm = None):
+    ''' Same as sacrum_angle_filter, from the sacrum vectors already gathered at the candidates
+
+    Args:
+        + sacrum_vec (np.array): (num_candidates, 2) sacrum marker1 - marker2 (x, z) at each candidate
+        + angle_thresh (float): keep an event if its angle to the previous candidate is below this (deg)
+        + min_norm (float): if set, pairs whose norm product is below this count as 0 deg (kept)
+
+    Returns:
+        + keep (np.array of bool): mask over the candidates
+    '''
+    sacrum_vec = np.asarray(sacrum_vec).reshape(-1, 2)
+    keep       = np.zeros(len(sacrum_vec), dtype = bool)
+    if len(sacrum_vec) < 2:
+        return keep
+
+    # Stacked (1 x 2) @ (2 x 1) products round exactly like np.dot / np.linalg.norm on each pair,
+    # so vectors that are (near) parallel land on the same side of arccos' domain as before
+    sq_norm = np.matmul(sacrum_vec[:, None, :], sacrum_vec[:, :, None])[:, 0, 0]
+    dot     = np.matmul(sacrum_vec[:-1, None, :], sacrum_vec[1:, :, None])[:, 0, 0]
+    norms   = np.sqrt(sq_norm[:-1])*np.sqrt(sq_norm[1:])
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        angle = np.abs(np.degrees(np.arccos(dot/norms)))
+    if min_norm is not None:
+        angle[norms < min_norm] = 0.0
+
+    keep[1:] = angle < angle_thresh
+
+    return keep
+
+
+# --- Run lengths of a boolean signal --- #
+def run_length_forward(mask):
+    ''' Number of consecutive True samples starting at each sample
+
+    Args:
+        + mask (np.array of bool): e.g. velocity > threshold
+
+    Returns:
+        + run_length (np.array of int): run_length[i] = k if mask[i:i + k] is all True and mask[i + k] is not
+    '''
+    mask  = np.asarray(mask, dtype = bool)
+    index = np.arange(len(mask))
+
+    # first False at or after each sample (len(mask) if none)
+    next_false = np.where(mask, len(mask), index)
+    next_false = np.minimum.accumulate(next_false[::-1])[::-1]
+
+    return next_false - index
+
+
+# --- Align events in time --- #
+def align_events(reference_index, event_index, direction = 'previous', inclusive = False):
+    ''' For each reference index, position of the nearest event before or after it
+
+    One np.searchsorted call over all references, instead of an np.where per reference.
+
+    Args:
+        + reference_index (np.array): sample indices to align, e.g. toe-off indices
+        + event_index (np.array): sorted sample indices of the events to pair with, e.g. heel contacts
+        + direction (str): 'previous' (last event before the reference) or 'next' (first event after it)
+        + inclusive (bool): also accept an event at the reference index itself
+
+    Returns:
+        + position (np.array of int): position in event_index, only valid where found
+        + found (np.array of bool): False if there is no such event
+    '''
+    reference_index = np.asarray(reference_index)
+    event_index     = np.asarray(event_index)
+
+    if direction == 'previous':
+        position = np.searchsorted(event_index, reference_index, side = 'right' if inclusive else 'left') - 1
+        found    = position >= 0
+    elif direction == 'next':
+        position = np.searchsorted(event_index, reference_index, side = 'left' if inclusive else 'right')
+        found    = position < len(event_index)
+    else:
+        raise ValueError('Unsupported direction: ' + str(direction))
+
+    return position, found
+
+
+def first_crossing(reference_index, signal, threshold):
+    ''' For each reference index, first sample at or after it where signal > threshold
+
+    Args:
+        + reference_index (np.array): sample indices to search from
+        + signal (np.array): e.g. marker velocity
+        + threshold (float): crossing level
+
+    Returns:
+        + crossing_index (np.array of int): sample index of the crossing, only valid where found
+        + found (np.array of bool): False if the signal never exceeds threshold after the reference
+    '''
+    crossing        = np.flatnonzero(np.asarray(signal) > threshold)
+    position, found = align_events(reference_index, crossing, direction = 'next', inclusive = True)
+
+    crossing_index        = np.zeros(len(position), dtype = int)
+    crossing_index[found] = crossing[position[found]]
+
+    return crossing_index, found
+
+
+# --- Event table layout --- #
+EVENT_HC = 0
+EVENT_TO = 1
+EVENT_NAMES = {EVENT_HC: 'hc', EVENT_TO: 'to'}
+EVENT_TABLE_COLUMNS = ['trial_id', 'leg', 'event', 'frame', 'value']
+
+
+# --- Flatten one detector output --- #
+def gait_events_to_columns(gait_events, trial_code, leg_code):
+    ''' Flatten a gait_events dict into event table columns
+
+    Args:
+        + gait_events (dict of np.array): output of get_gait_event_mocap
+        + trial_code (int): position of the trial in the batch
+        + leg_code (int): position of the leg in the batch legs
+
+    Returns:
+        + columns (dict of np.array): trial, leg, event, frame and value columns
+    '''
+    frames = []
+    values = []
+    events = []
+    for event_code, prefix in ((EVENT_HC, 'hc'), (EVENT_TO, 'to')):
+        index = np.asarray(gait_events[prefix + '_index'], dtype = np.int32)
+        value = np.asarray(gait_events[prefix + '_value'], dtype = np.float32)
+        if len(value) != len(index):
+            # some methods only return indices
+            value = np.full(len(index), np.nan, dtype = np.float32)
+        frames.append(index)
+        values.append(value)
+        events.append(np.full(len(index), event_code, dtype = np.uint8))
+
+    frames = np.concatenate(frames)
+    columns = {'trial_id': np.full(len(frames), trial_code, dtype = np.int32),
+               'leg': np.full(len(frames), leg_code, dtype = np.int8),
+               'event': np.concatenate(events),
+               'frame': frames,
+               'value': np.concatenate(values)}
+
+    return columns
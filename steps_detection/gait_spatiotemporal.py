@@ -0,0 +1,228 @@
+# name: gait_spatiotemporal.py
+# description: spatiotemporal gait parameters per stride (cadence, stride / step time, stance /
+#              swing, double support, step length) from the detected events of both legs,
+#              for one trial or a whole study event table at once
+
+
+import numpy as np
+import pandas as pd
+
+from gait_event_utils import EVENT_HC, EVENT_TO, EVENT_TABLE_COLUMNS, gait_events_to_columns
+
+
+SPATIOTEMPORAL_COLUMNS = ['trial_id', 'leg', 'hc_frame', 'to_frame', 'next_hc_frame', 'contra_hc_frame', 'contra_to_frame',
+                          'stride_time', 'step_time', 'stance_time', 'swing_time', 'stance_pct', 'swing_pct',
+                          'double_support_time', 'double_support_pct', 'cadence', 'step_length']
+
+SUMMARY_PARAMETERS = ['stride_time', 'step_time', 'stance_time', 'swing_time', 'stance_pct', 'swing_pct',
+                      'double_support_time', 'double_support_pct', 'cadence', 'step_length']
+
+
+# --- Lookups on the sorted event keys --- #
+def next_event(event_key, query_key, limit_key):
+    ''' First event strictly after each query key, if it comes before the limit key
+
+    Keys combine the trial / leg group and the frame (group*span + frame), so one sorted array
+    holds the events of the whole study and a lookup never crosses into another group as long as
+    the limit is in the query's group.
+
+    Args:
+        + event_key (np.array of int): sorted event keys
+        + query_key (np.array of int): keys after which the event is searched
+        + limit_key (np.array of int): exclusive upper bound of the event key
+
+    Returns:
+        + event_frame_key (np.array of int): key of the found event, -1 where none
+        + found (np.array of bool): whether an event exists in (query_key, limit_key)
+    '''
+    position = np.searchsorted(event_key, query_key, side = 'right')
+    found    = position < len(event_key)
+    found[found] = event_key[position[found]] < limit_key[found]
+
+    event_frame_key        = np.full(len(query_key), -1, dtype = np.int64)
+    event_frame_key[found] = event_key[position[found]]
+
+    return event_frame_key, found
+
+
+def category_codes(column):
+    # integer codes and labels of a categorical or plain column
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        return column.cat.codes.to_numpy(dtype = np.int64), list(column.cat.categories)
+    codes, labels = pd.factorize(column, sort = True)
+    return codes.astype(np.int64), list(labels)
+
+
+# --- Strides of a whole event table --- #
+def get_spatiotemporal_parameters(event_table, fs = 100, heel_positions = None, max_stride_time = None):
+    ''' Per-stride spatiotemporal parameters of every trial and leg of an event table
+
+    A stride runs from a heel contact to the next heel contact of the same leg. Within it:
+        - toe-off: first toe-off of the same leg after the heel contact (stance = HC -> TO)
+        - step: heel contact of the same leg -> next heel contact of the other leg
+        - double support: HC -> first toe-off of the other leg, plus the other leg's heel
+          contact -> toe-off of this leg
+        - step length: anterior-posterior distance between both heels at the other leg's heel
+          contact, i.e. the length of the step ending there
+    Parameters whose events are missing from the stride are NaN. All lookups are binary searches
+    on one sorted key array, no per-stride Python loop.
+
+    Args:
+        + event_table (pd.DataFrame): columns trial_id, leg, event, frame (output of
+          get_gait_event_mocap_batch), two legs per trial
+        + fs (int or list of int): sampling rate, shared or per trial (order of the trial_id categories)
+        + heel_positions (list of np.array): per trial, (frames, 2) anterior-posterior heel positions
+          of both legs (order of the leg categories, see heel_positions_from_mocap); None to skip
+          step length
+        + max_stride_time (float): strides longer than this (s) are dropped, e.g. missed heel
+          contacts or turns; None to keep all
+
+    Returns:
+        + strides (pd.DataFrame): one row per stride, SPATIOTEMPORAL_COLUMNS. Times in s,
+          percentages of the stride time, cadence in steps/min, step length in the heel units
+    '''
+    trial_code, trial_labels = category_codes(event_table['trial_id'])
+    leg_code, leg_labels     = category_codes(event_table['leg'])
+    if len(leg_labels) != 2:
+        raise ValueError('The event table must contain exactly two legs.')
+
+    frame = event_table['frame'].to_numpy(dtype = np.int64)
+    event = event_table['event'].to_numpy()
+    fs    = np.broadcast_to(np.asarray(fs, dtype = float), (len(trial_labels),))
+
+    # one sorted key array per event type: (trial, leg) group, then frame
+    span      = int(frame.max()) + 2 if len(frame) else 1
+    group     = trial_code*2 + leg_code
+    key       = group*span + frame
+    hc_key    = np.sort(key[event == EVENT_HC])
+    to_key    = np.sort(key[event == EVENT_TO])
+
+    # strides: consecutive heel contacts of the same group
+    hc_group  = hc_key//span
+    same      = hc_group[1:] == hc_group[:-1]
+    start_key = hc_key[:-1][same]
+    stop_key  = hc_key[1:][same]
+
+    stride_group = start_key//span
+    stride_trial = stride_group//2
+    stride_leg   = stride_group % 2
+    contra_shift = (1 - 2*stride_leg)*span          # same frame in the other leg's group
+
+    to_key_stride, has_to               = next_event(to_key, start_key, stop_key)
+    contra_hc_key, has_contra_hc        = next_event(hc_key, start_key + contra_shift, stop_key + contra_shift)
+    contra_to_key, has_contra_to        = next_event(to_key, start_key + contra_shift, stop_key + contra_shift)
+
+    start     = (start_key % span).astype(float)
+    stop      = (stop_key % span).astype(float)
+    to        = np.where(has_to, to_key_stride % span, np.nan)
+    contra_hc = np.where(has_contra_hc, contra_hc_key % span, np.nan)
+    contra_to = np.where(has_contra_to, contra_to_key % span, np.nan)
+
+    # double support needs the other leg's toe-off before its heel contact and this leg's
+    # toe-off after it
+    contra_to[has_contra_hc & has_contra_to & (contra_to > contra_hc)] = np.nan
+    terminal  = to - contra_hc
+    terminal[terminal < 0] = np.nan
+
+    stride_fs   = fs[stride_trial]
+    stride_time = (stop - start)/stride_fs
+    stance_time = (to - start)/stride_fs
+    swing_time  = (stop - to)/stride_fs
+    double_time = (contra_to - start + terminal)/stride_fs
+
+    strides = {'trial_id': np.asarray(trial_labels, dtype = object)[stride_trial] if len(trial_labels) else np.array([], dtype = object),
+               'leg': np.asarray(leg_labels, dtype = object)[stride_leg],
+               'hc_frame': start,
+               'to_frame': to,
+               'next_hc_frame': stop,
+               'contra_hc_frame': contra_hc,
+               'contra_to_frame': contra_to,
+               'stride_time': stride_time,
+               'step_time': (contra_hc - start)/stride_fs,
+               'stance_time': stance_time,
+               'swing_time': swing_time,
+               'stance_pct': 100*stance_time/stride_time,
+               'swing_pct': 100*swing_time/stride_time,
+               'double_support_time': double_time,
+               'double_support_pct': 100*double_time/stride_time,
+               'cadence': 120.0/stride_time,
+               'step_length': np.full(len(start), np.nan)}
+
+    if heel_positions is not None:
+        # flat heel array of all trials and legs, offset of each (trial, leg) group
+        heel_flat   = np.concatenate([np.asarray(h, dtype = float).T.ravel() for h in heel_positions])
+        num_frames  = np.array([len(h) for h in heel_positions])
+        offset      = np.concatenate([[0], np.cumsum(np.repeat(num_frames, 2))[:-1]])
+        at          = np.where(has_contra_hc, contra_hc, 0).astype(np.int64)
+        inside      = has_contra_hc & (at < num_frames[stride_trial])
+        at[~inside] = 0
+        heel_ipsi   = heel_flat[offset[stride_group] + at]
+        heel_contra = heel_flat[offset[stride_group + (1 - 2*stride_leg)] + at]
+        strides['step_length'] = np.where(inside, np.abs(heel_contra - heel_ipsi), np.nan)
+
+    strides = pd.DataFrame(strides, columns = SPATIOTEMPORAL_COLUMNS)
+    for column in ('hc_frame', 'next_hc_frame'):
+        strides[column] = strides[column].astype(np.int64)
+
+    if max_stride_time is not None:
+        strides = strides[strides['stride_time'] <= max_stride_time].reset_index(drop = True)
+
+    return strides
+
+
+# --- One trial from the per-call dicts --- #
+def get_spatiotemporal_parameters_trial(gait_events_legs, fs = 100, heel_positions = None, max_stride_time = None):
+    ''' Per-stride spatiotemporal parameters of one trial
+
+    Args:
+        + gait_events_legs (dict): leg label -> gait_events dict of get_gait_event_mocap, two legs
+        + fs (int): sampling rate
+        + heel_positions (np.array): (frames, 2) anterior-posterior heel positions, legs in the
+          order of gait_events_legs; None to skip step length
+        + max_stride_time (float): strides longer than this (s) are dropped
+
+    Returns:
+        + strides (pd.DataFrame): see get_spatiotemporal_parameters
+    '''
+    legs    = list(gait_events_legs.keys())
+    columns = [gait_events_to_columns(gait_events_legs[leg], 0, leg_code) for leg_code, leg in enumerate(legs)]
+    table   = {name: np.concatenate([c[name] for c in columns]) for name in EVENT_TABLE_COLUMNS}
+
+    table['trial_id'] = pd.Categorical.from_codes(table['trial_id'], categories = [0])
+    table['leg']      = pd.Categorical.from_codes(table['leg'], categories = legs)
+    event_table       = pd.DataFrame(table, columns = EVENT_TABLE_COLUMNS)
+
+    return get_spatiotemporal_parameters(event_table, fs, None if heel_positions is None else [heel_positions], max_stride_time)
+
+
+def heel_positions_from_mocap(trials, legs = ('r', 'l'), axis = 'Z'):
+    ''' Anterior-posterior heel positions of both legs, as taken by get_spatiotemporal_parameters
+
+    Args:
+        + trials (list of pd.DataFrame): synchronized mocap data per trial (same as get_gait_event_mocap_batch)
+        + legs (tuple of str): the two legs, in the order of the event table leg categories
+        + axis (str): anterior-posterior axis of the heel (CAL) marker
+
+    Returns:
+        + heel_positions (list of np.array): per trial, (frames, 2)
+    '''
+    return [np.stack([s_mocap_data[leg.upper() + 'CAL ' + axis].to_numpy(dtype = float) for leg in legs], axis = 1)
+            for s_mocap_data in trials]
+
+
+# --- Averages --- #
+def summarize_spatiotemporal(strides, by = ('trial_id', 'leg')):
+    ''' Mean and SD of the stride parameters per trial and leg (or any grouping)
+
+    Args:
+        + strides (pd.DataFrame): output of get_spatiotemporal_parameters
+        + by (tuple of str): grouping columns
+
+    Returns:
+        + summary (pd.DataFrame): one row per group, columns (parameter, 'mean' / 'std') and num_strides
+    '''
+    grouped = strides.groupby(list(by), observed = True)
+    summary = grouped[SUMMARY_PARAMETERS].agg(['mean', 'std'])
+    summary['num_strides'] = grouped.size()
+
+    return summary
@@ -0,0 +1,115 @@
+# name: gait_synth.py
+# description: synthetic marker trajectories of one leg with known heel-contact / toe-off
+#              events, for benchmarks and accuracy checks of the gait event methods
+# note: numpy only, axes follow get_marker_traj (y vertical, z anterior-posterior, x lateral)
+
+
+import numpy as np
+
+
+# --- Smooth periodic profiles --- #
+def bump(phase, start, peak, stop):
+    ''' Raised-cosine bump over the gait cycle: 0 at start, 1 at peak, 0 at stop, 0 elsewhere
+
+    Args:
+        + phase (np.array): gait cycle phase in [0, 1), 0 = heel contact
+        + start, peak, stop (float): phases of the bump, may wrap around 1
+
+    Returns:
+        + value (np.array): bump value at each phase
+    '''
+    p     = (phase - start) % 1.0
+    rise  = (peak - start) % 1.0
+    total = (stop - start) % 1.0
+
+    value = np.zeros(len(p))
+    up    = p < rise
+    down  = (p >= rise) & (p < total)
+    value[up]   = (1 - np.cos(np.pi*p[up]/rise))/2
+    value[down] = (1 + np.cos(np.pi*(p[down] - rise)/(total - rise)))/2
+
+    return value
+
+
+# --- Synthetic walking trial --- #
+def synthesize_gait(duration = 60, fs = 100, cadence = 110, speed = 1.1, stance = 0.6, variability = 0.02,
+                    noise = 0.001, dropout_rate = 0.0, dropout_frames = 10, treadmill = False, seed = 0):
+    ''' Marker trajectories of one leg walking straight, with the true gait events
+
+    Heel height has its minimum at heel contact, toe height at toe-off. In the sagittal plane the
+    foot moves back relative to the sacrum during stance and forward during swing, so the heel is
+    furthest ahead at heel contact and the toe furthest behind at toe-off, as assumed by
+    ge_heel_toe_height, ge_mix and ge_heel_toe_sacrum.
+
+    Args:
+        + duration (float): trial length (s)
+        + fs (int): sampling rate
+        + cadence (float): steps per minute
+        + speed (float): walking speed (m/s)
+        + stance (float): stance phase as a fraction of the gait cycle
+        + variability (float): coefficient of variation of the stride time
+        + noise (float): std of the white noise added to every coordinate (m)
+        + dropout_rate (float): fraction of frames lost per marker, in gaps of dropout_frames (NaN)
+        + dropout_frames (int): length of each gap (frames)
+        + treadmill (bool): keep the sacrum in place instead of moving forward
+        + seed (int): random seed
+
+    Returns:
+        + marker_traj (dict of np.array): heel/toe height and position, sacrum markers, as in get_marker_traj
+        + truth (dict of np.array): hc_index and to_index of the true events
+    '''
+    rng        = np.random.default_rng(seed)
+    num_sample = int(round(duration*fs))
+    t          = np.arange(num_sample)/fs
+
+    # stride times and the gait cycle phase of each sample
+    stride_mean = 2*60.0/cadence
+    num_stride  = int(np.ceil(duration/(stride_mean*0.5))) + 2
+    stride_time = stride_mean*np.clip(1 + variability*rng.standard_normal(num_stride), 0.5, 1.5)
+    stride_hc   = np.concatenate([[0.0], np.cumsum(stride_time)]) - stride_mean*rng.uniform()
+    stride_id   = np.searchsorted(stride_hc, t, side = 'right') - 1
+    phase       = (t - stride_hc[stride_id])/stride_time[stride_id]
+
+    # vertical: heel lowest at heel contact, toe lowest at toe-off
+    heel_y = 0.02 + 0.008*bump(phase, 0.0, 0.2, 0.5) + 0.22*bump(phase, stance - 0.2, stance + 0.15, 1.0)
+    toe_y  = 0.02 + 0.06*bump(phase, stance, stance + 0.2, 0.98) + 0.025*bump(phase, 0.9, 0.02, stance)
+
+    # anterior-posterior, relative to the sacrum
+    excursion   = speed*stride_mean*stance
+    heel_ahead  = 0.55*excursion
+    foot_length = 0.15
+    swing       = np.clip((phase - stance)/(1 - stance), 0, 1)
+    heel_rel    = np.where(phase < stance,
+                           heel_ahead - excursion*phase/stance,
+                           heel_ahead - excursion + excursion*(1 - np.cos(np.pi*swing))/2)
+
+    sacrum_z = np.zeros(num_sample) if treadmill else speed*t
+    heel_z   = sacrum_z + heel_rel
+    toe_z    = heel_z + foot_length
+
+    marker_traj = {'heel_marker_y': heel_y,
+                   'toe_marker_y': toe_y,
+                   'heel_marker_z': heel_z,
+                   'toe_marker_z': toe_z,
+                   'sacrum_marker_z': sacrum_z.copy(),
+                   'sacrum_marker1_x': np.full(num_sample, 0.05),
+                   'sacrum_marker1_z': sacrum_z.copy(),
+                   'sacrum_marker2_x': np.full(num_sample, -0.05),
+                   'sacrum_marker2_z': sacrum_z.copy()}
+
+    for key in marker_traj:
+        marker_traj[key] = marker_traj[key] + noise*rng.standard_normal(num_sample)
+
+        if dropout_rate > 0:
+            num_gap   = int(dropout_rate*num_sample/dropout_frames)
+            gap_start = rng.integers(0, max(num_sample - dropout_frames, 1), num_gap)
+            gap       = (gap_start[:, None] + np.arange(dropout_frames)[None, :]).ravel()
+            marker_traj[key][gap[gap < num_sample]] = np.nan
+
+    # true events, rounded to the nearest frame inside the trial
+    hc_index = np.round(stride_hc[:-1]*fs).astype(int)
+    to_index = np.round((stride_hc[:-1] + stance*stride_time)*fs).astype(int)
+    truth    = {'hc_index': hc_index[(hc_index >= 0) & (hc_index < num_sample)],
+                'to_index': to_index[(to_index >= 0) & (to_index < num_sample)]}
+
+    return marker_traj, truth
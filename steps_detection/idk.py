@@ -4,7 +4,7 @@
 Loads your B3D trial,
 Builds a Pandas DataFrame from select marker columns,
 Calls our new self-contained angle-based event detection function,
-Saves a single gait cycle (heel-contact → toe-off) to JSON (or you can adapt as needed).
+Appends all heel contacts / toe-offs of the trial to the event store read by idk2.py.
 python
 Copy code
 
@@ -18,15 +18,27 @@ Script A: Extract gait events using angle-based filtering, and save event frames
 1) Load a B3D file (Nimble) to get marker data.
 2) Convert relevant markers into a Pandas DataFrame (just for ease of manipulation).
 3) Run angle-based detection (heel + toe + sacrum vectors).
-4) Save the chosen step(s) to a JSON.
+4) Append the events to the gait event store (gait_event_store.py).
 """
 
 import numpy as np
 import pandas as pd
-import json
 import nimblephysics as nimble
+import os, sys
 
 from gait_event_mocap_dk import detect_heel_toe_with_angle
+from gait_event_store import GaitEventStore
+
+# B3D reader lives in scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from b3d_reader import read_b3d_markers_cached
+
+EVENT_STORE_PATH = "event_store"
+
+# detection method and parameters, recorded with the trial in the store: a trial stored with
+# other settings is detected again and superseded, one stored with the same settings is kept
+GE_METHOD = "heel_toe_angle"
+GE_PARAMS = {"min_time_between_events": 0.6, "angle_thresh_deg": 90}
 
 def main():
     # ----------------------------------------------------------------
@@ -44,15 +56,6 @@ def main():
     fs = int(round(1.0 / timestep_sec))
     print(f"Trial {trial_index} => {num_frames} frames at {fs} Hz (dt={timestep_sec:.4f}s)")
 
-    # Read frames to get marker data
-    frames = subject_on_disk.readFrames(
-        trial=trial_index,
-        startFrame=0,
-        numFramesToRead=num_frames,
-        includeSensorData=True,
-        includeProcessingPasses=False
-    )
-
     # ----------------------------------------------------------------
     # 2. BUILD A PANDAS DATAFRAME WITH MARKER COLUMNS
     #    (We'll collect: heel_y, toe_y, sacrum_marker1_x, sacrum_marker1_z, sacrum_marker2_x, sacrum_marker2_z)
@@ -65,57 +68,21 @@ def main():
     #
     # Let's assume your B3D has marker names "LeftCAL", "LeftTOE", "Sacrum1", "Sacrum2".
     # You will need to adapt these to match whatever is in your dataset.
-    marker_map = {
-        "LeftCAL": "heel",
-        "LeftTOE": "toe",
-        # We'll pretend we have "Sacrum1" and "Sacrum2" for that angle logic
-        "Sacrum1": "sacrum1",
-        "Sacrum2": "sacrum2"
-    }
-
-    # Set up columns for the DataFrame
-    df_dict = {
-        "heel_marker_y": [],
-        "toe_marker_y": [],
-        "sacrum_marker1_x": [],
-        "sacrum_marker1_z": [],
-        "sacrum_marker2_x": [],
-        "sacrum_marker2_z": []
-    }
-
-    for frame in frames:
-        marker_dict = {m_name: m_pos for (m_name, m_pos) in frame.markerObservations}
-
-        # Fill each column. If missing, set to np.nan
-        # HEEL => Y
-        if "LeftCAL" in marker_dict:
-            df_dict["heel_marker_y"].append(marker_dict["LeftCAL"][1])
-        else:
-            df_dict["heel_marker_y"].append(np.nan)
-
-        # TOE => Y
-        if "LeftTOE" in marker_dict:
-            df_dict["toe_marker_y"].append(marker_dict["LeftTOE"][1])
-        else:
-            df_dict["toe_marker_y"].append(np.nan)
-
-        # Sacrum1 => X,Z
-        if "Sacrum1" in marker_dict:
-            df_dict["sacrum_marker1_x"].append(marker_dict["Sacrum1"][0])
-            df_dict["sacrum_marker1_z"].append(marker_dict["Sacrum1"][2])
-        else:
-            df_dict["sacrum_marker1_x"].append(np.nan)
-            df_dict["sacrum_marker1_z"].append(np.nan)
-
-        # Sacrum2 => X,Z
-        if "Sacrum2" in marker_dict:
-            df_dict["sacrum_marker2_x"].append(marker_dict["Sacrum2"][0])
-            df_dict["sacrum_marker2_z"].append(marker_dict["Sacrum2"][2])
-        else:
-            df_dict["sacrum_marker2_x"].append(np.nan)
-            df_dict["sacrum_marker2_z"].append(np.nan)
-
-    df_mocap = pd.DataFrame(df_dict)
+    marker_names = ["LeftCAL", "LeftTOE", "Sacrum1", "Sacrum2"]
+
+    # Frames are read in chunks and only these markers are written into one
+    # (frames x markers x 3) array; markers missing in a frame stay NaN.
+    # The result is cached on disk, so re-runs on the same file skip readFrames.
+    markers, _ = read_b3d_markers_cached(b3d_path, trial_index, marker_names)
+
+    df_mocap = pd.DataFrame({
+        "heel_marker_y": markers[:, 0, 1],
+        "toe_marker_y": markers[:, 1, 1],
+        "sacrum_marker1_x": markers[:, 2, 0],
+        "sacrum_marker1_z": markers[:, 2, 2],
+        "sacrum_marker2_x": markers[:, 3, 0],
+        "sacrum_marker2_z": markers[:, 3, 2]
+    })
 
     # ----------------------------------------------------------------
     # 3. DETECT EVENTS USING ANGLE-BASED FUNCTION
@@ -128,9 +95,8 @@ def main():
         df_mocap["sacrum_marker2_x"].values,
         df_mocap["sacrum_marker2_z"].values,
         fs=fs,
-        min_time_between_events=0.6,
-        angle_thresh_deg=90,
-        print_debug=True
+        print_debug=True,
+        **GE_PARAMS
     )
 
     hc_indices = events["hc_index"]
@@ -152,20 +118,27 @@ def main():
 
     print(f"Chosen cycle: frames {first_hc} -> {first_to}")
 
-    # Save results to JSON for use in a follow-up script
-    output_data = {
-        "b3d_path": b3d_path,
-        "trial_index": trial_index,
-        "fs": fs,
-        "hc_first": int(first_hc),
-        "to_first": int(first_to)
-    }
-
-    out_json = "event_detection_results.json"
-    with open(out_json, "w") as f:
-        json.dump(output_data, f, indent=2)
-
-    print(f"\nSaved event detection results to '{out_json}'\nDone.")
+    # Append all events of the trial to the event store; idk2.py reads them back
+    # together with fs / timestep_sec, instead of a single cycle in a JSON file
+    store = GaitEventStore(EVENT_STORE_PATH)
+    subject = os.path.splitext(os.path.basename(b3d_path))[0]
+    stored = store.trial_ids(subject, trial_index)
+    if stored:
+        meta = store.trials[stored[0]]
+        if meta.get("ge_method") == GE_METHOD and meta.get("ge_params") == GE_PARAMS:
+            print(f"Trial {trial_index} of {subject} is already in '{EVENT_STORE_PATH}' with the same method and parameters. Exiting.")
+            return
+        print(f"Trial {trial_index} of {subject} was stored with other settings, replacing it.")
+    store.append(subject, trial_index, events, fs,
+                 overwrite=True,
+                 ge_method=GE_METHOD,
+                 ge_params=GE_PARAMS,
+                 b3d_path=b3d_path,
+                 trial_index=trial_index,
+                 timestep_sec=timestep_sec,
+                 num_frames=num_frames)
+
+    print(f"\nSaved {len(hc_indices)} HC / {len(to_indices)} TO of {subject} trial {trial_index} to '{EVENT_STORE_PATH}'\nDone.")
 
 if __name__ == "__main__":
     main()
@@ -2,7 +2,7 @@
 Goal:
 
 Load the same B3D file,
-Read the JSON results from Script A to know which frames define a single gait cycle,
+Read the events stored by Script A (gait event store) to pick the frames of a single gait cycle,
 For each frame in that cycle, set the Nimble skeleton, read hip rotation, knee flexion, ankle rotation,
 Plot the angles.
 
@@ -12,26 +12,49 @@ loading those frame indices + Nimble skeleton + plotting angles.
 
 #!/usr/bin/env python
 
-import json
 import numpy as np
 import matplotlib.pyplot as plt
 import nimblephysics as nimble
+import os, sys
+
+# B3D reader lives in scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from b3d_reader import read_b3d_joint_angles
+
+from gait_event_store import GaitEventStore
+
+EVENT_STORE_PATH = "event_store"   # written by idk.py
 
 def main():
     # -----------------------------------------------------
-    # 1. LOAD JSON RESULTS FROM SCRIPT A
+    # 1. LOAD EVENTS FROM SCRIPT A
     # -----------------------------------------------------
-    with open("event_detection_results.json", 'r') as f:
-        results = json.load(f)
+    # Last trial appended by idk.py; its metadata holds the b3d path, fs and timestep
+    store = GaitEventStore(EVENT_STORE_PATH)
+    if len(store.trials) == 0:
+        print(f"No trials in '{EVENT_STORE_PATH}', run idk.py first. Exiting.")
+        return
+    results = store.trials[-1]
+    subject = results["subject"]
     b3d_path = results["b3d_path"]
     trial_index = results["trial_index"]
-    hc_first = results["hc_first"]
-    to_first = results["to_first"]
     fs = results["fs"]
     timestep_sec = results["timestep_sec"]
     print("Loaded event detection results:")
     print(results)
 
+    # First heel contact and the first toe-off after it
+    hc = store.query(subject, trial_index, event="hc")
+    if len(hc) == 0:
+        print("No heel contact stored. Exiting.")
+        return
+    hc_first = int(hc["frame"].iloc[0])
+    to = store.query(subject, trial_index, event="to", start_frame=hc_first + 1)
+    if len(to) == 0:
+        print("No toe-off after first HC. Exiting.")
+        return
+    to_first = int(to["frame"].iloc[0])
+
     # -----------------------------------------------------
     # 2. RE-LOAD THE B3D FILE & GET SKELETON
     # -----------------------------------------------------
@@ -39,62 +62,29 @@ def main():
     PROCESSING_PASS = 0  # same pass used in Script A (often "kinematics")
     skeleton = subject_on_disk.readSkel(processingPass=PROCESSING_PASS, ignoreGeometry=True)
 
-    # Load frames for the same trial
     num_frames = subject_on_disk.getTrialLength(trial_index)
-    frames = subject_on_disk.readFrames(
-        trial=trial_index,
-        startFrame=0,
-        numFramesToRead=num_frames,
-        includeSensorData=False,
-        includeProcessingPasses=True
-    )
-
     print(f"Trial {trial_index} has {num_frames} frames. We'll plot frames {hc_first} -> {to_first}.")
 
     # -----------------------------------------------------
     # 3. EXTRACT ANGLES (HIP ROT, KNEE FLEX, ANKLE ROT)
     # -----------------------------------------------------
-    # We'll store time & angle arrays
-    time_vals = []
-    hip_rot_vals = []
-    knee_flex_vals = []
-    ankle_rot_vals = []
-
     # Suppose your model has:
     #  - "hip_left" with 3 coordinates: 
     #       index 2 -> internal/external rotation
     #  - "knee_left" with 1 coordinate (index 0) -> flexion
     #  - "ankle_left" with 1 coordinate (index 0) -> plantar/dorsiflex
-    hip_joint = skeleton.getJoint("hip_left")
-    knee_joint = skeleton.getJoint("knee_left")
-    ankle_joint = skeleton.getJoint("ankle_left")
-
-    for f_idx in range(hc_first, to_first + 1):
-        if f_idx >= len(frames):
-            break
-        
-        frame_data = frames[f_idx]
-        pass_data = frame_data.processingPasses[PROCESSING_PASS]
-        skeleton.setPositions(pass_data.pos)
-
-        # Time relative to HC
-        rel_time_sec = (f_idx - hc_first) * timestep_sec
-        time_vals.append(rel_time_sec)
-
-        # Hip rotation in degrees
-        hip_rot_rad = hip_joint.getCoordinate(2).getValue(skeleton)  # might need to confirm index
-        hip_rot_deg = np.degrees(hip_rot_rad)
-        hip_rot_vals.append(hip_rot_deg)
-
-        # Knee flexion in degrees
-        knee_flex_rad = knee_joint.getCoordinate(0).getValue(skeleton)
-        knee_flex_deg = np.degrees(knee_flex_rad)
-        knee_flex_vals.append(knee_flex_deg)
-
-        # Ankle rotation in degrees
-        ankle_rot_rad = ankle_joint.getCoordinate(0).getValue(skeleton)
-        ankle_rot_deg = np.degrees(ankle_rot_rad)
-        ankle_rot_vals.append(ankle_rot_deg)
+    # Coordinates are DOFs of the skeleton: their columns are resolved once and sliced
+    # out of the stacked pass positions of the cycle, no setPositions per frame
+    joint_coordinates = [("hip_left", 2), ("knee_left", 0), ("ankle_left", 0)]
+    angles_rad = read_b3d_joint_angles(subject_on_disk, trial_index, joint_coordinates,
+                                       processing_pass=PROCESSING_PASS,
+                                       start_frame=hc_first,
+                                       num_frames=to_first - hc_first + 1,
+                                       skeleton=skeleton)
+    hip_rot_vals, knee_flex_vals, ankle_rot_vals = np.degrees(angles_rad).T
+
+    # Time relative to HC
+    time_vals = np.arange(len(angles_rad)) * timestep_sec
 
     # -----------------------------------------------------
     # 4. PLOT THE ANGLES
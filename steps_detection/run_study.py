@@ -0,0 +1,390 @@
+#!/usr/bin/env python
+
+'''
+Whole-study gait event detection.
+
+Discovers every .c3d / .b3d / .mat file under a root directory, runs event detection
+on both legs of each trial in a process pool and writes one merged events CSV.
+
+  - C3D files: heel/toe (or MT2) markers of each leg and two pelvis markers from
+    C3D_MARKER_MAP, get_gait_event_mocap() with the heel/toe height method if the
+    legs have toe markers, otherwise the mix method (same choice as scripts/read_c3d.py).
+  - B3D files: every trial, markers from B3D_MARKER_MAP, detect_heel_toe_with_angle()
+    (same as idk.py).
+  - MAT files: every subject/condition/stiffness leaf with a markers struct (see
+    mat2c3d.m), markers from conversions/mat2marker_traj.MAT_MARKER_MAP read straight
+    from the MAT file, same method choice as C3D files. Trials are numbered in the
+    sorted order of the leaf paths.
+
+A leg without a heel and a toe / MT2 marker is left out; a trial without two distinct
+pelvis markers fails (the sacrum heading filter would drop every event). The CSV has
+the columns of gait_event_batch's event table (trial_id '<file>:<trial>', leg 'r' / 'l',
+event EVENT_HC / EVENT_TO, frame, value) after file and trial, so it can be passed to
+gait_spatiotemporal.get_spatiotemporal_parameters.
+
+Each finished file is appended to <output>.partial and recorded in <output>.ckpt
+with the size of the partial CSV after it, so a crashed run restarted with --resume
+cuts the partial CSV back to the last recorded file and skips the files already done.
+The C3D/B3D/MAT backends are imported inside the workers, so a C3D-only study does
+not need nimblephysics installed.
+
+usage:
+    python run_study.py /data/study --output study_events.csv --workers 8
+    python run_study.py /data/study --output study_events.csv --workers 8 --resume
+'''
+
+import os
+import sys
+import json
+import argparse
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+from tqdm import tqdm
+
+from gait_event_utils import EVENT_TABLE_COLUMNS, gait_events_to_columns
+
+# C3D/B3D readers live next to read_c3d.py, the MAT adapter in conversions/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'conversions'))
+
+
+STUDY_EXTENSIONS    = ('.c3d', '.b3d', '.mat')
+STUDY_LEGS          = ('r', 'l')
+STUDY_EVENT_COLUMNS = ['file', 'trial'] + EVENT_TABLE_COLUMNS
+
+# Candidate marker names per leg and for the pelvis (see scripts/read_c3d.py and
+# mat2marker_traj.resolve_leg_markers): the first one present and not used by an
+# earlier role is taken, so sacrum1/sacrum2 are always two different markers.
+# Unprefixed single-leg names (Heel, Toe, MT2) are the left leg.
+C3D_MARKER_MAP = {'pelvis': {'sacrum1': ['RPS2', 'RPSI', 'Sacrum1', 'Sacrum'],
+                             'sacrum2': ['LPS2', 'LPSI', 'Sacrum2', 'Sacrum']},
+                  'r': {'heel': ['RCAL', 'RHEE'],
+                        'toe': ['RTOE'],
+                        'mt2': ['RMT2']},
+                  'l': {'heel': ['Heel', 'LCAL', 'LHEE'],
+                        'toe': ['Toe', 'LTOE'],
+                        'mt2': ['MT2', 'LMT2']}}
+
+# B3D marker names used for the angle-based method (see idk.py)
+B3D_MARKER_MAP = {'pelvis': {'sacrum1': ['Sacrum1'],
+                             'sacrum2': ['Sacrum2']},
+                  'r': {'heel': ['RightCAL'],
+                        'toe': ['RightTOE']},
+                  'l': {'heel': ['LeftCAL'],
+                        'toe': ['LeftTOE']}}
+
+
+# --- Discover the study files --- #
+def find_study_files(root):
+    ''' List all C3D/B3D/MAT files under root, sorted so that runs are reproducible
+
+    Args:
+        + root (str): study root directory
+
+    Returns:
+        + file_paths (list of str): absolute file paths
+    '''
+    file_paths = []
+    for dir_path, _, file_names in os.walk(root):
+        for file_name in file_names:
+            if file_name.lower().endswith(STUDY_EXTENSIONS):
+                file_paths.append(os.path.abspath(os.path.join(dir_path, file_name)))
+    file_paths.sort()
+
+    return file_paths
+
+
+# --- Per-format trial loading and detection --- #
+def marker_map_names(marker_map):
+    ''' All candidate marker names of a marker map, in map order
+    '''
+    names = []
+    for roles in marker_map.values():
+        for candidates in roles.values():
+            names.extend(name for name in candidates if name not in names)
+
+    return names
+
+def detect_mocap_legs(marker_traj_legs, task, has_toe_marker, fs):
+    ''' get_gait_event_mocap() on every leg, the legs sharing the sacrum heading
+
+    Returns:
+        + gait_events_legs (dict): leg -> gait_events
+    '''
+    from gait_event_mocap import GaitFeatures, get_gait_event_mocap
+    from utils.mocap import constants_mocap
+
+    if has_toe_marker:
+        ge_method = constants_mocap.GE_METHOD_HEEL_TOE_HEIGHT
+    else:
+        ge_method = constants_mocap.GE_METHOD_MIX
+
+    gait_events_legs = {}
+    trial_features   = None
+    for leg, marker_traj in marker_traj_legs.items():
+        features               = GaitFeatures(marker_traj, fs, shared = trial_features)
+        trial_features         = features if trial_features is None else trial_features
+        gait_events_legs[leg]  = get_gait_event_mocap(marker_traj, task, ge_method, fs = fs, features = features)
+
+    return gait_events_legs
+
+def load_c3d_marker_traj(file_path):
+    ''' Read the markers of a C3D file into one marker_traj dict per leg
+
+    Returns:
+        + marker_traj_legs (dict): leg -> marker trajectories for gait event detection
+        + frame_rate (float): sampling rate
+        + has_toe_marker (bool): True if the heel/toe height method can be used
+    '''
+    from c3d_reader import read_c3d_markers_cached
+    from mat2marker_traj import resolve_leg_markers, build_marker_traj_legs
+
+    # decoded once, memory-mapped from the marker cache on later runs
+    markers, marker_names, frame_rate = read_c3d_markers_cached(file_path)
+    leg_markers, pelvis, has_toe_marker = resolve_leg_markers(marker_names, C3D_MARKER_MAP, STUDY_LEGS,
+                                                              source = os.path.basename(file_path))
+    marker_traj_legs = build_marker_traj_legs(lambda name: markers[:, marker_names.index(name)],
+                                              leg_markers, pelvis, has_toe_marker)
+
+    return marker_traj_legs, frame_rate, has_toe_marker
+
+def detect_c3d(file_path, task):
+    ''' Gait events of both legs of the single trial in a C3D file
+
+    Returns:
+        + trial_events (list of (int, dict)): trial index and leg -> gait_events
+    '''
+    marker_traj_legs, frame_rate, has_toe_marker = load_c3d_marker_traj(file_path)
+
+    return [(0, detect_mocap_legs(marker_traj_legs, task, has_toe_marker, frame_rate))]
+
+def detect_mat(file_path, task):
+    ''' Gait events of both legs of every trial leaf in a MAT file, without a C3D export
+
+    Returns:
+        + trial_events (list of (int, dict)): trial index (sorted leaf order) and leg -> gait_events
+    '''
+    from mat2marker_traj import iter_mat_marker_traj
+
+    trial_events = []
+    for trial_index, (_, marker_traj_legs, frame_rate, has_toe_marker) in enumerate(iter_mat_marker_traj(file_path, legs = STUDY_LEGS)):
+        trial_events.append((trial_index, detect_mocap_legs(marker_traj_legs, task, has_toe_marker, frame_rate)))
+
+    return trial_events
+
+def load_b3d_marker_traj(file_path, trial_index):
+    ''' Read the B3D markers of one trial used by detect_heel_toe_with_angle(), per leg
+
+    Returns:
+        + marker_traj_legs (dict): leg -> heel_y, toe_y and sacrum x/z trajectories
+        + fs (int): sampling rate
+    '''
+    from b3d_reader import read_b3d_markers_cached
+    from mat2marker_traj import resolve_leg_markers, build_marker_traj_legs
+
+    # chunked, column-selective read of every candidate; markers never observed are all NaN
+    marker_names = marker_map_names(B3D_MARKER_MAP)
+    markers, fs  = read_b3d_markers_cached(file_path, trial_index, marker_names)
+    observed     = [name for i, name in enumerate(marker_names) if np.isfinite(markers[:, i]).any()]
+
+    leg_markers, pelvis, has_toe_marker = resolve_leg_markers(observed, B3D_MARKER_MAP, STUDY_LEGS,
+                                                              source = f"{os.path.basename(file_path)} trial {trial_index}")
+    marker_traj_legs = build_marker_traj_legs(lambda name: markers[:, marker_names.index(name)],
+                                              leg_markers, pelvis, has_toe_marker)
+
+    return marker_traj_legs, fs
+
+def detect_b3d(file_path):
+    ''' Gait events of both legs of every trial in a B3D file
+
+    Returns:
+        + trial_events (list of (int, dict)): trial index and leg -> gait_events
+    '''
+    import nimblephysics as nimble
+    from gait_event_mocap_dk import detect_heel_toe_with_angle
+
+    subject_on_disk = nimble.biomechanics.SubjectOnDisk(file_path)
+
+    trial_events = []
+    for trial_index in range(subject_on_disk.getNumTrials()):
+        marker_traj_legs, fs = load_b3d_marker_traj(file_path, trial_index)
+        gait_events_legs     = {}
+        for leg, marker_traj in marker_traj_legs.items():
+            gait_events_legs[leg] = detect_heel_toe_with_angle(marker_traj['heel_marker_y'],
+                                                               marker_traj['toe_marker_y'],
+                                                               marker_traj['sacrum_marker1_x'],
+                                                               marker_traj['sacrum_marker1_z'],
+                                                               marker_traj['sacrum_marker2_x'],
+                                                               marker_traj['sacrum_marker2_z'],
+                                                               fs = fs)
+        trial_events.append((trial_index, gait_events_legs))
+
+    return trial_events
+
+
+# --- Worker --- #
+def process_file(file_path, root, task):
+    ''' Detect the events of all trials in one file (runs in a worker process)
+
+    Returns:
+        + result (dict): file, worker pid, event table (None on failure) and error message
+    '''
+    result = {'file': os.path.relpath(file_path, root), 'pid': os.getpid(), 'events': None, 'error': None}
+    try:
+        if file_path.lower().endswith('.c3d'):
+            trial_events = detect_c3d(file_path, task)
+        elif file_path.lower().endswith('.mat'):
+            trial_events = detect_mat(file_path, task)
+        else:
+            trial_events = detect_b3d(file_path)
+
+        # same columns and encoding as get_gait_event_mocap_batch, sorted by trial, leg and frame
+        columns = [gait_events_to_columns(gait_events, trial_index, STUDY_LEGS.index(leg))
+                   for trial_index, gait_events_legs in trial_events
+                   for leg, gait_events in gait_events_legs.items()]
+        if len(columns) == 0:
+            columns = [gait_events_to_columns({'hc_index': [], 'hc_value': [], 'to_index': [], 'to_value': []}, 0, 0)]
+        table = {name: np.concatenate([c[name] for c in columns]) for name in EVENT_TABLE_COLUMNS}
+        order = np.lexsort((table['event'], table['frame'], table['leg'], table['trial_id']))
+        table = {name: values[order] for name, values in table.items()}
+
+        result['events'] = pd.DataFrame({'file': result['file'],
+                                         'trial': table['trial_id'],
+                                         'trial_id': [f"{result['file']}:{t}" for t in table['trial_id']],
+                                         'leg': np.asarray(STUDY_LEGS)[table['leg']],
+                                         'event': table['event'],
+                                         'frame': table['frame'],
+                                         'value': table['value']}, columns = STUDY_EVENT_COLUMNS)
+    except Exception:
+        result['error'] = traceback.format_exc()
+
+    return result
+
+
+# --- Checkpointing --- #
+def read_checkpoint(checkpoint_path):
+    ''' Files already finished by a previous run
+
+    Returns:
+        + done (set of str): relative paths of finished files
+        + partial_size (int): size of the partial CSV after the last finished file, 0 if none
+    '''
+    done         = set()
+    partial_size = 0
+    if os.path.exists(checkpoint_path):
+        with open(checkpoint_path, 'r') as f:
+            for line in f:
+                # a line cut by a crash has no newline, its file is not done
+                if not line.endswith('\n'):
+                    break
+                line = line.strip()
+                if line:
+                    entry        = json.loads(line)
+                    partial_size = entry['partial_size']
+                    done.add(entry['file'])
+
+    return done, partial_size
+
+def append_result(result, partial_path, checkpoint_path):
+    ''' Append the events of one file, then mark the file as done
+
+    The events are flushed before the checkpoint line is written, and the line records the
+    partial CSV size after them: rows appended by a crashed run after its last checkpoint line
+    are cut off on --resume, so a file re-run there is not written twice.
+    '''
+    write_header = not os.path.exists(partial_path) or os.path.getsize(partial_path) == 0
+    with open(partial_path, 'a', newline = '') as f:
+        result['events'].to_csv(f, header = write_header, index = False)
+        f.flush()
+        os.fsync(f.fileno())
+        partial_size = f.tell()
+
+    with open(checkpoint_path, 'a') as f:
+        f.write(json.dumps({'file': result['file'], 'num_events': len(result['events']),
+                            'partial_size': partial_size}) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+# --- Study driver --- #
+def run_study(root, output_path, task = 'walking', workers = None, resume = False):
+    ''' Detect gait events for every C3D/B3D/MAT file under root and merge them into one CSV
+
+    Args:
+        + root (str): study root directory
+        + output_path (str): merged events CSV
+        + task (str): 'walking' or 'treadmill_walking' (C3D files)
+        + workers (int): number of worker processes, None for all cores
+        + resume (boolean): skip the files recorded in the checkpoint of a previous run, and drop
+          partial rows written after its last checkpoint line
+
+    Returns:
+        + failed (list of str): files that raised an error
+    '''
+    partial_path    = output_path + '.partial'
+    checkpoint_path = output_path + '.ckpt'
+
+    if not resume:
+        for path in (partial_path, checkpoint_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+    file_paths         = find_study_files(root)
+    done, partial_size = read_checkpoint(checkpoint_path)
+    if os.path.exists(checkpoint_path):
+        # drop a checkpoint line cut by a crash, the next one is appended after it
+        with open(checkpoint_path, 'r+b') as f:
+            f.truncate(f.read().rfind(b'\n') + 1)
+    if os.path.exists(partial_path) and os.path.getsize(partial_path) > partial_size:
+        # rows of files that were appended but not checkpointed
+        with open(partial_path, 'r+b') as f:
+            f.truncate(partial_size)
+    todo       = [p for p in file_paths if os.path.relpath(p, root) not in done]
+    print(f"Found {len(file_paths)} files under {root}, {len(done)} already done, {len(todo)} to process.")
+
+    failed = []
+    with ProcessPoolExecutor(max_workers = workers) as executor:
+        futures = [executor.submit(process_file, p, root, task) for p in todo]
+        with tqdm(total = len(futures), unit = 'file') as progress:
+            for future in as_completed(futures):
+                result = future.result()
+                if result['error'] is None:
+                    append_result(result, partial_path, checkpoint_path)
+                    tqdm.write(f"[worker {result['pid']}] {result['file']}: {len(result['events'])} events")
+                else:
+                    failed.append(result['file'])
+                    tqdm.write(f"[worker {result['pid']}] {result['file']}: FAILED\n{result['error']}")
+                progress.update(1)
+
+    if len(failed) > 0:
+        print(f"{len(failed)} files failed, rerun with --resume to retry them. Partial results in '{partial_path}'.")
+        return failed
+
+    if os.path.exists(partial_path):
+        os.replace(partial_path, output_path)
+    else:
+        pd.DataFrame(columns = STUDY_EVENT_COLUMNS).to_csv(output_path, index = False)
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    print(f"Saved events of {len(file_paths)} files to '{output_path}'.")
+
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description = 'Detect gait events for every C3D/B3D/MAT file of a study.')
+    parser.add_argument('root', help = 'study root directory')
+    parser.add_argument('--output', default = 'study_events.csv', help = 'merged events CSV')
+    parser.add_argument('--task', default = 'walking', choices = ['walking', 'treadmill_walking'])
+    parser.add_argument('--workers', type = int, default = None, help = 'worker processes (default: all cores)')
+    parser.add_argument('--resume', action = 'store_true', help = 'skip files finished by a previous run')
+    args = parser.parse_args()
+
+    failed = run_study(args.root, args.output, task = args.task, workers = args.workers, resume = args.resume)
+    sys.exit(1 if len(failed) > 0 else 0)
+
+if __name__ == "__main__":
+    main()
@@ -46,6 +46,11 @@
 
 
 import nimblephysics as nimble
+import os, sys
+
+# B3D reader lives in scripts/
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from b3d_reader import iter_b3d_frames
 
 subject = nimble.biomechanics.SubjectOnDisk("/home/dkuan/Documents/research/gaitfm/data/gait01.c3d")
 
@@ -53,21 +58,15 @@ skeleton = subject.readSkel(processingPass=0, ignoreGeometry=True)
 trial_index = 0
 num_frames = subject.getTrialLength(trial_index)
 
-frames = subject.readFrames(
-    trial=trial_index,
-    startFrame=0,
-    numFramesToRead=num_frames,
-    includeSensorData=True,
-    includeProcessingPasses=True
-)
-
-print(f"Loaded {len(frames)} frames. Attempting to set skeleton positions...")
-
-for i, frame in enumerate(frames):
-    # pick pass 0 or 1
-    pass_data = frame.processingPasses[0]
-    skeleton.setPositions(pass_data.pos)
-    if i % 50 == 0:
-        print(f"Frame {i} setPositions OK")
+print(f"Trial has {num_frames} frames. Attempting to set skeleton positions...")
+
+# frames are read window by window instead of the whole trial at once
+for window_start, frames in iter_b3d_frames(subject, trial_index, include_sensor_data=True):
+    for i, frame in enumerate(frames, start=window_start):
+        # pick pass 0 or 1
+        pass_data = frame.processingPasses[0]
+        skeleton.setPositions(pass_data.pos)
+        if i % 50 == 0:
+            print(f"Frame {i} setPositions OK")
 
 print("No segfault => likely GUI or geometry issue.")